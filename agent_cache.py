@@ -0,0 +1,156 @@
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Callable
+import asyncio
+import time
+
+
+class _CacheEntry:
+    """An agent plus the bookkeeping needed for LRU/TTL eviction."""
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.last_used = time.monotonic()
+        self.in_use = 0
+        self.evicted = False
+
+
+class AgentCache:
+    """
+    Bounded cache of initialized agents keyed by model name.
+
+    - Agents are initialized once: concurrent callers share the agent's
+      single-flight `initialize()`.
+    - At most `max_size` agents are kept (least recently used evicted first),
+      and agents idle for more than `ttl` seconds are evicted.
+    - Evicted agents have their MCP sessions closed as soon as the last
+      in-flight request using them completes.
+    """
+
+    def __init__(self, factory: Callable, max_size: int = 4, ttl: float = 3600.0):
+        """
+        Args:
+            factory: Callable building a new (uninitialized) agent for a model name
+            max_size: Maximum number of cached agents
+            ttl: Idle time in seconds after which an agent is evicted (0 disables)
+        """
+        self.factory = factory
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, _CacheEntry] = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, model: str) -> bool:
+        return model in self._entries
+
+    def _evict(self, model: str) -> list:
+        entry = self._entries.pop(model)
+        entry.evicted = True
+        self.evictions += 1
+        return [entry] if entry.in_use == 0 else []
+
+    def _collect_evictions(self) -> list:
+        """Drop expired and overflowing entries; return those that can be closed now."""
+        to_close = []
+        if self.ttl > 0:
+            now = time.monotonic()
+            for model in [m for m, e in self._entries.items()
+                          if e.in_use == 0 and now - e.last_used > self.ttl]:
+                to_close += self._evict(model)
+        while len(self._entries) > self.max_size:
+            to_close += self._evict(next(iter(self._entries)))
+        return to_close
+
+    @staticmethod
+    async def _close(entries: list):
+        for entry in entries:
+            try:
+                await entry.agent.close()
+            except Exception as e:
+                print(f"Error closing agent for {entry.agent.model}: {str(e)}")
+
+    async def _checkout(self, model: str) -> _CacheEntry:
+        async with self._lock:
+            entry = self._entries.get(model)
+            if entry is None:
+                self.misses += 1
+                entry = _CacheEntry(self.factory(model))
+                self._entries[model] = entry
+            else:
+                self.hits += 1
+                self._entries.move_to_end(model)
+            entry.in_use += 1
+            entry.last_used = time.monotonic()
+            to_close = self._collect_evictions()
+        await self._close(to_close)
+        return entry
+
+    async def _checkin(self, entry: _CacheEntry):
+        entry.in_use -= 1
+        entry.last_used = time.monotonic()
+        if entry.evicted and entry.in_use == 0:
+            await self._close([entry])
+
+    @asynccontextmanager
+    async def lease(self, model: str):
+        """
+        Borrow the initialized agent for a model for the duration of a request.
+
+        Args:
+            model: The model name to get or create an agent for
+
+        Yields:
+            An initialized agent
+        """
+        entry = await self._checkout(model)
+        try:
+            yield await entry.agent.initialize()
+        finally:
+            await self._checkin(entry)
+
+    async def warm_up(self, models: list[str]):
+        """
+        Initialize agents for the given models ahead of the first request.
+
+        Args:
+            models: Model names to warm up (failures are reported, not raised)
+        """
+        async def warm(model: str):
+            try:
+                async with self.lease(model):
+                    print(f"Agent for {model} is warm")
+            except Exception as e:
+                print(f"Warm-up failed for {model}: {str(e)}")
+
+        await asyncio.gather(*[warm(model) for model in models])
+
+    async def sweep(self):
+        """Evict agents idle for longer than the TTL."""
+        async with self._lock:
+            to_close = self._collect_evictions()
+        await self._close(to_close)
+
+    async def close(self):
+        """Close every cached agent (used on shutdown)."""
+        async with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.evicted = True
+        await self._close(entries)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "models": list(self._entries),
+        }
@@ -0,0 +1,414 @@
+# ------------------------------------------------------------
+# Cache de réponses (exact + sémantique) pour les questions répétées
+# ------------------------------------------------------------
+
+# Types de messages LangChain (détection des appels d'outils en écriture)
+from langchain_core.messages import AIMessage
+
+# Librairies standards
+from collections import OrderedDict
+import asyncio
+import json
+import math
+import os
+import re
+import sqlite3
+import time
+
+# Chargement des variables d’environnement (.env)
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# ------------------------------------------------------------
+# Configuration
+# ------------------------------------------------------------
+
+# Backend : "memory", "sqlite" ou "none" (désactivé)
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "memory")
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "answer_cache.sqlite3")
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+# Recherche sémantique optionnelle (embeddings Ollama locaux, ex: nomic-embed-text)
+ANSWER_CACHE_EMBEDDING_MODEL = os.getenv("ANSWER_CACHE_EMBEDDING_MODEL", "")
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+# Embeddings des dernières questions, réutilisés entre `get` (échec) et `set`
+ANSWER_CACHE_EMBEDDING_SLOTS = 256
+
+
+# ------------------------------------------------------------
+# Normalisation des questions et détection des écritures
+# ------------------------------------------------------------
+
+# Clauses Cypher qui modifient le graphe
+_WRITE_CYPHER_PATTERN = re.compile(
+    r"\b(CREATE|MERGE|DELETE|DETACH|SET|REMOVE|DROP|LOAD\s+CSV)\b|\bapoc\.(create|merge|refactor|periodic)",
+    re.IGNORECASE
+)
+
+# Outils MCP qui modifient le graphe (neo4j-cypher et mémoire)
+_WRITE_TOOL_PATTERN = re.compile(r"^(write_|create_|add_|delete_|update_|remove_)")
+
+# Questions formulées comme des demandes de modification
+_WRITE_REQUEST_PATTERN = re.compile(
+    r"^\s*(please\s+)?(create|add|insert|delete|remove|update|set|merge|rename|drop|connect|link)\b",
+    re.IGNORECASE
+)
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalise une question : minuscules, espaces compactés,
+    ponctuation finale supprimée.
+    """
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?!.")
+
+
+def is_write_query(query: str) -> bool:
+    """
+    Indique si une requête Cypher contient une clause d'écriture.
+    """
+    return bool(_WRITE_CYPHER_PATTERN.search(query or ""))
+
+
+def is_write_tool_call(tool_name: str, args: dict | None = None) -> bool:
+    """
+    Indique si un appel d'outil MCP modifie (potentiellement) le graphe.
+    """
+    if _WRITE_TOOL_PATTERN.match(tool_name):
+        return True
+    query = (args or {}).get("query")
+    return isinstance(query, str) and is_write_query(query)
+
+
+def looks_like_write_request(question: str) -> bool:
+    """
+    Indique si la question demande une modification du graphe.
+    """
+    return bool(_WRITE_REQUEST_PATTERN.match(question))
+
+
+def has_write_tool_calls(agent_response) -> bool:
+    """
+    Indique si l'agent a appelé un outil en écriture pendant la requête.
+    """
+    messages = agent_response.get("messages", []) if isinstance(agent_response, dict) else []
+    return any(
+        is_write_tool_call(call["name"], call.get("args"))
+        for message in messages if isinstance(message, AIMessage)
+        for call in message.tool_calls
+    )
+
+
+def cosine_similarity(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+# ------------------------------------------------------------
+# Backends de stockage
+# ------------------------------------------------------------
+
+class InMemoryBackend:
+    """
+    Stockage en mémoire, ordonné du moins au plus récemment utilisé.
+    Chaque entrée : {"model", "variant", "answer", "raw", "embedding", "created_at"}.
+    """
+
+    # Accès sans E/S : appelé directement depuis la boucle d'événements
+    blocking = False
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._generation = 0
+
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: str) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: dict, generation: int | None = None) -> bool:
+        if generation is not None and generation != self._generation:
+            return False
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        return True
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def items(self, model: str, variant: str = ""):
+        return [(k, e) for k, e in self._entries.items()
+                if e["model"] == model and e["variant"] == variant]
+
+    def evict(self, max_entries: int, ttl: float):
+        now = time.time()
+        for key in [k for k, e in self._entries.items() if now - e["created_at"] > ttl]:
+            del self._entries[key]
+        while len(self._entries) > max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def invalidate(self):
+        self._generation += 1
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """
+    Stockage SQLite (persistant et partageable entre workers).
+    L'ordre LRU est suivi par la colonne `last_used`. La génération
+    d'écriture est stockée dans la table `meta` : une écriture vue par un
+    worker invalide aussi les réponses en cours des autres workers.
+    """
+
+    _COLUMNS = "model, variant, answer, raw, embedding, created_at"
+
+    # Requêtes synchrones : les parcours sont exécutés hors de la boucle d'événements
+    blocking = True
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, model TEXT, answer TEXT, raw TEXT, "
+            "embedding TEXT, created_at REAL, last_used REAL, variant TEXT)"
+        )
+        # Base créée par une version précédente (clé sans variante) : entrées obsolètes
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(answers)")]
+        if "variant" not in columns:
+            self.conn.execute("DELETE FROM answers")
+            self.conn.execute("ALTER TABLE answers ADD COLUMN variant TEXT")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        self.conn.execute("INSERT OR IGNORE INTO meta VALUES ('generation', 0)")
+        self.conn.commit()
+
+    @staticmethod
+    def _row_to_entry(row) -> dict:
+        model, variant, answer, raw, embedding, created_at = row
+        return {
+            "model": model,
+            "variant": variant,
+            "answer": answer,
+            "raw": raw,
+            "embedding": json.loads(embedding) if embedding else None,
+            "created_at": created_at,
+        }
+
+    def generation(self) -> int:
+        return self.conn.execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()[0]
+
+    def get(self, key: str) -> dict | None:
+        row = self.conn.execute(
+            f"SELECT {self._COLUMNS} FROM answers WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self.conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.conn.commit()
+        return self._row_to_entry(row)
+
+    def set(self, key: str, entry: dict, generation: int | None = None) -> bool:
+        # Insertion conditionnée à la génération partagée, en une instruction
+        # (pas de fenêtre entre la vérification et l'écriture)
+        cursor = self.conn.execute(
+            f"INSERT OR REPLACE INTO answers (key, {self._COLUMNS}, last_used) "
+            "SELECT ?, ?, ?, ?, ?, ?, ?, ? FROM meta "
+            "WHERE name = 'generation' AND (? IS NULL OR value = ?)",
+            (key, entry["model"], entry["variant"], entry["answer"], entry["raw"],
+             json.dumps(entry["embedding"]) if entry["embedding"] else None,
+             entry["created_at"], time.time(), generation, generation)
+        )
+        self.conn.commit()
+        return cursor.rowcount > 0
+
+    def delete(self, key: str):
+        self.conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+        self.conn.commit()
+
+    def items(self, model: str, variant: str = ""):
+        rows = self.conn.execute(
+            f"SELECT key, {self._COLUMNS} FROM answers WHERE model = ? AND variant = ?", (model, variant)
+        ).fetchall()
+        return [(row[0], self._row_to_entry(row[1:])) for row in rows]
+
+    def evict(self, max_entries: int, ttl: float):
+        self.conn.execute("DELETE FROM answers WHERE created_at < ?", (time.time() - ttl,))
+        self.conn.execute(
+            "DELETE FROM answers WHERE key NOT IN "
+            "(SELECT key FROM answers ORDER BY last_used DESC LIMIT ?)", (max_entries,)
+        )
+        self.conn.commit()
+
+    def clear(self):
+        self.conn.execute("DELETE FROM answers")
+        self.conn.commit()
+
+    def invalidate(self):
+        with self.conn:
+            self.conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'generation'")
+            self.conn.execute("DELETE FROM answers")
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+
+# ------------------------------------------------------------
+# Cache de réponses
+# ------------------------------------------------------------
+
+class AnswerCache:
+    """
+    Cache de réponses placé devant `MultiToolAgent.run_request`.
+
+    Clé : (modèle, variante, question normalisée). La variante regroupe
+    les options qui changent la réponse (mode d'interprétation, routage :
+    voir `MultiToolAgent.cache_variant`). Si un modèle d'embeddings est
+    configuré, les paraphrases sont retrouvées par similarité cosinus.
+    Toute écriture dans le graphe vide le cache ; un compteur de
+    génération, tenu par le backend (partagé entre workers en SQLite),
+    empêche une requête lancée avant l'écriture d'y réinsérer une
+    réponse périmée.
+    """
+
+    def __init__(self, backend=None, ttl: float = ANSWER_CACHE_TTL,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 embeddings=None, similarity_threshold: float = ANSWER_CACHE_SIMILARITY):
+        self.backend = backend if backend is not None else InMemoryBackend()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self._embedded = OrderedDict()
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        return self.backend.generation()
+
+    @staticmethod
+    def _key(question: str, model: str, variant: str = "") -> str:
+        return f"{model}\x1f{variant}\x1f{normalize_question(question)}"
+
+    async def _embed(self, question: str) -> list[float] | None:
+        """
+        Embedding de la question normalisée. Les derniers sont conservés :
+        la requête qui a manqué le cache ne refait pas l'appel dans `set`.
+        """
+        if self.embeddings is None:
+            return None
+        normalized = normalize_question(question)
+        if normalized in self._embedded:
+            self._embedded.move_to_end(normalized)
+            return self._embedded[normalized]
+        try:
+            embedding = await self.embeddings.aembed_query(normalized)
+        except Exception as e:
+            print(f"Embedding indisponible pour le cache : {e}")
+            return None
+        self._embedded[normalized] = embedding
+        if len(self._embedded) > ANSWER_CACHE_EMBEDDING_SLOTS:
+            self._embedded.popitem(last=False)
+        return embedding
+
+    def _fresh(self, entry: dict | None) -> bool:
+        return entry is not None and time.time() - entry["created_at"] <= self.ttl
+
+    async def get(self, question: str, model: str, variant: str = "") -> dict | None:
+        """
+        Retourne la réponse en cache (exacte ou sémantique) ou None.
+        """
+        key = self._key(question, model, variant)
+        entry = self.backend.get(key)
+        if self._fresh(entry):
+            self.hits["exact"] += 1
+            return {**entry, "cache": "exact"}
+
+        embedding = await self._embed(question)
+        if embedding is not None:
+            best, best_score = None, self.similarity_threshold
+            if self.backend.blocking:
+                candidates = await asyncio.to_thread(self.backend.items, model, variant)
+            else:
+                candidates = self.backend.items(model, variant)
+            for _, candidate in candidates:
+                if not self._fresh(candidate) or not candidate["embedding"]:
+                    continue
+                score = cosine_similarity(embedding, candidate["embedding"])
+                if score >= best_score:
+                    best, best_score = candidate, score
+            if best is not None:
+                self.hits["semantic"] += 1
+                return {**best, "cache": "semantic", "similarity": round(best_score, 4)}
+
+        self.misses += 1
+        return None
+
+    async def set(self, question: str, model: str, result: dict, generation: int | None = None,
+                  variant: str = ""):
+        """
+        Enregistre une réponse, sauf si le graphe a été modifié entre-temps
+        (génération différente) ou si la question demande une écriture.
+        """
+        if generation is not None and generation != self.generation:
+            return
+        if looks_like_write_request(question):
+            return
+        embedding = await self._embed(question)
+        stored = self.backend.set(self._key(question, model, variant), {
+            "model": model,
+            "variant": variant,
+            "answer": str(result.get("answer", "")),
+            "raw": str(result.get("raw", "")),
+            "embedding": embedding,
+            "created_at": time.time(),
+        }, generation)
+        if stored:
+            self.backend.evict(self.max_entries, self.ttl)
+
+    def invalidate(self):
+        """
+        Vide le cache après une écriture dans le graphe.
+        """
+        self.invalidations += 1
+        self.backend.invalidate()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.backend),
+            "hits_exact": self.hits["exact"],
+            "hits_semantic": self.hits["semantic"],
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+def answer_cache_from_env() -> AnswerCache | None:
+    """
+    Construit le cache de réponses selon les variables d'environnement
+    (None si ANSWER_CACHE_BACKEND=none).
+    """
+    if ANSWER_CACHE_BACKEND == "none":
+        return None
+    backend = SQLiteBackend(ANSWER_CACHE_PATH) if ANSWER_CACHE_BACKEND == "sqlite" else InMemoryBackend()
+    embeddings = None
+    if ANSWER_CACHE_EMBEDDING_MODEL:
+        from langchain_ollama import OllamaEmbeddings
+        embeddings = OllamaEmbeddings(model=ANSWER_CACHE_EMBEDDING_MODEL)
+    return AnswerCache(backend, embeddings=embeddings)
@@ -0,0 +1,128 @@
+"""
+MCP transport benchmark: stdio subprocesses per agent vs shared streamable-HTTP servers.
+
+For each transport, `--agents` session pools are opened (one per simulated
+agent, as with several uvicorn workers or models), then the read Cypher tool
+is called sequentially and concurrently. Reported: pool startup time, server
+processes needed, and per-call latency (mean, p50, p95).
+
+The HTTP servers are started for the run unless they already listen
+(python mcp_http_servers.py).
+
+Example (no Neo4j needed):
+    OFFLINE_MODE=true python benchmark_mcp_transport.py --agents 4 --calls 200
+"""
+from main_multi import MCP_STDIO_SERVER_CONFIGS
+from mcp_http_servers import http_server_configs, server_port, start_servers, stop_servers, MCP_HTTP_HOST
+from mcp_pool import MCPSessionPool, close_http_connections
+import argparse
+import asyncio
+import socket
+import statistics
+import time
+
+SERVER = "neo4j-cypher"
+TOOL = "read_neo4j_cypher"
+QUERY = "MATCH (n) RETURN count(n) AS c"
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def is_listening(port: int) -> bool:
+    try:
+        with socket.create_connection((MCP_HTTP_HOST, port), timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+
+async def timed_call(pool, latencies: list[float]):
+    start = time.perf_counter()
+    result = await pool.call_tool(TOOL, {"query": QUERY})
+    if getattr(result, "isError", False):
+        raise RuntimeError(f"{TOOL} failed: {result.content}")
+    latencies.append(time.perf_counter() - start)
+
+
+async def run_transport(transport: str, configs: dict, args) -> dict:
+    start = time.perf_counter()
+    pools = [MCPSessionPool(configs, health_check_interval=0, lazy=False) for _ in range(args.agents)]
+    try:
+        await asyncio.gather(*[pool.start() for pool in pools])
+        startup = time.perf_counter() - start
+        servers = [pool.servers[SERVER] for pool in pools]
+
+        # Warm-up: first call per session (connection setup)
+        await asyncio.gather(*[timed_call(server, []) for server in servers])
+
+        sequential = []
+        for i in range(args.calls):
+            await timed_call(servers[i % len(servers)], sequential)
+
+        concurrent = []
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def limited(i):
+            async with semaphore:
+                await timed_call(servers[i % len(servers)], concurrent)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[limited(i) for i in range(args.calls)])
+        elapsed = time.perf_counter() - start
+    finally:
+        await asyncio.gather(*[pool.close() for pool in pools])
+        await close_http_connections()
+
+    return {
+        "transport": transport,
+        "startup": startup,
+        # Shared HTTP servers run once; stdio servers once per agent
+        "processes": sum(1 if "url" in config else args.agents for config in configs.values()),
+        "seq_mean": statistics.mean(sequential),
+        "seq_p50": percentile(sequential, 0.50),
+        "seq_p95": percentile(sequential, 0.95),
+        "conc_p50": percentile(concurrent, 0.50),
+        "conc_p95": percentile(concurrent, 0.95),
+        "throughput": args.calls / elapsed,
+    }
+
+
+def print_results(results: list[dict]):
+    print(f"\n{'transport':<10}{'startup':>10}{'procs':>7}{'seq mean':>11}{'seq p50':>10}"
+          f"{'seq p95':>10}{'conc p50':>11}{'conc p95':>11}{'calls/s':>10}")
+    for r in results:
+        print(f"{r['transport']:<10}{r['startup']:>9.2f}s{r['processes']:>7}"
+              f"{r['seq_mean'] * 1000:>9.2f}ms{r['seq_p50'] * 1000:>8.2f}ms{r['seq_p95'] * 1000:>8.2f}ms"
+              f"{r['conc_p50'] * 1000:>9.2f}ms{r['conc_p95'] * 1000:>9.2f}ms{r['throughput']:>10.1f}")
+
+
+async def main(args):
+    transports = args.transports.split(",")
+    results = []
+    if "stdio" in transports:
+        print(f"Running stdio ({args.agents} agent(s))...")
+        results.append(await run_transport("stdio", MCP_STDIO_SERVER_CONFIGS, args))
+    if "http" in transports:
+        # Servers already running (shared deployment) are reused as is
+        configs = http_server_configs(MCP_STDIO_SERVER_CONFIGS)
+        missing = [name for name, config in configs.items()
+                   if "url" in config and not is_listening(server_port(name))]
+        processes = start_servers(missing) if missing else {}
+        try:
+            print(f"Running http ({args.agents} agent(s))...")
+            results.append(await run_transport("http", configs, args))
+        finally:
+            stop_servers(processes)
+    print_results(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare stdio and streamable-HTTP MCP call latency")
+    parser.add_argument("--agents", type=int, default=2, help="Session pools opened per transport")
+    parser.add_argument("--calls", type=int, default=100, help="Tool calls per phase")
+    parser.add_argument("--concurrency", type=int, default=8, help="Calls in flight in the concurrent phase")
+    parser.add_argument("--transports", default="stdio,http", help="Comma-separated transports to run")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,129 @@
+"""
+Startup benchmark: time until the agent is ready to answer, in a fresh process.
+
+Each scenario runs in its own interpreter so import costs are measured cold:
+  - eager:      every MCP server launched and listed at startup
+  - lazy-cold:  lazy launch, no tool manifest yet (first run after an upgrade)
+  - lazy-warm:  lazy launch with the tool manifest from a previous start
+
+Example (no Ollama / Neo4j needed):
+    OFFLINE_MODE=true python benchmark_startup.py --runs 3 --target 1.0
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = {
+    "eager": {"MCP_LAZY_START": "false", "warm": False},
+    "lazy-cold": {"MCP_LAZY_START": "true", "warm": False},
+    "lazy-warm": {"MCP_LAZY_START": "true", "warm": True},
+}
+
+QUESTION = "How many nodes are in the graph?"
+
+
+async def measure(model: str, question: str | None) -> dict:
+    """
+    Runs inside the child process: import, initialize, optional first request.
+    """
+    started = time.perf_counter()
+    from main_multi import MultiToolAgent, MCP_SERVER_CONFIGS
+    imported = time.perf_counter()
+    agent = MultiToolAgent(model, MCP_SERVER_CONFIGS)
+    try:
+        await agent.initialize()
+        ready = time.perf_counter()
+        timings = {
+            "import": imported - started,
+            "initialize": ready - imported,
+            "ready": ready - started,
+            "servers_started": sum(pool.started for pool in agent.pool.servers.values()),
+            "manifest_hits": agent.pool.manifest_hits,
+        }
+        if question:
+            await agent.run_request(question)
+            timings["first_request"] = time.perf_counter() - ready
+        return timings
+    finally:
+        await agent.close()
+
+
+def run_child(scenario: str, manifest_dir: str, args) -> dict:
+    env = {
+        **os.environ,
+        "MCP_LAZY_START": SCENARIOS[scenario]["MCP_LAZY_START"],
+        "MCP_TOOL_MANIFEST_DIR": manifest_dir,
+    }
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--model", args.model]
+    if args.skip_request:
+        command.append("--skip-request")
+    output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+    # The last line is the JSON result; the agent may print before it
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_scenario(scenario: str, args) -> list[dict]:
+    results = []
+    for _ in range(args.runs):
+        manifest_dir = tempfile.mkdtemp(prefix="mcp_manifests_")
+        try:
+            if SCENARIOS[scenario]["warm"]:
+                # A first start writes the manifest that the measured start reuses
+                run_child(scenario, manifest_dir, args)
+            results.append(run_child(scenario, manifest_dir, args))
+        finally:
+            shutil.rmtree(manifest_dir, ignore_errors=True)
+    return results
+
+
+def print_results(all_results: dict):
+    keys = ["import", "initialize", "ready", "first_request"]
+    print(f"\n{'scenario':<12}" + "".join(f"{key:>15}" for key in keys) + f"{'servers':>10}")
+    for scenario, results in all_results.items():
+        cells = []
+        for key in keys:
+            values = [r[key] for r in results if key in r]
+            cells.append(f"{statistics.median(values):>14.3f}s" if values else f"{'-':>15}")
+        servers = max(r["servers_started"] for r in results)
+        print(f"{scenario:<12}" + "".join(cells) + f"{servers:>10}")
+
+
+def main(args) -> int:
+    scenarios = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    all_results = {}
+    for scenario in scenarios:
+        print(f"Running {scenario} ({args.runs} run(s))...")
+        all_results[scenario] = run_scenario(scenario, args)
+    print_results(all_results)
+
+    if args.target and "lazy-warm" in all_results:
+        ready = statistics.median(r["ready"] for r in all_results["lazy-warm"])
+        verdict = "OK" if ready <= args.target else "MISSED"
+        print(f"\nlazy-warm ready in {ready:.3f}s (target {args.target:.3f}s): {verdict}")
+        return 0 if ready <= args.target else 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure agent startup time in fresh processes")
+    parser.add_argument("--model", default="qwen3", help="Model of the agent (default: qwen3)")
+    parser.add_argument("--runs", type=int, default=3, help="Measured starts per scenario (median reported)")
+    parser.add_argument("--scenarios", help=f"Comma-separated scenarios (default: {','.join(SCENARIOS)})")
+    parser.add_argument("--target", type=float, default=1.0,
+                        help="Maximum lazy-warm time to ready, in seconds (0: no check)")
+    parser.add_argument("--skip-request", action="store_true", help="Do not time a first request")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        import asyncio
+        question = None if args.skip_request else QUESTION
+        print(json.dumps(asyncio.run(measure(args.model, question))))
+    else:
+        sys.exit(main(args))
@@ -0,0 +1,85 @@
+from answer_cache import normalize_question, looks_like_write_request, has_write_tool_calls
+from metrics import REGISTRY
+import asyncio
+
+
+COALESCED_REQUESTS = REGISTRY.counter(
+    "coalesced_requests_total", "Requests answered by an identical in-flight request", ("model",)
+)
+COALESCED_SECONDS = REGISTRY.counter(
+    "coalesced_seconds_saved_total", "Agent seconds not spent thanks to request coalescing", ("model",)
+)
+
+
+class RequestCoalescer:
+    """
+    Single-flight execution of identical read-only requests.
+
+    A request whose key (model, normalized command, options) matches one
+    already in flight awaits that execution instead of running its own agent
+    loop. Commands that look like writes are never coalesced, and a shared
+    result is only handed out if the agent did not call a write tool;
+    otherwise each waiting duplicate runs on its own.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._in_flight = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.not_shared = 0
+        self.seconds_saved = 0.0
+
+    @staticmethod
+    def key(model: str, command: str, *options) -> tuple:
+        return (model, normalize_question(command), *options)
+
+    def can_coalesce(self, command: str) -> bool:
+        return self.enabled and not looks_like_write_request(command)
+
+    async def run(self, key: tuple, execute, coalesce: bool = True) -> tuple[dict, bool]:
+        """
+        Run `execute()` (a coroutine function returning a `run_request`
+        result) or share the in-flight execution with the same key.
+        Returns the result and whether it came from another request.
+        """
+        if not coalesce:
+            return await execute(), False
+        task = self._in_flight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.create_task(self._execute(key, execute))
+            # Retrieve the exception even if every waiter went away
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._in_flight[key] = task
+            # Shielded: a client disconnecting does not cancel the shared run
+            return await asyncio.shield(task), False
+
+        result = await asyncio.shield(task)
+        if has_write_tool_calls(result.get("raw")):
+            self.not_shared += 1
+            return await execute(), False
+        seconds = float(result.get("seconds_to_complete", 0.0))
+        # Routed requests are counted under the model that answered
+        model = result.get("routed_model") or key[0]
+        self.coalesced += 1
+        self.seconds_saved += seconds
+        COALESCED_REQUESTS.inc(model=model)
+        COALESCED_SECONDS.inc(seconds, model=model)
+        return result, True
+
+    async def _execute(self, key: tuple, execute) -> dict:
+        try:
+            return await execute()
+        finally:
+            self._in_flight.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._in_flight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "not_shared": self.not_shared,
+            "seconds_saved": round(self.seconds_saved, 3),
+        }
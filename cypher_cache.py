@@ -0,0 +1,157 @@
+# ------------------------------------------------------------
+# Cache des résultats Cypher (outils de lecture neo4j-cypher)
+# ------------------------------------------------------------
+
+# Détection des appels d'outils en écriture
+from answer_cache import is_write_tool_call, is_write_query
+
+# Librairies standards
+from collections import OrderedDict
+import json
+import os
+import time
+
+# Chargement des variables d’environnement (.env)
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# ------------------------------------------------------------
+# Configuration
+# ------------------------------------------------------------
+
+CYPHER_CACHE_ENABLED = os.getenv("CYPHER_CACHE_ENABLED", "true").lower() == "true"
+CYPHER_CACHE_TTL = float(os.getenv("CYPHER_CACHE_TTL", "300"))
+CYPHER_CACHE_MAX_ENTRIES = int(os.getenv("CYPHER_CACHE_MAX_ENTRIES", "512"))
+
+# Serveur MCP dont les outils de lecture sont mis en cache
+CYPHER_SERVER = "neo4j-cypher"
+
+# Outils de lecture du serveur neo4j-cypher (schéma, requêtes en lecture)
+READ_TOOL_PREFIXES = ("read_", "get_")
+
+
+class CypherResultCache:
+    """
+    Mémoïsation des outils de lecture du serveur neo4j-cypher.
+
+    Clé : (outil, requête, paramètres, base de données). Chaque entrée est
+    étiquetée avec l'« époque d'écriture » courante ; tout appel d'outil en
+    écriture (quel que soit le serveur) incrémente l'époque, ce qui
+    invalide d'un coup tous les résultats précédents.
+    """
+
+    def __init__(self, ttl: float = CYPHER_CACHE_TTL, max_entries: int = CYPHER_CACHE_MAX_ENTRIES,
+                 database: str | None = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.database = database or os.getenv("NEO4J_DATABASE", "neo4j")
+        self.write_epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def key(self, tool_name: str, args: dict) -> str:
+        args = dict(args)
+        database = args.pop("database", None) or self.database
+        query = args.pop("query", "")
+        params = args.pop("params", None)
+        return json.dumps([tool_name, database, query, params, args], sort_keys=True, default=str)
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        epoch, created_at, result = entry
+        if epoch != self.write_epoch or time.time() - created_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def set(self, key: str, result, epoch: int):
+        # Résultat obtenu avant une écriture concurrente : déjà périmé
+        if epoch != self.write_epoch:
+            return
+        self._entries[key] = (epoch, time.time(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def bump_write_epoch(self):
+        """
+        Invalide tous les résultats en cache après une écriture.
+        """
+        self.write_epoch += 1
+        self._entries.clear()
+
+    # --------------------------------------------------------
+    # Enveloppes des outils LangChain
+    # --------------------------------------------------------
+
+    def _wrap_read_tool(self, tool):
+        call_tool = tool.coroutine
+
+        async def cached_call(**arguments):
+            # Une requête en écriture passée à un outil de lecture n'est jamais mise en cache
+            if is_write_query(arguments.get("query", "")):
+                return await call_tool(**arguments)
+            key = self.key(tool.name, arguments)
+            result = self.get(key)
+            if result is not None:
+                self.hits += 1
+                return result
+            self.misses += 1
+            epoch = self.write_epoch
+            result = await call_tool(**arguments)
+            self.set(key, result, epoch)
+            return result
+
+        return tool.model_copy(update={"coroutine": cached_call})
+
+    def _wrap_write_tool(self, tool):
+        call_tool = tool.coroutine
+
+        async def invalidating_call(**arguments):
+            try:
+                return await call_tool(**arguments)
+            finally:
+                # Même en cas d'erreur, l'écriture a pu être partiellement appliquée
+                if is_write_tool_call(tool.name, arguments):
+                    self.bump_write_epoch()
+
+        return tool.model_copy(update={"coroutine": invalidating_call})
+
+    def wrap_tools(self, tools: list) -> list:
+        """
+        Enveloppe les outils : lecture neo4j-cypher mise en cache,
+        écriture (tous serveurs) invalidante.
+        """
+        wrapped = []
+        for tool in tools:
+            server = (tool.metadata or {}).get("mcp_server")
+            if getattr(tool, "coroutine", None) is None:
+                wrapped.append(tool)
+            elif server == CYPHER_SERVER and tool.name.startswith(READ_TOOL_PREFIXES):
+                wrapped.append(self._wrap_read_tool(tool))
+            else:
+                wrapped.append(self._wrap_write_tool(tool))
+        return wrapped
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "write_epoch": self.write_epoch,
+        }
+
+
+def cypher_cache_from_env() -> CypherResultCache | None:
+    """
+    Construit le cache Cypher selon les variables d'environnement
+    (None si CYPHER_CACHE_ENABLED=false).
+    """
+    return CypherResultCache() if CYPHER_CACHE_ENABLED else None
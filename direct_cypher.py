@@ -0,0 +1,351 @@
+# ------------------------------------------------------------
+# Chemin rapide : question -> une requête Cypher -> réponse (sans boucle ReAct)
+# ------------------------------------------------------------
+#
+# La boucle ReAct coûte au moins deux appels LLM, plus l'interprétation.
+# Pour les questions qu'une seule requête de lecture suffit à résoudre :
+#   1. le LLM génère une requête Cypher à partir du schéma en cache
+#      (SchemaContext) ;
+#   2. la requête est validée : une seule instruction, aucune clause
+#      d'écriture, labels et types de relations connus, puis analysée par
+#      Neo4j (EXPLAIN, qui indique aussi le type de requête) ;
+#   3. elle est exécutée en transaction de lecture sur un driver neo4j
+#      poolé (hors ligne : via l'outil MCP de lecture) ;
+#   4. le résultat est mis en forme sans second appel LLM.
+# Si une étape échoue, `answer` renvoie la raison et l'agent complet prend
+# le relais. Activation : DIRECT_CYPHER_ENABLED=true.
+
+# Messages LangChain (état LangGraph équivalent à un tour d'agent)
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+# Détection des écritures, modèle LLM partagé
+from answer_cache import is_write_query, looks_like_write_request
+from main_simple import get_model, extract_content
+
+# Schéma du graphe en cache
+from schema_context import SchemaContext
+
+# Métriques Prometheus (reprises par l'agent complet)
+from metrics import REGISTRY
+
+# Mode hors ligne (pas de base Neo4j)
+from offline import OFFLINE_MODE
+
+# Librairies standards
+import json
+import os
+import re
+import uuid
+
+# Chargement des variables d’environnement (.env)
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# ------------------------------------------------------------
+# Configuration
+# ------------------------------------------------------------
+
+DIRECT_CYPHER_ENABLED = os.getenv("DIRECT_CYPHER_ENABLED", "false").lower() == "true"
+
+# Modèle générant la requête (vide : modèle de l'agent)
+DIRECT_CYPHER_MODEL = os.getenv("DIRECT_CYPHER_MODEL", "")
+
+# Nombre maximal de lignes lues et affichées
+DIRECT_CYPHER_MAX_ROWS = int(os.getenv("DIRECT_CYPHER_MAX_ROWS", "50"))
+
+# Délai maximal d'exécution d'une requête (secondes)
+DIRECT_CYPHER_TIMEOUT = float(os.getenv("DIRECT_CYPHER_TIMEOUT", "10"))
+
+# Outil MCP utilisé hors ligne (et tracé dans l'état LangGraph)
+READ_TOOL_NAME = "read_neo4j_cypher"
+
+CYPHER_PROMPT = (
+    "You translate questions about a Neo4j graph database into Cypher.\n"
+    "Graph schema:\n{schema}\n"
+    "Write a single read-only Cypher query that answers the question. Use only the "
+    "labels, relationship types and properties of the schema. Never modify the graph. "
+    "Give the returned columns short names. Return only the Cypher query, without "
+    "explanation or code fences.\n"
+    "Question: {question}\n"
+    "Cypher:"
+)
+
+# Début d'une requête de lecture
+_READ_START_PATTERN = re.compile(r"^\s*(OPTIONAL\s+MATCH|MATCH|WITH|UNWIND|RETURN)\b", re.IGNORECASE)
+
+# Appels de procédures (apoc, dbms...) : refusés sur ce chemin
+_CALL_PATTERN = re.compile(r"\bCALL\b", re.IGNORECASE)
+
+# Labels de nœuds et types de relations cités dans la requête
+_LABEL_PATTERN = re.compile(r"\(\s*\w*\s*((?::\s*`?\w+`?\s*)+)")
+_REL_TYPE_PATTERN = re.compile(r"\[\s*\w*\s*:\s*((?:`?\w+`?\s*\|?\s*)+)")
+
+DIRECT_FALLBACKS = REGISTRY.counter(
+    "direct_cypher_fallbacks_total", "Questions renvoyées à l'agent complet par le chemin direct",
+    ("reason",)
+)
+
+
+def extract_cypher(text: str) -> str:
+    """
+    Extrait la requête de la réponse du LLM (bloc <think>, balises de code,
+    préfixe « Cypher: », point-virgule final).
+    """
+    text = text.rsplit("</think>", 1)[-1].strip()
+    fenced = re.search(r"```(?:cypher)?\s*(.+?)```", text, re.DOTALL | re.IGNORECASE)
+    if fenced:
+        text = fenced.group(1)
+    text = re.sub(r"^\s*cypher\s*:\s*", "", text.strip(), flags=re.IGNORECASE)
+    return text.strip().rstrip(";").strip()
+
+
+def referenced_names(cypher: str) -> set[str]:
+    """
+    Labels et types de relations cités dans une requête Cypher.
+    """
+    names = set()
+    for group in _LABEL_PATTERN.findall(cypher):
+        names.update(name.strip(" `") for name in group.split(":") if name.strip(" `"))
+    for group in _REL_TYPE_PATTERN.findall(cypher):
+        names.update(name.strip(" `") for name in group.split("|") if name.strip(" `"))
+    return names
+
+
+def check_cypher(cypher: str, known_names: set[str] | None = None) -> str | None:
+    """
+    Vérifications statiques d'une requête générée. Retourne la raison du
+    refus, ou None si la requête peut être analysée par Neo4j.
+    """
+    if not cypher:
+        return "empty_query"
+    if ";" in cypher:
+        return "multiple_statements"
+    if is_write_query(cypher):
+        return "write_clause"
+    if not _READ_START_PATTERN.match(cypher) or not re.search(r"\bRETURN\b", cypher, re.IGNORECASE):
+        return "not_a_read_query"
+    if _CALL_PATTERN.search(cypher):
+        return "procedure_call"
+    if known_names is not None and referenced_names(cypher) - known_names:
+        return "unknown_label"
+    return None
+
+
+def format_rows(rows: list[dict], truncated: bool = False) -> str:
+    """
+    Met en forme un résultat sans LLM : valeur seule, liste ou tableau Markdown.
+    """
+    if not rows:
+        return "No results."
+    columns = list(rows[0].keys())
+    if len(rows) == 1 and len(columns) == 1:
+        return str(rows[0][columns[0]])
+    more = " (more rows not shown)" if truncated else ""
+    if len(columns) == 1:
+        return ", ".join(str(row[columns[0]]) for row in rows) + more
+    lines = ["| " + " | ".join(columns) + " |", "|" + "---|" * len(columns)]
+    for row in rows:
+        lines.append("| " + " | ".join(str(row.get(c, "")) for c in columns) + " |")
+    return "\n".join(lines) + (f"\n\n{more.strip()}" if truncated else "")
+
+
+class DirectCypher:
+    """
+    Réponse en une seule requête Cypher générée à partir du schéma.
+    Le driver est celui du contexte de schéma s'il existe, sinon un driver
+    propre (pool de connexions du driver neo4j).
+    """
+
+    def __init__(self, schema_context: SchemaContext | None, uri: str | None = None,
+                 user: str | None = None, password: str | None = None,
+                 database: str | None = None, model: str = DIRECT_CYPHER_MODEL,
+                 max_rows: int = DIRECT_CYPHER_MAX_ROWS, timeout: float = DIRECT_CYPHER_TIMEOUT):
+        self.schema_context = schema_context
+        # En mode hors ligne, les requêtes passent par l'outil MCP du serveur local
+        self.uri = uri or (None if OFFLINE_MODE else os.getenv("NEO4J_URI"))
+        self.user = user or os.getenv("NEO4J_USERNAME")
+        self.password = password or os.getenv("NEO4J_PASSWORD")
+        self.database = database or os.getenv("NEO4J_DATABASE", "neo4j")
+        self.model = model
+        self.max_rows = max_rows
+        self.timeout = timeout
+        self.driver = None
+        self._owns_driver = False
+        self.read_tool = None
+        self.answered = 0
+        self.fallbacks = {}
+
+    async def start(self, tools: list | None = None):
+        """
+        Reprend le driver du contexte de schéma (ou en ouvre un) et repère
+        l'outil MCP de lecture.
+        """
+        if self.driver is None and self.schema_context is not None and self.schema_context.driver is not None:
+            self.driver = self.schema_context.driver
+        if self.driver is None and self.uri:
+            # Import différé : le driver Neo4j (et pandas) n'est chargé qu'ici
+            from neo4j import AsyncGraphDatabase
+            self.driver = AsyncGraphDatabase.driver(self.uri, auth=(self.user, self.password))
+            self._owns_driver = True
+        if tools:
+            self.read_tool = next((t for t in tools if t.name == READ_TOOL_NAME), None)
+        return self
+
+    async def close(self):
+        if self._owns_driver and self.driver is not None:
+            await self.driver.close()
+        self.driver = None
+        self._owns_driver = False
+        self.read_tool = None
+
+    # --------------------------------------------------------
+    # Étapes
+    # --------------------------------------------------------
+
+    async def generate(self, question: str, model: str, callbacks: list | None = None) -> AIMessage:
+        """
+        Demande au LLM une requête Cypher (réponse brute du modèle).
+        """
+        prompt = CYPHER_PROMPT.format(schema=self.schema_context.summary, question=question)
+        config = {"callbacks": callbacks} if callbacks else None
+        return await get_model(self.model or model).ainvoke(prompt, config)
+
+    async def validate(self, cypher: str) -> str | None:
+        """
+        Vérifications statiques, puis analyse par Neo4j (EXPLAIN) si un
+        driver est disponible. Retourne la raison du refus ou None.
+        """
+        reason = check_cypher(cypher, self.schema_context.known_names())
+        if reason is not None or self.driver is None:
+            return reason
+        from neo4j import READ_ACCESS
+        try:
+            async with self.driver.session(database=self.database, default_access_mode=READ_ACCESS) as session:
+                result = await session.run(f"EXPLAIN {cypher}")
+                summary = await result.consume()
+        except Exception:
+            return "syntax_error"
+        # "r" : lecture seule ("rw", "w", "s" : écriture ou schéma)
+        return None if summary.query_type == "r" else "write_clause"
+
+    async def execute(self, cypher: str) -> tuple[list[dict], bool]:
+        """
+        Exécute la requête en lecture. Retourne au plus `max_rows` lignes
+        et un indicateur de troncature.
+        """
+        if self.driver is not None:
+            from neo4j import READ_ACCESS, unit_of_work
+
+            # Délai porté par la transaction : tx.run refuse les objets Query
+            @unit_of_work(timeout=self.timeout)
+            async def read(tx):
+                result = await tx.run(cypher)
+                rows = []
+                async for record in result:
+                    rows.append(record.data())
+                    if len(rows) > self.max_rows:
+                        break
+                return rows
+
+            async with self.driver.session(database=self.database, default_access_mode=READ_ACCESS) as session:
+                rows = await session.execute_read(read)
+        elif self.read_tool is not None:
+            output = extract_content(await self.read_tool.ainvoke({"query": cypher}))
+            rows = json.loads(output)
+            if not isinstance(rows, list):
+                raise ValueError(f"Résultat inattendu : {output[:200]}")
+        else:
+            raise RuntimeError("Ni driver Neo4j ni outil de lecture disponible")
+        return rows[:self.max_rows], len(rows) > self.max_rows
+
+    async def answer(self, question: str, model: str, trace=None, callbacks: list | None = None) -> tuple:
+        """
+        Tente de répondre par le chemin direct.
+        Retourne (état LangGraph équivalent, réponse, requête) en cas de
+        succès, sinon (None, raison du refus, requête éventuelle).
+        """
+        if looks_like_write_request(question):
+            return self._fallback("write_request")
+        if self.schema_context is not None:
+            await self.schema_context.ensure_loaded()
+        if self.schema_context is None or not self.schema_context.summary:
+            return self._fallback("no_schema")
+
+        try:
+            response = await self.generate(question, model, callbacks)
+        except Exception:
+            return self._fallback("generation_error")
+        cypher = extract_cypher(extract_content(response))
+        if trace is not None:
+            trace.current.attributes["cypher"] = cypher
+
+        reason = await self.validate(cypher)
+        if reason is not None:
+            return self._fallback(reason, cypher)
+        try:
+            rows, truncated = await self.execute(cypher)
+        except Exception as e:
+            print(f"Échec de l'exécution directe : {e}")
+            return self._fallback("execution_error", cypher)
+
+        answer = format_rows(rows, truncated)
+        self.answered += 1
+        # État au format LangGraph : mêmes outils de mesure et de cache que l'agent
+        call_id = f"call_{uuid.uuid4().hex[:12]}"
+        state = {"messages": [
+            HumanMessage(content=question),
+            AIMessage(
+                content="",
+                tool_calls=[{"name": READ_TOOL_NAME, "args": {"query": cypher}, "id": call_id, "type": "tool_call"}],
+                usage_metadata=getattr(response, "usage_metadata", None)
+            ),
+            ToolMessage(content=json.dumps(rows, default=str), tool_call_id=call_id, name=READ_TOOL_NAME),
+            AIMessage(content=answer),
+        ]}
+        return state, answer, cypher
+
+    def _fallback(self, reason: str, cypher: str | None = None) -> tuple:
+        self.fallbacks[reason] = self.fallbacks.get(reason, 0) + 1
+        DIRECT_FALLBACKS.inc(reason=reason)
+        return None, reason, cypher
+
+    def stats(self) -> dict:
+        return {"answered": self.answered, "fallbacks": dict(self.fallbacks)}
+
+
+# ------------------------------------------------------------
+# Vérification sur la base configurée (chemin driver)
+# ------------------------------------------------------------
+
+async def check_driver(cypher: str) -> int:
+    """
+    Valide (EXPLAIN) puis exécute `cypher` par le driver neo4j, comme le
+    chemin direct. Le mode hors ligne passe par l'outil MCP et ne teste pas
+    ce chemin.
+    """
+    schema_context = await SchemaContext().start()
+    direct = await DirectCypher(schema_context).start()
+    try:
+        if direct.driver is None:
+            print("NEO4J_URI non configuré (ou OFFLINE_MODE=true) : pas de driver à vérifier")
+            return 1
+        reason = await direct.validate(cypher)
+        if reason is not None:
+            print(f"Requête refusée : {reason}")
+            return 1
+        rows, truncated = await direct.execute(cypher)
+        print(format_rows(rows, truncated))
+        return 0
+    finally:
+        await direct.close()
+        await schema_context.close()
+
+
+if __name__ == "__main__":
+    import asyncio
+    import sys
+
+    # Ex : python direct_cypher.py "MATCH (n) RETURN count(n) AS nodes"
+    query = sys.argv[1] if len(sys.argv) > 1 else "MATCH (n) RETURN count(n) AS nodes"
+    sys.exit(asyncio.run(check_driver(query)))
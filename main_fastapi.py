@@ -1,8 +1,26 @@
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, Field
 from main_multi import MultiToolAgent, MCP_SERVER_CONFIGS
+from mcp_pool import close_http_connections
+from main_simple import INTERPRETATION_MODES
+from agent_cache import AgentCache
+from answer_cache import answer_cache_from_env
+from cypher_cache import cypher_cache_from_env
+from schema_context import schema_context_from_env
+from scheduler import AdmissionScheduler, SchedulerSaturated, parse_model_limits
+from coalescer import RequestCoalescer
+from metrics import REGISTRY, REQUEST_ERRORS, render_metrics
+from model_manager import MODEL_MANAGER
+from model_router import ModelRouter, ROUTER_MODEL_NAME
+from session_memory import SessionMemory
 from dotenv import load_dotenv
 import logging
+import asyncio
+import json
 import os
 
 
@@ -16,9 +34,57 @@ load_dotenv()
 FASTAPI_HOST = os.getenv("FASTAPI_HOST", "0.0.0.0")
 FASTAPI_PORT = int(os.getenv("FASTAPI_PORT", "8000"))
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",")
+AGENT_CACHE_MAX_SIZE = int(os.getenv("AGENT_CACHE_MAX_SIZE", "4"))
+AGENT_CACHE_TTL = float(os.getenv("AGENT_CACHE_TTL", "3600"))
+WARMUP_MODELS = [m.strip() for m in os.getenv("WARMUP_MODELS", "").split(",") if m.strip()]
+MAX_CONCURRENCY_PER_MODEL = int(os.getenv("MAX_CONCURRENCY_PER_MODEL", "2"))
+MODEL_CONCURRENCY = parse_model_limits(os.getenv("MODEL_CONCURRENCY", ""))
+MAX_QUEUE_SIZE = int(os.getenv("MAX_QUEUE_SIZE", "32"))
+MAX_QUEUE_SECONDS = float(os.getenv("MAX_QUEUE_SECONDS", "30"))
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", str(MAX_CONCURRENCY_PER_MODEL)))
+REQUEST_COALESCING_ENABLED = os.getenv("REQUEST_COALESCING_ENABLED", "true").lower() == "true"
+# Models accepted besides the ones installed on the Ollama server (`ollama list`)
+ALLOWED_MODELS = [m.strip() for m in os.getenv("ALLOWED_MODELS", "llama3.2,mistral,qwen3").split(",") if m.strip()]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warm up the configured models on startup (agents and Ollama models loaded
+    into memory), evict idle agents periodically, and close every cached
+    agent's MCP sessions and the shared MCP HTTP connections when the
+    server shuts down.
+    """
+    if WARMUP_MODELS:
+        print(f"Warming up agents for: {', '.join(WARMUP_MODELS)}")
+        # The routed model name stands for its fast and strong models
+        ollama_models = list(dict.fromkeys(
+            m for model in WARMUP_MODELS
+            for m in (_router.models if model == ROUTER_MODEL_NAME else [model])
+        ))
+        await asyncio.gather(
+            _agent_cache.warm_up(WARMUP_MODELS),
+            MODEL_MANAGER.preload(ollama_models)
+        )
+
+    async def sweep_idle_agents():
+        while True:
+            await asyncio.sleep(max(1.0, AGENT_CACHE_TTL / 2))
+            await _agent_cache.sweep()
+
+    sweeper = asyncio.create_task(sweep_idle_agents()) if AGENT_CACHE_TTL > 0 else None
+    yield
+    if sweeper is not None:
+        sweeper.cancel()
+    await _agent_cache.close()
+    await _session_memory.close()
+    if _schema_context is not None:
+        await _schema_context.close()
+    await close_http_connections()
 
 # Create FastAPI app with configuration
 app = FastAPI(
+    lifespan=lifespan,
     title="LangChain + Ollama + Neo4j MCP API",
     description="API for interacting with LangChain and Neo4j through MCP with Ollama",
     version=os.getenv("API_VERSION", "1.0.0"),
@@ -48,53 +114,381 @@ async def query_agent(
     ), model: str = Query(..., 
         description="The name of the Ollama model to use. NOTE: Model must be available on the ollama server.", 
         example="llama3.1"
+    ), interpretation: str | None = Query(None,
+        description=f"Interpretation pass: one of {', '.join(INTERPRETATION_MODES)}. Defaults to INTERPRETATION_MODE.",
+        example="compact"
+    ), session_id: str | None = Query(None,
+        description="Conversation to continue: follow-up commands see the session's earlier turns.",
+        example="alice-1"
     )):
     """
     Execute a command through the LangChain agent with Neo4j MCP integration.
     
     Args:
         command (str): The command to be executed by the agent
+        interpretation (str): Optional interpretation mode override
+        session_id (str): Optional conversation to continue
         
     Returns:
         dict: The response from the agent
     """
     if not command:
         raise HTTPException(status_code=400, detail="Command parameter is required")
+    if interpretation is not None and interpretation not in INTERPRETATION_MODES:
+        raise HTTPException(status_code=400, detail=f"Interpretation must be one of {list(INTERPRETATION_MODES)}")
+    await check_model(model)
     
+    async def execute():
+        # Wait for a concurrency slot, then get or create agent from cache
+        async with _scheduler.admit(model), get_agent(model) as agent:
+            return await agent.run_request(command, with_logging=False, interpretation_mode=interpretation,
+                                           session_id=session_id)  # Enable logging for API requests
+
     try:
-        # Get or create agent from cache
-        agent = get_agent(model)
-        result = await agent.run_request(command, with_logging=False)  # Enable logging for API requests
+        # Identical read-only commands already in flight share one execution
+        # (session turns depend on their history, so they always run alone)
+        result, coalesced = await _coalescer.run(
+            _coalescer.key(model, command, interpretation),
+            execute,
+            coalesce=session_id is None and _coalescer.can_coalesce(command)
+        )
         
         # Ensure all values are JSON serializable
         response = {
             "status": "success", 
             "result": str(result.get("answer", "")),  # Convert to string to ensure serialization
             "raw": str(result.get("raw", "")),        # Convert raw to string
-            "seconds_to_complete": float(result.get("seconds_to_complete", 0.0))     # Explicitly convert to float
+            "interpretation_mode": str(result.get("interpretation_mode", "")),
+            "cache": result.get("cache"),
+            # Shared with an identical request that was already running
+            "coalesced": coalesced,
+            # Answer path (cache, direct Cypher or agent) and the direct query if any
+            "path": result.get("path"),
+            "cypher": result.get("cypher"),
+            "direct_fallback": result.get("direct_fallback"),
+            "tools_bound": result.get("tools_bound"),
+            # Conversation state (turn number, history size, compactions)
+            "session": result.get("session"),
+            # Model routing (only when the routed model name is requested)
+            "route": result.get("route"),
+            "routed_model": result.get("routed_model"),
+            "fallback": result.get("fallback"),
+            "agent_seconds": float(result.get("agent_seconds", 0.0)),
+            "interpretation_seconds": float(result.get("interpretation_seconds", 0.0)),
+            "seconds_to_complete": float(result.get("seconds_to_complete", 0.0)),    # Explicitly convert to float
+            # Per-stage spans (LLM calls, MCP tool calls, interpretation)
+            "trace_id": result.get("trace_id"),
+            "spans": result.get("spans", [])
         }
-        print(f"API Response: {response}")
+        print(f"API Response: {response['result']} ({response['seconds_to_complete']}s, trace {response['trace_id']})")
         return response
+    except SchedulerSaturated as e:
+        raise too_many_requests(e)
     except Exception as e:
         print(f"Error in query_agent: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# Cache for agents by model name
-_agent_cache = {}
+async def known_models() -> set[str]:
+    """
+    Model names a request may use: configured models (ALLOWED_MODELS, warm-up,
+    per-model limits and keep-alives, the router and its models) and the
+    models installed on the Ollama server.
+    """
+    configured = {*ALLOWED_MODELS, *WARMUP_MODELS, *MODEL_CONCURRENCY, *MODEL_MANAGER.model_keep_alive,
+                  ROUTER_MODEL_NAME, *_router.models}
+    return configured | await MODEL_MANAGER.installed()
+
+async def check_model(model: str):
+    """
+    Reject unknown model names with a 400 before they reach the scheduler or
+    the agent cache, which would otherwise create a lane, an agent and metric
+    series for any string.
+    """
+    models = await known_models()
+    if model not in models:
+        raise HTTPException(status_code=400, detail=f"Unknown model {model!r}; available: {sorted(models)}")
+
+def too_many_requests(error: SchedulerSaturated) -> HTTPException:
+    """
+    Build the 429 response returned when the scheduler is saturated.
+    """
+    REQUEST_ERRORS.inc(model=error.model, exception=type(error).__name__)
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+def format_sse(event: dict) -> str:
+    """
+    Format an agent event as a server-sent event (`event:` + JSON `data:`).
+    """
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+@app.get("/query/stream")
+async def stream_query_agent(
+    command: str = Query(..., 
+        description="Simple instruction for the graph database agent", 
+        example="How many nodes are in the graph?"
+    ), model: str = Query(..., 
+        description="The name of the Ollama model to use. NOTE: Model must be available on the ollama server.", 
+        example="llama3.1"
+    ), interpretation: str | None = Query(None,
+        description=f"Interpretation pass: one of {', '.join(INTERPRETATION_MODES)}. Defaults to INTERPRETATION_MODE.",
+        example="none"
+    ), session_id: str | None = Query(None,
+        description="Conversation to continue: follow-up commands see the session's earlier turns.",
+        example="alice-1"
+    )):
+    """
+    Execute a command and stream the agent's progress as server-sent events.
+
+    Events: `route` (routed model name only), `tool_start`, `cypher`, `tool_end`,
+    `token` (with `stage` set to `agent` or `interpretation`), then `done` with
+    the final answer and timings, or `error`.
+    """
+    if not command:
+        raise HTTPException(status_code=400, detail="Command parameter is required")
+    if interpretation is not None and interpretation not in INTERPRETATION_MODES:
+        raise HTTPException(status_code=400, detail=f"Interpretation must be one of {list(INTERPRETATION_MODES)}")
+    await check_model(model)
+
+    # Admission happens before streaming starts so saturation is a real 429
+    try:
+        ticket = await _scheduler.acquire(model)
+    except SchedulerSaturated as e:
+        raise too_many_requests(e)
+
+    async def event_stream():
+        try:
+            async with get_agent(model) as agent:
+                async for event in agent.stream_request(command, interpretation_mode=interpretation,
+                                                        session_id=session_id):
+                    yield format_sse(event)
+        except Exception as e:
+            print(f"Error in stream_query_agent: {str(e)}")
+            yield format_sse({"type": "error", "detail": str(e)})
+        finally:
+            ticket.release()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also release the slot if the client disconnects before streaming starts
+        background=BackgroundTask(ticket.release)
+    )
+
+class BatchRequest(BaseModel):
+    commands: list[str] = Field(...,
+        description="Instructions for the graph database agent",
+        examples=[["How many nodes are in the graph?", "How many Products are there?"]]
+    )
+    model: str = Field(...,
+        description="The name of the Ollama model to use. NOTE: Model must be available on the ollama server.",
+        examples=["llama3.1"]
+    )
+    concurrency: int | None = Field(None,
+        description="Commands run at the same time. Defaults to BATCH_CONCURRENCY."
+    )
+    interpretation: str | None = Field(None,
+        description=f"Interpretation pass: one of {', '.join(INTERPRETATION_MODES)}. Defaults to INTERPRETATION_MODE."
+    )
+
+def format_batch_item(item: dict) -> dict:
+    """
+    Build the JSON line returned for one batch item (same fields as /query).
+    """
+    return {
+        "index": item["index"],
+        "command": item["request"],
+        "status": item["status"],
+        "result": str(item.get("answer", "")),
+        "interpretation_mode": item.get("interpretation_mode"),
+        "cache": item.get("cache"),
+        "path": item.get("path"),
+        "cypher": item.get("cypher"),
+        "route": item.get("route"),
+        "routed_model": item.get("routed_model"),
+        "fallback": item.get("fallback"),
+        "agent_seconds": float(item.get("agent_seconds", 0.0)),
+        "interpretation_seconds": float(item.get("interpretation_seconds", 0.0)),
+        "seconds_to_complete": float(item.get("seconds_to_complete", 0.0)),
+        "queued_seconds": item["queued_seconds"],
+        "seconds": item["seconds"],
+        "trace_id": item.get("trace_id"),
+        "error": item.get("error")
+    }
+
+@app.post("/batch")
+async def batch_query_agent(batch: BatchRequest):
+    """
+    Run many commands over one cached agent, with bounded concurrency.
+
+    Results are streamed back as newline-delimited JSON, one line per command
+    in completion order (use `index` to match them to the request), followed by
+    a final `{"status": "done", ...}` summary line.
+    """
+    if not batch.commands:
+        raise HTTPException(status_code=400, detail="At least one command is required")
+    if len(batch.commands) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"A batch is limited to {MAX_BATCH_SIZE} commands")
+    if batch.interpretation is not None and batch.interpretation not in INTERPRETATION_MODES:
+        raise HTTPException(status_code=400, detail=f"Interpretation must be one of {list(INTERPRETATION_MODES)}")
+    await check_model(batch.model)
+    concurrency = max(1, batch.concurrency or BATCH_CONCURRENCY)
+
+    async def result_stream():
+        start_time = asyncio.get_running_loop().time()
+        counts = {"success": 0, "error": 0}
+        try:
+            async with get_agent(batch.model) as agent:
+                # Each command still goes through the scheduler, so a batch
+                # shares the model's concurrency limit with interactive queries
+                async for item in agent.run_batch(
+                    batch.commands,
+                    concurrency=concurrency,
+                    interpretation_mode=batch.interpretation,
+                    admission=lambda: _scheduler.admit(batch.model)
+                ):
+                    counts[item["status"]] += 1
+                    yield json.dumps(format_batch_item(item), default=str) + "\n"
+        except Exception as e:
+            print(f"Error in batch_query_agent: {str(e)}")
+            yield json.dumps({"status": "error", "detail": str(e)}) + "\n"
+        yield json.dumps({
+            "status": "done",
+            "count": len(batch.commands),
+            "succeeded": counts["success"],
+            "failed": counts["error"],
+            "seconds": round(asyncio.get_running_loop().time() - start_time, 3)
+        }) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+@app.get("/stats")
+async def stats():
+    """
+    Report scheduler queue depth and wait times, and agent cache usage.
+    """
+    return {
+        "scheduler": _scheduler.stats(),
+        "coalescer": _coalescer.stats(),
+        "agent_cache": _agent_cache.stats(),
+        "answer_cache": _answer_cache.stats() if _answer_cache is not None else None,
+        "cypher_cache": _cypher_cache.stats() if _cypher_cache is not None else None,
+        "models": MODEL_MANAGER.stats(),
+        "router": _router.stats(),
+        "sessions": _session_memory.stats()
+    }
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """
+    Forget a conversation and its stored history.
+    """
+    if not await _session_memory.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Unknown session {session_id}")
+    return {"status": "success", "session_id": session_id}
+
+@app.get("/models")
+async def resident_models():
+    """
+    List the models currently loaded in Ollama's memory, with their keep-alive.
+    """
+    try:
+        resident = await MODEL_MANAGER.resident()
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Could not reach the Ollama server: {str(e)}")
+    return {"resident": resident, **MODEL_MANAGER.stats()}
+
+@app.post("/models/{model}/preload")
+async def preload_model(model: str):
+    """
+    Load a model into Ollama's memory ahead of its first request.
+    """
+    await check_model(model)
+    await MODEL_MANAGER.preload([model])
+    if model not in MODEL_MANAGER.preloaded:
+        raise HTTPException(status_code=502, detail=f"Could not preload {model}")
+    return {"status": "success", "model": model, "keep_alive": MODEL_MANAGER.keep_alive_for(model)}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Expose request latency, in-flight requests, agent cache usage, MCP tool-call
+    latency, LLM tokens and error counts in the Prometheus text format.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+def collect_agent_cache_metrics():
+    """
+    Copy the agent cache counters into the registry at scrape time.
+    """
+    cache_stats = _agent_cache.stats()
+    AGENT_CACHE_SIZE.set(cache_stats["size"])
+    AGENT_CACHE_HITS.set_total(cache_stats["hits"])
+    AGENT_CACHE_MISSES.set_total(cache_stats["misses"])
+    AGENT_CACHE_EVICTIONS.set_total(cache_stats["evictions"])
+
+AGENT_CACHE_SIZE = REGISTRY.gauge("agent_cache_size", "Agents currently cached")
+AGENT_CACHE_HITS = REGISTRY.counter("agent_cache_hits_total", "Agent cache hits")
+AGENT_CACHE_MISSES = REGISTRY.counter("agent_cache_misses_total", "Agent cache misses")
+AGENT_CACHE_EVICTIONS = REGISTRY.counter("agent_cache_evictions_total", "Agent cache evictions")
+REGISTRY.add_collector(collect_agent_cache_metrics)
+
+# Answer cache shared by all agents, so a write through any model invalidates it
+_answer_cache = answer_cache_from_env()
+
+# Cypher read-result cache shared by all agents (same database, same write epoch)
+_cypher_cache = cypher_cache_from_env()
+
+# Graph schema summary shared by all agents, refreshed after writes and on a timer
+_schema_context = schema_context_from_env()
+
+# Routes ROUTER_MODEL_NAME ("auto") requests to the fast or strong model
+_router = ModelRouter()
+
+# Conversation histories shared by all agents, so a session can switch models
+_session_memory = SessionMemory()
+
+# Bounded (LRU + idle TTL) cache for agents by model name
+_agent_cache = AgentCache(
+    lambda model: MultiToolAgent(
+        model, MCP_SERVER_CONFIGS,
+        answer_cache=_answer_cache,
+        cypher_cache=_cypher_cache,
+        schema_context=_schema_context,
+        router=_router if model == ROUTER_MODEL_NAME else None,
+        session_memory=_session_memory
+    ),
+    max_size=AGENT_CACHE_MAX_SIZE,
+    ttl=AGENT_CACHE_TTL
+)
+
+# Per-model concurrency limits with a bounded wait queue
+_scheduler = AdmissionScheduler(
+    default_limit=MAX_CONCURRENCY_PER_MODEL,
+    model_limits=MODEL_CONCURRENCY,
+    max_queue_size=MAX_QUEUE_SIZE,
+    max_queue_seconds=MAX_QUEUE_SECONDS
+)
+
+# Single-flight execution of identical read-only /query commands
+_coalescer = RequestCoalescer(enabled=REQUEST_COALESCING_ENABLED)
 
-def get_agent(model: str) -> MultiToolAgent:
+def get_agent(model: str):
     """
-    Get a cached agent instance or create a new one if it doesn't exist.
+    Lease a cached, initialized agent, creating it if it doesn't exist.
+    Concurrent first requests for a model share a single initialization.
     
     Args:
         model: The model name to get or create an agent for
         
     Returns:
-        MultiToolAgent: A cached or new agent instance
+        An async context manager yielding the initialized MultiToolAgent
     """
-    if model not in _agent_cache:
-        _agent_cache[model] = MultiToolAgent(model, MCP_SERVER_CONFIGS)
-    return _agent_cache[model]
+    return _agent_cache.lease(model)
 
 # This allows the file to be imported without starting the server
 if __name__ == "__main__":
@@ -1,17 +1,28 @@
 from main_multi import MultiToolAgent, MCP_SERVER_CONFIGS
+from model_manager import MODEL_MANAGER
 import asyncio
+import uuid
+
+def new_session_id() -> str:
+    return f"interactive-{uuid.uuid4().hex[:8]}"
 
 async def interactive_agent(agent: any):
-    # Setup interactive loop
-    print("\nType your request (or 'exit' to quit):")
+    # Setup interactive loop, as one conversation so follow-ups see earlier turns
+    session_id = new_session_id()
+    print("\nType your request (or 'reset' to start a new conversation, 'exit' to quit):")
     while True:
         user_input = input("👶 You: ").strip()
         if user_input.lower() in {"exit", "quit"}:
             print("Exiting interactive session.")
             break
+        if user_input.lower() == "reset":
+            await agent.session_memory.delete(session_id)
+            session_id = new_session_id()
+            print("Started a new conversation.\n")
+            continue
         try:
             # Use the version with detailed logging
-            agent_response = await agent.run_request(user_input)
+            agent_response = await agent.run_request(user_input, session_id=session_id)
             # Just print the answer part in the interactive session
             print(f"\n🤖 Agent: {agent_response.get('answer', 'No answer provided')}\n")
         except Exception as e:
@@ -24,7 +35,10 @@ if __name__ == "__main__":
     model = "llama3.1"
 
     async def main():
-        agent = await MultiToolAgent(model, MCP_SERVER_CONFIGS).initialize()
-        await interactive_agent(agent)
+        # Load the model into Ollama's memory while the MCP servers start
+        preload = asyncio.create_task(MODEL_MANAGER.preload([model]))
+        async with MultiToolAgent(model, MCP_SERVER_CONFIGS) as agent:
+            await preload
+            await interactive_agent(agent)
 
     asyncio.run(main())
\ No newline at end of file
@@ -2,22 +2,52 @@
 # Imports MCP (Model Context Protocol)
 # ------------------------------------------------------------
 
-# Gestion de sessions MCP et paramètres serveur (stdio)
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+# Le SDK MCP et langchain_mcp_adapters sont importés à l'usage (méthodes
+# de chargement ci-dessous, lancement des serveurs par le pool) : le
+# démarrage de l'agent n'en dépend pas lorsque le manifeste est valide.
 
-# Adaptateurs LangChain pour charger les outils MCP
-from langchain_mcp_adapters.tools import load_mcp_tools
-from langchain_mcp_adapters.client import MultiServerMCPClient
+# Pool de sessions MCP persistantes (un sous-processus par session)
+from mcp_pool import MCPSessionPool
+
+# Serveurs MCP partagés en streamable HTTP (MCP_TRANSPORT=http)
+from mcp_http_servers import MCP_TRANSPORT, http_server_configs
+
+# Cache de réponses (invalidé par les appels d'outils en écriture)
+from answer_cache import has_write_tool_calls
+
+# Cache des résultats des outils de lecture Cypher (époque d'écriture)
+from cypher_cache import CypherResultCache
+
+# Résumé du schéma du graphe injecté dans le prompt système
+from schema_context import SchemaContext, SCHEMA_CONTEXT_ENABLED
+
+# Mode hors ligne : serveur MCP local à la place de Neo4j
+from offline import OFFLINE_MODE, OFFLINE_MCP_SERVER_CONFIGS
 
 # Agent ReAct basé sur LangGraph
 from langgraph.prebuilt import create_react_agent
 
-# Callbacks pour le logging et le tracing
-from langchain_community.callbacks import get_openai_callback
-from langchain_core.tracers import ConsoleCallbackHandler
+# Chemin direct texte -> Cypher (sans boucle ReAct)
+from direct_cypher import DirectCypher, DIRECT_CYPHER_ENABLED
+
+# Sélection des outils pertinents pour chaque requête
+from tool_selector import ToolSelector, TOOL_SELECTION_ENABLED, tool_selector_embeddings
+
+# Routage des questions (modèle rapide / modèle puissant)
+from model_router import ModelRouter, needs_fallback
+
+# Mémoire de conversation par session (checkpointer LangGraph, compaction)
+from session_memory import SessionMemory, current_turn
+
+# Traces par requête (spans LLM, outils MCP, interprétation)
+from tracing import Trace, TracingCallbackHandler, export_trace
+
+# Métriques Prometheus (durées, requêtes en cours, tokens, erreurs)
+from metrics import REQUEST_SECONDS, PATH_SECONDS, REQUESTS_IN_FLIGHT, REQUEST_ERRORS, record_trace
 
 # Librairies standards
+from collections import OrderedDict
+from contextlib import nullcontext
 import asyncio
 import time
 import os
@@ -29,7 +59,18 @@ load_dotenv()
 # Fonctions utilitaires définies dans un script précédent
 # - get_model : initialise le LLM (ex: Ollama)
 # - interpret_agent_response : reformule la réponse brute
-from main_simple import get_model, interpret_agent_response
+# - get_final_answer / answers_question : réponse finale et heuristique
+#   permettant de sauter la reformulation
+from main_simple import (
+    get_model,
+    interpret_agent_response,
+    get_final_answer,
+    answers_question,
+    build_interpretation_prompt,
+    extract_content,
+    INTERPRETATION_MODE,
+    INTERPRETATION_SKIP_IF_ANSWERED,
+)
 
 
 # ------------------------------------------------------------
@@ -66,6 +107,19 @@ MCP_SERVER_CONFIGS = {
     # }
 }
 
+# Mode hors ligne : serveur MCP local sur un graphe en mémoire (tests de charge)
+if OFFLINE_MODE:
+    MCP_SERVER_CONFIGS = OFFLINE_MCP_SERVER_CONFIGS
+
+# Serveurs partagés en streamable HTTP (lancés par mcp_http_servers.py)
+# au lieu de sous-processus stdio propres à chaque agent
+MCP_STDIO_SERVER_CONFIGS = MCP_SERVER_CONFIGS
+if MCP_TRANSPORT == "http":
+    MCP_SERVER_CONFIGS = http_server_configs(MCP_STDIO_SERVER_CONFIGS)
+
+# Nombre maximal d'agents ReAct compilés conservés (modèle x sous-ensemble d'outils)
+MAX_CACHED_AGENTS = int(os.getenv("MAX_CACHED_AGENTS", "64"))
+
 
 # ------------------------------------------------------------
 # Méthode "moins élégante" : chargement outil par outil (stdio)
@@ -75,6 +129,10 @@ async def get_tools_from_server(server_name: str, server_cfg: dict):
     """
     Initialise un serveur MCP via stdio et récupère ses outils.
     """
+    from mcp import ClientSession, StdioServerParameters
+    from mcp.client.stdio import stdio_client
+    from langchain_mcp_adapters.tools import load_mcp_tools
+
     params = StdioServerParameters(
         command=server_cfg["command"],
         args=server_cfg["args"],
@@ -118,6 +176,7 @@ async def get_multi_tools(configs: dict):
     Utilise MultiServerMCPClient pour charger tous les outils
     (stdio, SSE, HTTP streamable).
     """
+    from langchain_mcp_adapters.client import MultiServerMCPClient
     client = MultiServerMCPClient(configs)
     return await client.get_tools()
 
@@ -127,76 +186,732 @@ async def get_multi_tools(configs: dict):
 # ------------------------------------------------------------
 
 class MultiToolAgent:
-    def __init__(self, model: str, configs: dict):
+    def __init__(self, model: str, configs: dict, pool_sizes: dict | None = None,
+                 interpretation_mode: str = INTERPRETATION_MODE,
+                 skip_if_answered: bool = INTERPRETATION_SKIP_IF_ANSWERED,
+                 answer_cache=None,
+                 cypher_cache: CypherResultCache | None = None,
+                 schema_context: SchemaContext | None = None,
+                 router: ModelRouter | None = None,
+                 direct_cypher: bool = DIRECT_CYPHER_ENABLED,
+                 tool_selection: bool = TOOL_SELECTION_ENABLED,
+                 session_memory: SessionMemory | None = None):
         self.model = model
         self.configs = configs
+        # Routage optionnel : `model` n'est alors qu'un nom (ex : "auto") et
+        # le modèle puissant sert de modèle par défaut
+        self.router = router
+        self.default_model = router.strong_model if router is not None else model
         self.agent = None
+        # Agents ReAct par modèle (routage) et sous-ensemble d'outils, créés à la demande
+        self.agents = OrderedDict()
+        self.streaming_agents = OrderedDict()
+        # Sélection des k outils pertinents par requête (créée à l'initialisation)
+        self.tool_selection = tool_selection
+        self.tool_selector = None
         self.tools = None
-
-    async def initialize(self):
+        # Sessions MCP longue durée, dimensionnées par serveur
+        self.pool = MCPSessionPool(configs, pool_sizes)
+        # Mode d'interprétation par défaut (none, compact, full)
+        self.interpretation_mode = interpretation_mode
+        self.skip_if_answered = skip_if_answered
+        # Cache de réponses optionnel (AnswerCache), partageable entre agents
+        self.answer_cache = answer_cache
+        # Cache des résultats Cypher optionnel, partageable entre agents
+        self.cypher_cache = cypher_cache
+        # Contexte de schéma : partagé s'il est fourni, sinon propre à l'agent
+        self._owns_schema_context = schema_context is None and SCHEMA_CONTEXT_ENABLED
+        self.schema_context = SchemaContext() if self._owns_schema_context else schema_context
+        # Mémoire des conversations : partagée si elle est fournie, sinon propre à l'agent
+        self._owns_session_memory = session_memory is None
+        self.session_memory = SessionMemory() if session_memory is None else session_memory
+        # Chemin direct (une requête Cypher générée) tenté avant l'agent
+        self.direct_cypher = DirectCypher(self.schema_context) if direct_cypher else None
+        # Verrou "single-flight" : une seule initialisation même si
+        # plusieurs requêtes concurrentes arrivent sur un agent froid
+        self._init_lock = asyncio.Lock()
+        # Trace de la dernière initialisation hors requête
+        self.startup_trace = None
+
+    async def initialize(self, trace: Trace | None = None):
         """
         Initialise l’agent avec tous les outils MCP.
+        Les appels concurrents attendent la même initialisation.
+        Les étapes sont chronométrées dans `trace` (ou `self.startup_trace`).
+        """
+        async with self._init_lock:
+            if self.agent:
+                return self
+            if trace is None:
+                trace = self.startup_trace = Trace("initialize", {"model": self.model})
+
+            # Chargement des outils MCP : chaque appel passe par le pool de
+            # sessions (pas de nouveau sous-processus par appel d'outil)
+            with trace.span("tool_loading", servers=len(self.configs)) as span:
+                self.tools = await self.pool.get_tools()
+                span.attributes["tools"] = len(self.tools)
+
+            # Lectures Cypher mémoïsées, invalidées par les outils en écriture
+            if self.cypher_cache is not None:
+                self.tools = self.cypher_cache.wrap_tools(self.tools)
+
+            # Schéma lu une seule fois puis rafraîchi (minuteur, écritures) ;
+            # serveurs lancés à la demande : première lecture au premier prompt
+            if self.schema_context is not None:
+                with trace.span("schema_context"):
+                    await self.schema_context.start(self.tools, refresh=not self.pool.lazy)
+
+            if self.tool_selection:
+                self.tool_selector = ToolSelector(self.tools, embeddings=tool_selector_embeddings())
+
+            # Driver poolé (celui du schéma si possible) ou outil MCP de lecture
+            if self.direct_cypher is not None:
+                await self.direct_cypher.start(self.tools)
+
+            # Création de l’agent ReAct (raisonnement + actions)
+            self.agent = self.get_agent(self.default_model)
+            return self
+
+    def get_agent(self, model: str, streaming: bool = False, tool_names: tuple | None = None,
+                  session: bool = False):
+        """
+        Retourne l'agent ReAct de ce modèle (créé au premier appel), sur
+        les outils déjà chargés ou sur le sous-ensemble `tool_names`.
+        Les agents de session lisent et écrivent l'historique dans le
+        checkpointer de la mémoire des sessions.
+        """
+        agents = self.streaming_agents if streaming else self.agents
+        key = (model, tool_names, session)
+        if key in agents:
+            agents.move_to_end(key)
+            return agents[key]
+        tools = self.tool_selector.subset(tool_names) if tool_names is not None else self.tools
+        agents[key] = create_react_agent(
+            get_model(model, streaming=streaming),
+            tools,
+            prompt=self.get_prompt(),
+            checkpointer=self.session_memory.checkpointer if session else None
+        )
+        while len(agents) > MAX_CACHED_AGENTS:
+            agents.popitem(last=False)
+        return agents[key]
+
+    async def select_tools(self, request: str, trace: Trace) -> tuple | None:
+        """
+        Outils à lier à l'agent pour cette requête (None : tous).
+        """
+        if self.tool_selector is None:
+            return None
+        with trace.span("tool_selection") as span:
+            tool_names = await self.tool_selector.select(request)
+            span.attributes.update(tools=len(tool_names), selected=",".join(tool_names))
+        return tool_names
+
+    async def invoke_agent(self, model: str, request: str, callbacks: list,
+                           tool_names: tuple | None = None, session=None):
+        """
+        Boucle ReAct sur `model`. Dans une session, l'agent part de
+        l'historique validé ; un tour inachevé est annulé.
         """
-        # Chargement élégant des outils MCP
-        self.tools = await get_multi_tools(self.configs)
+        if session is None:
+            return await self.get_agent(model, tool_names=tool_names).ainvoke(
+                {"messages": request},
+                {"callbacks": callbacks}
+            )
+        try:
+            return await self.get_agent(model, tool_names=tool_names, session=True).ainvoke(
+                {"messages": request},
+                {"callbacks": callbacks, **session.config}
+            )
+        except BaseException:
+            await self.session_memory.rollback(session)
+            raise
+
+    def open_session(self, session_id: str | None):
+        """
+        Contexte de la session `session_id` (None sans session).
+        """
+        return self.session_memory.open(session_id) if session_id else nullcontext()
+
+    def get_prompt(self):
+        """
+        Prompt de l'agent : résumé du schéma si disponible, sinon aucun.
+        """
+        return self.schema_context.prompt if self.schema_context is not None else None
 
-        # Création de l’agent ReAct (raisonnement + actions)
-        self.agent = create_react_agent(
-            get_model(self.model),
-            self.tools
+    async def interpret(self, agent_response, request: str, mode: str | None = None,
+                        callbacks: list | None = None, model: str | None = None) -> tuple[str, str]:
+        """
+        Interprète la réponse brute selon le mode choisi (avec `model`, par
+        défaut le modèle de l'agent).
+        Retourne la réponse et le mode effectivement appliqué
+        ("skipped" si la réponse de l'agent suffisait déjà).
+        """
+        mode = mode or self.interpretation_mode
+        if mode != "none" and self.skip_if_answered:
+            final_answer = get_final_answer(agent_response)
+            if answers_question(final_answer, request):
+                return final_answer, "skipped"
+        interpreted = await interpret_agent_response(
+            agent_response,
+            request,
+            model or self.default_model,
+            mode,
+            callbacks
         )
-        return self
+        return interpreted, mode
 
-    async def run_request(self, request: str, with_logging: bool = False) -> dict:
+    def cache_variant(self, interpretation_mode: str | None = None) -> str:
+        """
+        Options qui changent la réponse à une même question, ajoutées à la
+        clé du cache de réponses : mode d'interprétation et routage.
+        """
+        variant = f"interpretation={interpretation_mode or self.interpretation_mode}"
+        if self.router is not None:
+            variant += (f";route={self.router.fast_model}>{self.router.strong_model}"
+                        f";classifier={self.router.classifier}")
+        return variant
+
+    async def get_cached_result(self, request: str, start_time: float,
+                                interpretation_mode: str | None = None) -> dict | None:
         """
-        Exécute une requête utilisateur avec ou sans logging détaillé.
+        Retourne la réponse en cache pour cette requête (ou None).
+        """
+        if self.answer_cache is None:
+            return None
+        cached = await self.answer_cache.get(request, self.model, self.cache_variant(interpretation_mode))
+        if cached is None:
+            return None
+        return {
+            "raw": cached["raw"],
+            "answer": cached["answer"],
+            "cache": cached["cache"],
+            "interpretation_mode": "cached",
+            "path": "cache",
+            "agent_seconds": 0.0,
+            "interpretation_seconds": 0.0,
+            "seconds_to_complete": round(time.time() - start_time, 2)
+        }
+
+    async def update_answer_cache(self, request: str, agent_response, result: dict, generation: int,
+                                  store: bool = True, interpretation_mode: str | None = None):
+        """
+        Vide le cache si l'agent a écrit dans le graphe, sinon y enregistre
+        la réponse (sauf `store=False` : question de suivi, qui dépend de
+        l'historique de la session).
+        """
+        if self.answer_cache is None:
+            return
+        if has_write_tool_calls(agent_response):
+            self.answer_cache.invalidate()
+        elif store:
+            await self.answer_cache.set(request, self.model, result, generation,
+                                        self.cache_variant(interpretation_mode))
+
+    async def run_request(self, request: str, with_logging: bool = False,
+                          interpretation_mode: str | None = None, session_id: str | None = None) -> dict:
+        """
+        Exécute une requête utilisateur. Chaque étape (initialisation,
+        appels LLM, appels d'outils, interprétation) est enregistrée comme
+        span ; `with_logging` affiche l'arbre des spans.
+        Avec `session_id`, la requête poursuit la conversation de cette
+        session (voir session_memory).
+        """
+        start_time = time.time()
+        trace = Trace("request", {"model": self.model, "request": request,
+                                  **({"session_id": session_id} if session_id else {})})
+        REQUESTS_IN_FLIGHT.inc(model=self.model)
+
+        try:
+            async with self.open_session(session_id) as session:
+                # Une question de suivi dépend de l'historique : ni cache ni chemin direct
+                follow_up = session is not None and session.follow_up
+
+                # Réponse déjà connue : ni boucle ReAct ni interprétation
+                if not follow_up:
+                    with trace.span("answer_cache") as span:
+                        cached = await self.get_cached_result(request, start_time, interpretation_mode)
+                        span.attributes["hit"] = cached is not None
+                    if cached is not None:
+                        return self.finish_trace(trace, await self.record_turn(session, request, cached), with_logging)
+                generation = self.answer_cache.generation if self.answer_cache is not None else 0
+
+                if not self.agent:
+                    await self.initialize(trace)
+
+                start_time = time.time()
+                callbacks = [TracingCallbackHandler(trace)]
+
+                # Chemin direct : une requête Cypher validée, sans boucle ReAct
+                direct_fallback = None
+                if self.direct_cypher is not None and not follow_up:
+                    result, direct_fallback = await self.run_direct(request, trace, callbacks, start_time)
+                    if result is not None:
+                        await self.update_answer_cache(request, result["raw"], result, generation,
+                                                       interpretation_mode=interpretation_mode)
+                        return self.finish_trace(trace, await self.record_turn(session, request, result), with_logging)
+
+                # Dans une session, les outils liés ne font que s'étendre (préfixe stable)
+                tool_names = await self.select_tools(request, trace)
+                if session is not None:
+                    tool_names = session.pin_tools(tool_names)
+                if self.router is not None:
+                    agent_response, model, routing = await self.run_routed(
+                        request, trace, callbacks, tool_names, session
+                    )
+                else:
+                    with trace.span("agent"):
+                        agent_response = await self.invoke_agent(
+                            self.default_model, request, callbacks, tool_names, session
+                        )
+                    model, routing = self.default_model, {}
+                agent_seconds = time.time() - start_time
+
+                # Historique validé ; la suite ne porte que sur le tour courant
+                if session is not None:
+                    await self.session_memory.commit(session, agent_response, model)
+                    agent_response = current_turn(agent_response)
+
+                with trace.span("interpretation") as span:
+                    interpreted, mode = await self.interpret(
+                        agent_response,
+                        request,
+                        interpretation_mode,
+                        callbacks,
+                        model
+                    )
+                    span.attributes["mode"] = mode
+
+                total_seconds = time.time() - start_time
+
+                result = {
+                    "raw": agent_response,
+                    "answer": interpreted,
+                    "interpretation_mode": mode,
+                    "path": "agent",
+                    "direct_fallback": direct_fallback,
+                    **routing,
+                    "tools_bound": len(tool_names) if tool_names is not None else len(self.tools),
+                    "session": session.info() if session is not None else None,
+                    "agent_seconds": round(agent_seconds, 2),
+                    "interpretation_seconds": round(total_seconds - agent_seconds, 2),
+                    "seconds_to_complete": round(total_seconds, 2)
+                }
+                await self.update_answer_cache(request, agent_response, result, generation, store=not follow_up,
+                                               interpretation_mode=interpretation_mode)
+                return self.finish_trace(trace, result, with_logging)
+        except BaseException as e:
+            self.fail_trace(trace, e)
+            raise
+        finally:
+            REQUESTS_IN_FLIGHT.dec(model=self.model)
+
+    async def record_turn(self, session, request: str, result: dict) -> dict:
+        """
+        Ajoute à la session un tour répondu sans l'agent (cache, chemin direct).
+        """
+        if session is None:
+            return result
+        await self.session_memory.record(session, request, result["answer"], session.model or self.default_model)
+        return {**result, "session": session.info()}
+
+    async def run_direct(self, request: str, trace: Trace, callbacks: list,
+                         start_time: float) -> tuple[dict | None, str | None]:
+        """
+        Tente le chemin direct (voir direct_cypher). Retourne le résultat, ou
+        None et la raison du renvoi vers l'agent complet.
+        """
+        model = self.router.fast_model if self.router is not None else self.default_model
+        with trace.span("direct_cypher") as span:
+            state, answer, cypher = await self.direct_cypher.answer(request, model, trace, callbacks)
+            if state is None:
+                span.attributes["fallback"] = answer
+                return None, answer
+        total_seconds = time.time() - start_time
+        return {
+            "raw": state,
+            "answer": answer,
+            "interpretation_mode": "none",
+            "path": "direct",
+            "cypher": cypher,
+            "agent_seconds": round(total_seconds, 2),
+            "interpretation_seconds": 0.0,
+            "seconds_to_complete": round(total_seconds, 2)
+        }, None
+
+    async def run_routed(self, request: str, trace: Trace, callbacks: list,
+                         tool_names: tuple | None = None, session=None) -> tuple:
+        """
+        Boucle ReAct sur le modèle choisi par le routeur. Si le modèle rapide
+        échoue (exception, Cypher invalide, pas de réponse), la question est
+        reprise par le modèle puissant, avec tous les outils.
+        Une session passée au modèle puissant y reste (même préfixe de prompt).
+        Retourne la réponse brute, le modèle utilisé et les informations de routage.
+        """
+        with trace.span("routing", classifier=self.router.classifier) as span:
+            route, model = await self.router.route(request)
+            if session is not None and session.model == self.router.strong_model:
+                model = self.router.strong_model
+            span.attributes.update(route=route, routed_model=model)
+
+        fallback = None
+        try:
+            with trace.span("agent", model=model):
+                agent_response = await self.invoke_agent(model, request, callbacks, tool_names, session)
+            if model != self.router.strong_model:
+                fallback = self.check_fallback(agent_response, request, session)
+        except Exception as e:
+            if model == self.router.strong_model:
+                raise
+            fallback = f"exception:{type(e).__name__}"
+
+        if fallback is not None:
+            model = await self.start_fallback(model, fallback, session)
+            with trace.span("agent", model=model, fallback=fallback):
+                agent_response = await self.invoke_agent(model, request, callbacks, session=session)
+        if session is not None:
+            session.model = model
+        return agent_response, model, {"route": route, "routed_model": model, "fallback": fallback}
+
+    def check_fallback(self, agent_response, request: str, session=None) -> str | None:
+        """
+        Raison de reprendre la réponse du modèle rapide (None : acceptée).
+        Sans outil, une réponse est admise si le prompt contient le schéma
+        ou si c'est une question de suivi (l'historique suffit).
+        """
+        return needs_fallback(
+            agent_response, request,
+            follow_up=session is not None and session.follow_up,
+            schema_context=self.schema_context is not None and bool(self.schema_context.summary)
+        )
+
+    async def start_fallback(self, model: str, fallback: str, session=None) -> str:
+        """
+        Prépare la reprise par le modèle puissant : compte la reprise,
+        annule le tour de la session, qui garde ensuite tous les outils.
+        Retourne le modèle puissant.
+        """
+        self.router.record_fallback(model, fallback.split(":")[0])
+        if session is not None:
+            await self.session_memory.rollback(session)
+            session.pin_tools(tuple(tool.name for tool in self.tools) if self.tool_selector is not None else None)
+        return self.router.strong_model
+
+    def answering_model(self, trace: Trace) -> str:
+        """
+        Modèle qui a répondu (avec le routeur : modèle routé, ou modèle
+        puissant après une reprise), pour étiqueter les métriques. Nom de
+        l'agent si aucun modèle n'a été appelé (réponse en cache).
+        """
+        for name in ("agent", "llm"):
+            models = [span.attributes["model"] for span in trace.spans
+                      if span.name == name and span.attributes.get("model")]
+            if models:
+                return models[-1]
+        return self.model
+
+    def finish_trace(self, trace: Trace, result: dict, with_logging: bool = False) -> dict:
+        """
+        Clôt la trace, l'exporte (si configuré), met à jour les métriques
+        et ajoute les spans au résultat.
+        """
+        trace.finish()
+        export_trace(trace)
+        model = self.answering_model(trace)
+        record_trace(model, trace)
+        status = "cached" if result.get("cache") else "success"
+        REQUEST_SECONDS.observe(trace.root.seconds, model=model, status=status)
+        PATH_SECONDS.observe(trace.root.seconds, model=model, path=result.get("path", "agent"))
+        if with_logging:
+            print(f"\n{'='*50}\nRequête : {trace.root.attributes.get('request')}\n{'='*50}")
+            print(trace.format())
+            print(f"\nRéponse finale ({result.get('interpretation_mode')}) :\n{result.get('answer')}")
+        return {**result, "trace_id": trace.trace_id, "spans": trace.to_dicts()}
+
+    def fail_trace(self, trace: Trace, error: BaseException):
+        """
+        Clôt la trace d'une requête en échec et compte l'erreur par type.
+        """
+        trace.finish(error)
+        export_trace(trace)
+        model = self.answering_model(trace)
+        record_trace(model, trace)
+        REQUEST_ERRORS.inc(model=model, exception=type(error).__name__)
+        REQUEST_SECONDS.observe(trace.root.seconds, model=model, status="error")
+
+    async def run_batch(self, requests: list[str], concurrency: int = 4,
+                        interpretation_mode: str | None = None, admission=None):
+        """
+        Exécute plusieurs requêtes en parallèle (au plus `concurrency` à la
+        fois) sur les sessions MCP et le modèle de l'agent, et émet chaque
+        résultat dès qu'il est prêt, avec son index et ses durées
+        (`queued_seconds` : attente, `seconds` : exécution).
+        `admission` : fabrique optionnelle d'un contexte asynchrone entourant
+        chaque requête (ex : créneau de l'ordonnanceur de l'API).
         """
         if not self.agent:
             await self.initialize()
 
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        batch_start = time.time()
+
+        async def run_item(index: int, request: str) -> dict:
+            item = {"index": index, "request": request}
+            started = None
+            async with semaphore:
+                try:
+                    async with (admission() if admission is not None else nullcontext()):
+                        started = time.time()
+                        result = await self.run_request(request, interpretation_mode=interpretation_mode)
+                    item.update(result, status="success")
+                except Exception as e:
+                    item.update(status="error", error=str(e), error_type=type(e).__name__)
+                finished = time.time()
+                started = started or finished
+                item["queued_seconds"] = round(started - batch_start, 3)
+                item["seconds"] = round(finished - started, 3)
+            return item
+
+        tasks = [asyncio.create_task(run_item(i, r)) for i, r in enumerate(requests)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Consommateur parti (ex : client HTTP déconnecté) : on abandonne le reste
+            for task in tasks:
+                task.cancel()
+
+    async def stream_request(self, request: str, interpretation_mode: str | None = None,
+                             session_id: str | None = None):
+        """
+        Exécute une requête en émettant les étapes de l'agent au fil de l'eau
+        (via LangGraph `astream_events`) : début/fin des appels d'outils,
+        texte Cypher, tokens du LLM, puis la réponse finale et les durées.
+        Avec `session_id`, la requête poursuit la conversation de cette session.
+        """
+        trace = Trace("request", {"model": self.model, "request": request, "streaming": True,
+                                  **({"session_id": session_id} if session_id else {})})
+        REQUESTS_IN_FLIGHT.inc(model=self.model)
+        try:
+            async with self.open_session(session_id) as session:
+                async for event in self._stream_events(request, interpretation_mode, trace, session):
+                    yield event
+        except BaseException as e:
+            self.fail_trace(trace, e)
+            raise
+        finally:
+            REQUESTS_IN_FLIGHT.dec(model=self.model)
+
+    async def _stream_agent(self, model: str, request: str, callbacks: list, tool_names: tuple | None,
+                            session, state: dict, start_time: float):
+        """
+        Boucle ReAct en streaming sur `model` : émet tokens et appels
+        d'outils, puis range l'état final dans `state["response"]` (et le
+        délai du premier token dans `state["first_token_seconds"]`).
+        Dans une session, un tour inachevé est annulé.
+        """
+        streaming_agent = self.get_agent(model, streaming=True, tool_names=tool_names, session=session is not None)
+        try:
+            async for event in streaming_agent.astream_events(
+                {"messages": request},
+                {"callbacks": callbacks, **(session.config if session is not None else {})},
+                version="v2"
+            ):
+                kind = event["event"]
+                data = event.get("data", {})
+
+                if kind == "on_chat_model_stream":
+                    content = extract_content(data.get("chunk"))
+                    if content:
+                        if state["first_token_seconds"] is None:
+                            state["first_token_seconds"] = round(time.time() - start_time, 3)
+                        yield {"type": "token", "stage": "agent", "content": content}
+
+                elif kind == "on_tool_start":
+                    tool_input = data.get("input") or {}
+                    yield {
+                        "type": "tool_start",
+                        "tool": event["name"],
+                        "server": event.get("metadata", {}).get("mcp_server"),
+                        "input": tool_input
+                    }
+                    # Texte Cypher envoyé au serveur neo4j-cypher
+                    if isinstance(tool_input, dict) and "query" in tool_input:
+                        yield {"type": "cypher", "tool": event["name"], "query": tool_input["query"]}
+
+                elif kind == "on_tool_end":
+                    yield {
+                        "type": "tool_end",
+                        "tool": event["name"],
+                        "output": extract_content(data.get("output"))
+                    }
+
+                # Fin du graphe racine : état final de l'agent
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    state["response"] = data.get("output")
+        except BaseException:
+            if session is not None:
+                await self.session_memory.rollback(session)
+            raise
+
+    async def _stream_events(self, request: str, interpretation_mode: str | None, trace: Trace,
+                             session=None):
         start_time = time.time()
+        # Une question de suivi dépend de l'historique : ni cache ni chemin direct
+        follow_up = session is not None and session.follow_up
+
+        # Réponse déjà connue : émise directement
+        cached = None
+        if not follow_up:
+            with trace.span("answer_cache") as span:
+                cached = await self.get_cached_result(request, start_time, interpretation_mode)
+                span.attributes["hit"] = cached is not None
+        if cached is not None:
+            cached = self.finish_trace(trace, await self.record_turn(session, request, cached))
+            yield {"type": "done", "first_token_seconds": cached["seconds_to_complete"],
+                   **{k: v for k, v in cached.items() if k != "raw"}}
+            return
+        generation = self.answer_cache.generation if self.answer_cache is not None else 0
 
-        if with_logging:
-            print(f"\n{'='*50}\nRequête : {request}\n{'='*50}")
-            callbacks = [ConsoleCallbackHandler()]
-
-            # Cas spécifique OpenAI (comptage de tokens)
-            if 'gpt' in self.model.lower():
-                with get_openai_callback() as cb:
-                    agent_response = await self.agent.ainvoke(
-                        {"messages": request},
-                        {"callbacks": callbacks}
-                    )
-                    print(f"\nUtilisation tokens : {cb}")
-            else:
-                agent_response = await self.agent.ainvoke(
-                    {"messages": request},
-                    {"callbacks": callbacks}
-                )
+        if not self.agent:
+            await self.initialize(trace)
 
-            print(f"\nRéponse brute :\n{agent_response}")
-            interpreted = await interpret_agent_response(
-                agent_response,
-                request,
-                self.model
-            )
-            print(f"\nRéponse finale :\n{interpreted}")
+        start_time = time.time()
+        callbacks = [TracingCallbackHandler(trace)]
+
+        # Chemin direct : requête et réponse émises d'un bloc
+        direct_fallback = None
+        if self.direct_cypher is not None and not follow_up:
+            result, direct_fallback = await self.run_direct(request, trace, callbacks, start_time)
+            if result is not None:
+                await self.update_answer_cache(request, result["raw"], result, generation,
+                                               interpretation_mode=interpretation_mode)
+                yield {"type": "cypher", "tool": "direct_cypher", "query": result["cypher"]}
+                result = self.finish_trace(trace, await self.record_turn(session, request, result))
+                yield {"type": "done", "first_token_seconds": result["seconds_to_complete"],
+                       **{k: v for k, v in result.items() if k != "raw"}}
+                return
+
+        # Routage : si le modèle rapide échoue, un événement "fallback" annonce
+        # la reprise par le modèle puissant (le client efface le brouillon émis)
+        model, routing = self.default_model, {}
+        if self.router is not None:
+            with trace.span("routing", classifier=self.router.classifier) as span:
+                route, model = await self.router.route(request)
+                if session is not None and session.model == self.router.strong_model:
+                    model = self.router.strong_model
+                span.attributes.update(route=route, routed_model=model)
+            routing = {"route": route, "routed_model": model, "fallback": None}
+            yield {"type": "route", "route": route, "model": model}
+
+        # Agent dont le LLM émet ses tokens un par un, sur les outils retenus
+        # (dans une session : ceux de la session, et l'historique validé)
+        tool_names = await self.select_tools(request, trace)
+        if session is not None:
+            tool_names = session.pin_tools(tool_names)
 
+        start_time = time.time()
+        state = {"first_token_seconds": None, "response": None}
+        fallback = None
+        try:
+            with trace.span("agent", model=model):
+                async for event in self._stream_agent(model, request, callbacks, tool_names, session,
+                                                      state, start_time):
+                    yield event
+            if self.router is not None and model != self.router.strong_model:
+                fallback = self.check_fallback(state["response"], request, session)
+        except Exception as e:
+            if self.router is None or model == self.router.strong_model:
+                raise
+            fallback = f"exception:{type(e).__name__}"
+
+        if fallback is not None:
+            model = await self.start_fallback(model, fallback, session)
+            # Comme run_routed : tous les outils (la session les garde épinglés)
+            tool_names = None
+            routing.update(routed_model=model, fallback=fallback)
+            yield {"type": "fallback", "reason": fallback, "model": model}
+            with trace.span("agent", model=model, fallback=fallback):
+                async for event in self._stream_agent(model, request, callbacks, tool_names, session,
+                                                      state, start_time):
+                    yield event
+        agent_response = state["response"]
+        first_token_seconds = state["first_token_seconds"]
+
+        agent_seconds = time.time() - start_time
+
+        # Historique validé ; la suite ne porte que sur le tour courant
+        if session is not None:
+            session.model = model
+            await self.session_memory.commit(session, agent_response, model)
+            agent_response = current_turn(agent_response)
+
+        # Interprétation : directe (none / skipped) ou second appel LLM en streaming
+        mode = interpretation_mode or self.interpretation_mode
+        final_answer = get_final_answer(agent_response)
+        if mode == "none" or (self.skip_if_answered and answers_question(final_answer, request)):
+            answer = final_answer
+            mode = mode if mode == "none" else "skipped"
         else:
-            agent_response = await self.agent.ainvoke(
-                {"messages": request}
-            )
-            interpreted = await interpret_agent_response(
-                agent_response,
-                request,
-                self.model
-            )
-
-        return {
-            "raw": agent_response,
-            "answer": interpreted,
-            "seconds_to_complete": round(time.time() - start_time, 2)
+            prompt = build_interpretation_prompt(agent_response, request, mode)
+            chunks = []
+            with trace.span("interpretation", mode=mode):
+                async for chunk in get_model(model, streaming=True).astream(
+                    prompt,
+                    {"callbacks": callbacks}
+                ):
+                    content = extract_content(chunk)
+                    if content:
+                        if first_token_seconds is None:
+                            first_token_seconds = round(time.time() - start_time, 3)
+                        chunks.append(content)
+                        yield {"type": "token", "stage": "interpretation", "content": content}
+                answer = "".join(chunks)
+
+        total_seconds = time.time() - start_time
+
+        result = {
+            "answer": answer,
+            "interpretation_mode": mode,
+            "path": "agent",
+            "direct_fallback": direct_fallback,
+            **routing,
+            "tools_bound": len(tool_names) if tool_names is not None else len(self.tools),
+            "session": session.info() if session is not None else None,
+            "agent_seconds": round(agent_seconds, 2),
+            "interpretation_seconds": round(total_seconds - agent_seconds, 2),
+            "seconds_to_complete": round(total_seconds, 2)
         }
+        await self.update_answer_cache(request, agent_response, {"raw": agent_response, **result}, generation,
+                                       store=not follow_up, interpretation_mode=interpretation_mode)
+        yield {"type": "done", "first_token_seconds": first_token_seconds, **self.finish_trace(trace, result)}
+
+    async def close(self):
+        """
+        Ferme proprement les sessions MCP (et les sous-processus associés).
+        """
+        async with self._init_lock:
+            if self.schema_context is not None:
+                if self._owns_schema_context:
+                    await self.schema_context.close()
+                else:
+                    self.schema_context.detach(self.tools)
+            if self.direct_cypher is not None:
+                await self.direct_cypher.close()
+            if self._owns_session_memory:
+                await self.session_memory.close()
+            await self.pool.close()
+            self.agent = None
+            self.agents.clear()
+            self.streaming_agents.clear()
+            self.tool_selector = None
+            self.tools = None
+
+    async def __aenter__(self):
+        return await self.initialize()
+
+    async def __aexit__(self, *exc):
+        await self.close()
 
 
 # ------------------------------------------------------------
@@ -216,9 +931,9 @@ if __name__ == "__main__":
 
     async def main():
         print("Initialisation de l’agent...")
-        agent = await MultiToolAgent(model, MCP_SERVER_CONFIGS).initialize()
-        print("Traitement de la requête...")
-        result = await agent.run_request(request)
-        print(result)
+        async with MultiToolAgent(model, MCP_SERVER_CONFIGS) as agent:
+            print("Traitement de la requête...")
+            result = await agent.run_request(request)
+            print(result)
 
     asyncio.run(main())
@@ -2,22 +2,23 @@
 # Imports MCP, LangChain, LangGraph et Ollama
 # ------------------------------------------------------------
 
-# Client MCP pour communiquer avec un serveur via stdio
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
-
-# Outils MCP utilisables par LangChain
-from langchain_mcp_adapters.tools import load_mcp_tools
+# Le client MCP (mcp, langchain_mcp_adapters) est importé à l'ouverture
+# de la session (AgentRunner) : importer ce module reste rapide.
 
 # Agent ReAct préconstruit (Reason + Act)
 from langgraph.prebuilt import create_react_agent
 
-# Modèle LLM local via Ollama
-from langchain_ollama import ChatOllama
+# Modèles LLM Ollama partagés (keep-alive, préchargement)
+from model_manager import MODEL_MANAGER
+
+# Types de messages LangChain (réponse finale, résultats d'outils)
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 
 # Librairies standard
+from contextlib import AsyncExitStack
 import asyncio
 import os
+import re
 
 # Chargement des variables d’environnement depuis un fichier .env
 from dotenv import load_dotenv
@@ -30,7 +31,7 @@ load_dotenv()
 
 # Paramètres du serveur MCP utilisant Neo4j + Cypher
 # La communication se fait via l'entrée/sortie standard (stdio)
-server_params = StdioServerParameters(
+server_params = dict(
     command="uvx",
     args=["mcp-neo4j-cypher@0.2.4", "--transport", "stdio"],
     transport="stdio",
@@ -42,15 +43,15 @@ server_params = StdioServerParameters(
 # Fonction utilitaire pour créer un modèle LLM Ollama
 # ------------------------------------------------------------
 
-def get_model(model_name):
+def get_model(model_name, streaming=False):
     """
-    Crée et retourne un modèle LLM via Ollama.
+    Retourne le modèle LLM Ollama partagé (instance réutilisée, keep_alive
+    par modèle, voir model_manager).
+    Le streaming (token par token) est désactivé par défaut pour compatibilité.
+    En mode hors ligne (OFFLINE_MODE=true), un modèle factice déterministe
+    est retourné à la place.
     """
-    return ChatOllama(
-        model=model_name,
-        temperature=0.0,   # Température basse pour des réponses déterministes
-        streaming=False   # Désactivation du streaming pour compatibilité
-    )
+    return MODEL_MANAGER.get(model_name, streaming)
 
 
 # ------------------------------------------------------------
@@ -65,78 +66,252 @@ def extract_content(val):
     return val.content if hasattr(val, "content") else str(val)
 
 
+# ------------------------------------------------------------
+# Extraction des éléments utiles de l'état LangGraph
+# ------------------------------------------------------------
+
+def get_messages(agent_response) -> list:
+    """
+    Retourne la liste des messages de l'état LangGraph (ou une liste vide).
+    """
+    if isinstance(agent_response, dict):
+        return list(agent_response.get("messages", []))
+    return []
+
+
+def get_final_answer(agent_response) -> str:
+    """
+    Retourne le contenu du dernier AIMessage sans appel d'outil.
+    """
+    for message in reversed(get_messages(agent_response)):
+        if isinstance(message, AIMessage) and not message.tool_calls:
+            return extract_content(message)
+    return ""
+
+
+def get_final_tool_outputs(agent_response) -> list[str]:
+    """
+    Retourne les sorties d'outils produites depuis la dernière question.
+    """
+    outputs = []
+    for message in reversed(get_messages(agent_response)):
+        if isinstance(message, HumanMessage):
+            break
+        if isinstance(message, ToolMessage):
+            outputs.append(extract_content(message))
+    return list(reversed(outputs))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Tronque un texte à un budget de tokens (approximation : 4 caractères par token).
+    """
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + " ...[truncated]"
+
+
 # ------------------------------------------------------------
 # Interprétation finale de la réponse brute de l'agent
 # ------------------------------------------------------------
 
-async def interpret_agent_response(agent_response, request, model_name="llama3.1"):
+# Modes d'interprétation :
+# - none    : renvoie directement le dernier message de l'agent
+# - compact : second appel LLM sur les dernières sorties d'outils uniquement
+# - full    : second appel LLM sur l'état LangGraph complet (historique)
+INTERPRETATION_MODES = ("none", "compact", "full")
+INTERPRETATION_MODE = os.getenv("INTERPRETATION_MODE", "full")
+
+# Budget (en tokens) du contexte envoyé en mode compact
+INTERPRETATION_TOKEN_BUDGET = int(os.getenv("INTERPRETATION_TOKEN_BUDGET", "1000"))
+
+# Saute la reformulation si la réponse de l'agent suffit déjà
+INTERPRETATION_SKIP_IF_ANSWERED = os.getenv("INTERPRETATION_SKIP_IF_ANSWERED", "false").lower() == "true"
+
+# Formulations indiquant que l'agent n'a pas vraiment répondu
+_NON_ANSWER_PATTERN = re.compile(
+    r"\b(i (?:can(?:no|')t|am unable|don't know|do not know)|unable to|not sure|"
+    r"error|no results?|let me|i will|i'll)\b",
+    re.IGNORECASE
+)
+
+
+def answers_question(answer: str, request: str) -> bool:
     """
-    Utilise un LLM pour reformuler et interpréter la réponse brute
-    générée par l'agent et les outils.
+    Heuristique : la réponse finale de l'agent répond-elle déjà à la question ?
     """
+    answer = answer.strip()
+    if not answer or len(answer) > 2000:
+        return False
+    # Réponse brute (JSON, Cypher) ou aveu d'échec : reformulation nécessaire
+    if answer[0] in "[{" or "MATCH " in answer.upper() or _NON_ANSWER_PATTERN.search(answer):
+        return False
+    # Les questions de comptage doivent recevoir un nombre
+    if re.search(r"\bhow (many|much)\b|\bcount\b|\bnumber of\b", request, re.IGNORECASE):
+        return bool(re.search(r"\d", answer))
+    return True
+
+
+def build_interpretation_context(agent_response, mode: str = "full",
+                                 max_tokens: int = INTERPRETATION_TOKEN_BUDGET) -> str:
+    """
+    Construit le contexte envoyé au LLM d'interprétation selon le mode.
+    """
+    if mode == "full":
+        return str(agent_response)
+    parts = [f"Tool output: {output}" for output in get_final_tool_outputs(agent_response)]
+    parts.append(f"Agent answer: {get_final_answer(agent_response)}")
+    return truncate_to_tokens("\n".join(parts), max_tokens)
 
-    # Initialisation du modèle LLM
-    llm = get_model(model_name)
 
-    # Prompt d'interprétation
-    prompt = (
+def build_interpretation_prompt(agent_response, request, mode: str = "full") -> str:
+    """
+    Construit le prompt du second appel LLM (reformulation).
+    """
+    return (
         "You are an expert assistant. Given the following user request and the raw agent/tool response, "
         "return the most appropriate response to answer the user request.\n"
         f"User request: {request}\n"
-        f"Agent/tool response: {agent_response}\n"
+        f"Agent/tool response: {build_interpretation_context(agent_response, mode)}\n"
         "Answer:"
     )
 
+
+async def interpret_agent_response(agent_response, request, model_name="llama3.1", mode="full",
+                                   callbacks=None):
+    """
+    Utilise un LLM pour reformuler et interpréter la réponse brute
+    générée par l'agent et les outils.
+    `callbacks` : callbacks LangChain optionnels (ex : traçage).
+    """
+    if mode not in INTERPRETATION_MODES:
+        raise ValueError(f"Mode d'interprétation inconnu : {mode} (attendu : {INTERPRETATION_MODES})")
+
+    # Pas de second appel LLM : la réponse finale de l'agent est renvoyée telle quelle
+    if mode == "none":
+        return get_final_answer(agent_response)
+
+    # Initialisation du modèle LLM
+    llm = get_model(model_name)
+
+    # Prompt d'interprétation
+    prompt = build_interpretation_prompt(agent_response, request, mode)
+
     # Appel asynchrone ou synchrone selon le modèle
+    config = {"callbacks": callbacks} if callbacks else None
     if hasattr(llm, "ainvoke"):
-        result = await llm.ainvoke(prompt)
+        result = await llm.ainvoke(prompt, config)
     else:
-        result = llm.invoke(prompt)
+        result = llm.invoke(prompt, config)
 
     # Extraction du texte final
     return extract_content(result)
 
 
 # ------------------------------------------------------------
-# Fonction principale : exécution de l'agent MCP + LLM
+# Exécuteur réutilisable : une session MCP pour plusieurs requêtes
 # ------------------------------------------------------------
 
-async def run_agent(request: str, model: str) -> dict:
-    """
-    Exécute un agent LangGraph avec des outils MCP
-    et retourne la réponse brute et interprétée.
+class AgentRunner:
     """
+    Ouvre la session MCP une seule fois et répond à plusieurs requêtes.
+
+    Le sous-processus MCP, l'initialisation de la session et le chargement
+    des outils ne sont payés qu'à l'entrée du context manager ; les agents
+    ReAct compilés sont conservés par modèle.
 
-    # Connexion au serveur MCP via stdio
-    async with stdio_client(server_params) as (read, write):
+        async with AgentRunner() as runner:
+            for request in requests:
+                result = await runner.run(request, model)
+    """
 
-        # Création d'une session MCP
-        async with ClientSession(read, write) as session:
+    def __init__(self, params: dict = server_params):
+        # Arguments de StdioServerParameters
+        self.params = params
+        self.session = None
+        self.tools = None
+        self.agents = {}
+        self._stack = None
+
+    async def __aenter__(self):
+        from mcp import ClientSession, StdioServerParameters
+        from mcp.client.stdio import stdio_client
+        from langchain_mcp_adapters.tools import load_mcp_tools
+
+        self._stack = AsyncExitStack()
+        try:
+            # Connexion au serveur MCP via stdio
+            read, write = await self._stack.enter_async_context(
+                stdio_client(StdioServerParameters(**self.params))
+            )
 
-            # Initialisation de la session
-            await session.initialize()
+            # Création et initialisation de la session MCP
+            self.session = await self._stack.enter_async_context(
+                ClientSession(read, write)
+            )
+            await self.session.initialize()
 
             # Chargement des outils MCP disponibles (ex: Neo4j Cypher)
-            tools = await load_mcp_tools(session)
+            self.tools = await load_mcp_tools(self.session)
+        except BaseException:
+            await self._stack.aclose()
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self.agents.clear()
+        self.session = None
+        self.tools = None
+        await self._stack.aclose()
+
+    def get_agent(self, model: str):
+        """
+        Retourne l'agent ReAct compilé pour ce modèle (créé au premier appel).
+        """
+        if model not in self.agents:
+            self.agents[model] = create_react_agent(get_model(model), self.tools)
+        return self.agents[model]
+
+    async def run(self, request: str, model: str, interpretation_mode: str = INTERPRETATION_MODE) -> dict:
+        """
+        Exécute une requête sur la session partagée
+        et retourne la réponse brute et interprétée.
+        """
+        if self.session is None:
+            raise RuntimeError("AgentRunner doit être utilisé avec 'async with'")
+
+        # Envoi de la requête utilisateur à l'agent
+        agent_response = await self.get_agent(model).ainvoke({"messages": request})
+
+        # Interprétation finale de la réponse
+        interpreted = await interpret_agent_response(
+            agent_response,
+            request,
+            model,
+            interpretation_mode
+        )
+
+        # Retour des deux versions de la réponse
+        return {
+            "raw": agent_response,
+            "answer": interpreted
+        }
 
-            # Création de l'agent ReAct (raisonnement + actions)
-            agent = create_react_agent(get_model(model), tools)
 
-            # Envoi de la requête utilisateur à l'agent
-            agent_response = await agent.ainvoke({"messages": request})
+# ------------------------------------------------------------
+# Fonction principale : exécution de l'agent MCP + LLM
+# ------------------------------------------------------------
 
-            # Interprétation finale de la réponse
-            interpreted = await interpret_agent_response(
-                agent_response,
-                request,
-                model
-            )
+async def run_agent(request: str, model: str) -> dict:
+    """
+    Exécute un agent LangGraph avec des outils MCP
+    et retourne la réponse brute et interprétée.
 
-            # Retour des deux versions de la réponse
-            return {
-                "raw": agent_response,
-                "answer": interpreted
-            }
+    Pour plusieurs requêtes, préférer `AgentRunner` qui réutilise la session.
+    """
+    async with AgentRunner() as runner:
+        return await runner.run(request, model)
 
 
 # ------------------------------------------------------------
@@ -1,8 +1,10 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from neo4j import GraphDatabase
-from collections import defaultdict
-import requests
-import asyncio
+from answer_cache import is_write_tool_call
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import httpx
 import os
 
 # Load environment vars from .env
@@ -11,41 +13,178 @@ load_dotenv()
 
 # For graph visualization
 from pyvis.network import Network
-import tempfile
+import streamlit.components.v1 as components
+import hashlib
+import json
 
 
-# Update options from `ollama list` here
-MODEL_OPTIONS = ["llama3.2", "mistral", "qwen3"]
+# Update options from `ollama list` here ("auto" routes each question to a fast or strong model)
+MODEL_OPTIONS = ["llama3.2", "mistral", "qwen3", "auto"]
 
-def get_neo4j_graph():
+# Longest silence allowed between two streamed events from the API
+STREAM_READ_TIMEOUT = float(os.getenv("STREAM_READ_TIMEOUT", "120"))
+
+# Graph viewer settings
+GRAPH_PAGE_SIZE = int(os.getenv("GRAPH_PAGE_SIZE", "200"))
+GRAPH_CACHE_TTL = float(os.getenv("GRAPH_CACHE_TTL", "60"))
+GRAPH_EDGE_LIMIT = int(os.getenv("GRAPH_EDGE_LIMIT", "1000"))
+GRAPH_EXPAND_LIMIT = int(os.getenv("GRAPH_EXPAND_LIMIT", "50"))
+# "component": persistent vis.js view updated with diffs; "pyvis": in-memory pyvis HTML
+GRAPH_RENDERER = os.getenv("GRAPH_RENDERER", "component")
+GRAPH_HEIGHT = 500
+
+# Streamlit component kept mounted across reruns (see graph_component/index.html)
+graph_viewer = components.declare_component(
+    "graph_viewer",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "graph_component")
+)
+
+# Nodes page with the outgoing relationships of those nodes. Nodes are
+# looked up by internal id in the window ($after, $after + $window]: each
+# lookup is a NodeByIdSeek, so a page costs O(window) whatever the graph
+# size (a keyset on elementId scanned and sorted every node for each page).
+GRAPH_PAGE_QUERY = """
+UNWIND range($after + 1, $after + $window) AS node_id
+MATCH (n) WHERE id(n) = node_id
+WITH n, node_id ORDER BY node_id LIMIT $page_size
+OPTIONAL MATCH (n)-[r]->(m)
+WITH n, node_id, collect({r: r, m: elementId(m)})[..$edge_limit] AS rels
+RETURN n, node_id, rels
+"""
+
+# Highest node id, where paging stops (one node scan per graph version, not per page)
+GRAPH_MAX_ID_QUERY = "MATCH (n) RETURN max(id(n)) AS max_id"
+
+# One node's neighborhood, both directions
+GRAPH_NEIGHBORHOOD_QUERY = """
+MATCH (n) WHERE elementId(n) = $node_id
+OPTIONAL MATCH (n)-[r]-(m)
+WITH n, r, m LIMIT $limit
+RETURN n, r, m
+"""
+
+@st.cache_resource(show_spinner=False)
+def get_neo4j_driver():
+    """
+    One pooled driver per Streamlit server process, reused across reruns and sessions.
+    """
     uri = os.environ.get("NEO4J_URI")
     user = os.environ.get("NEO4J_USERNAME")
     password = os.environ.get("NEO4J_PASSWORD")
+    return GraphDatabase.driver(uri, auth=(user, password))
+
+def node_to_dict(node) -> dict:
+    # Temporal/spatial values are stringified so pages can be cached (pickled)
+    return {
+        "name": node.get("name", node.element_id),
+        "labels": sorted(node.labels),
+        "properties": {
+            k: v if isinstance(v, (str, int, float, bool, list)) else str(v)
+            for k, v in node.items()
+        },
+    }
+
+def rel_to_dict(rel) -> dict:
+    return {"src": rel.start_node.element_id, "dst": rel.end_node.element_id, "type": rel.type}
+
+@st.cache_data(ttl=GRAPH_CACHE_TTL, show_spinner=False, max_entries=16)
+def get_max_node_id(graph_version: int = 0) -> int:
+    database = os.environ.get("NEO4J_DATABASE", "neo4j")
+    with get_neo4j_driver().session(database=database) as session:
+        max_id = session.run(GRAPH_MAX_ID_QUERY).single()["max_id"]
+    return -1 if max_id is None else max_id
+
+@st.cache_data(ttl=GRAPH_CACHE_TTL, show_spinner=False, max_entries=256)
+def get_neo4j_graph(after: int = -1, page_size: int = GRAPH_PAGE_SIZE, graph_version: int = 0) -> dict:
+    """
+    Load one page of nodes (including isolated ones) with internal id above
+    the `after` cursor, with their outgoing relationships. Windows of ids
+    are read until the page is full, so gaps left by deleted nodes only
+    cost extra round trips.
+
+    `graph_version` is only part of the cache key: bumping it after a write
+    makes the next rerun reload every page on screen (the reload itself is
+    not incremental; graph_delta and vis_diff then keep the caption and the
+    browser update to what changed).
+
+    Returns:
+        dict: {"nodes": {id: node}, "edges": {id: edge}, "next": cursor or None}
+    """
     database = os.environ.get("NEO4J_DATABASE", "neo4j")
-    driver = GraphDatabase.driver(uri, auth=(user, password))
-    nodes = {}
-    node_labels = defaultdict(set)
-    node_properties = {}  # node_id -> dict of properties
-    edges = []
-    with driver.session(database=database) as session:
-        result = session.run("MATCH (n)-[r]->(m) RETURN n, r, m LIMIT 100")
-        for record in result:
-            n = record["n"]
-            m = record["m"]
-            r = record["r"]
-            n_id = n.element_id if hasattr(n, 'element_id') else str(n.id)
-            m_id = m.element_id if hasattr(m, 'element_id') else str(m.id)
-            n_labels = list(n.labels) if hasattr(n, 'labels') else []
-            m_labels = list(m.labels) if hasattr(m, 'labels') else []
-            nodes[n_id] = n.get("name", n_id)
-            nodes[m_id] = m.get("name", m_id)
-            node_labels[n_id].update(n_labels)
-            node_labels[m_id].update(m_labels)
-            node_properties[n_id] = dict(n.items())
-            node_properties[m_id] = dict(m.items())
-            edges.append((n_id, m_id, r.type))
-    driver.close()
-    return nodes, node_labels, node_properties, edges
+    max_id = get_max_node_id(graph_version)
+    nodes, edges = {}, {}
+    cursor = after
+    with get_neo4j_driver().session(database=database) as session:
+        while len(nodes) < page_size and cursor < max_id:
+            limit = page_size - len(nodes)
+            result = session.run(GRAPH_PAGE_QUERY, after=cursor, window=page_size, page_size=limit,
+                                 edge_limit=GRAPH_EDGE_LIMIT)
+            records = list(result)
+            for record in records:
+                n = record["n"]
+                nodes[n.element_id] = node_to_dict(n)
+                for item in record["rels"]:
+                    if item["r"] is not None:
+                        edges[item["r"].element_id] = {"src": n.element_id, "dst": item["m"], "type": item["r"].type}
+            # A full page may stop inside the window: resume after its last node
+            cursor = records[-1]["node_id"] if len(records) == limit else cursor + page_size
+    return {"nodes": nodes, "edges": edges, "next": cursor if cursor < max_id else None}
+
+@st.cache_data(ttl=GRAPH_CACHE_TTL, show_spinner=False, max_entries=256)
+def get_neighborhood(node_id: str, limit: int = GRAPH_EXPAND_LIMIT, graph_version: int = 0) -> dict:
+    """
+    Load a node and up to `limit` of its neighbors (neighborhood expansion).
+    """
+    database = os.environ.get("NEO4J_DATABASE", "neo4j")
+    nodes, edges = {}, {}
+    with get_neo4j_driver().session(database=database) as session:
+        for record in session.run(GRAPH_NEIGHBORHOOD_QUERY, node_id=node_id, limit=limit):
+            nodes[record["n"].element_id] = node_to_dict(record["n"])
+            if record["r"] is not None:
+                nodes[record["m"].element_id] = node_to_dict(record["m"])
+                edges[record["r"].element_id] = rel_to_dict(record["r"])
+    return {"nodes": nodes, "edges": edges, "next": None}
+
+def load_visible_graph() -> dict:
+    """
+    Merge the pages and neighborhoods currently on screen. Edges are kept
+    only when both ends are displayed.
+    """
+    version = st.session_state.graph_version
+    parts = [get_neo4j_graph(cursor, GRAPH_PAGE_SIZE, version) for cursor in st.session_state.graph_cursors]
+    parts += [get_neighborhood(node_id, GRAPH_EXPAND_LIMIT, version) for node_id in st.session_state.expanded_nodes]
+    nodes, edges = {}, {}
+    for part in parts:
+        nodes.update(part["nodes"])
+        edges.update(part["edges"])
+    edges = {k: e for k, e in edges.items() if e["src"] in nodes and e["dst"] in nodes}
+    next_cursor = parts[len(st.session_state.graph_cursors) - 1]["next"] if st.session_state.graph_cursors else None
+    return {"nodes": nodes, "edges": edges, "next": next_cursor, "version": version}
+
+def graph_delta(old: dict | None, new: dict) -> dict:
+    """
+    Nodes and edges added or removed between two loads of the visible graph.
+    """
+    old = old or {"nodes": {}, "edges": {}}
+    return {
+        "added_nodes": [k for k in new["nodes"] if k not in old["nodes"]],
+        "removed_nodes": [k for k in old["nodes"] if k not in new["nodes"]],
+        "changed_nodes": [k for k, v in new["nodes"].items() if k in old["nodes"] and old["nodes"][k] != v],
+        "added_edges": [k for k in new["edges"] if k not in old["edges"]],
+        "removed_edges": [k for k in old["edges"] if k not in new["edges"]],
+    }
+
+def response_wrote_graph(result: dict) -> bool:
+    """
+    True if the agent called a write tool while answering (from the response spans).
+    """
+    return any(
+        span.get("name") == "tool" and is_write_tool_call(
+            span["attributes"].get("tool", ""),
+            {"query": span["attributes"].get("input", "")}
+        )
+        for span in result.get("spans", [])
+    )
 
 def get_label_colors(label_set):
     # Dynamically generate a unique color for each label using HSL
@@ -59,29 +198,92 @@ def get_label_colors(label_set):
         colors[label] = color
     return colors
 
-def update_graph_from_neo4j(net):
-    nodes, node_labels, node_properties, edges = get_neo4j_graph()
-    all_labels = set(l for labels in node_labels.values() for l in labels)
+def graph_hash(graph: dict) -> str:
+    """
+    Content hash of the displayed graph, used as the render cache key.
+    """
+    payload = json.dumps([graph["nodes"], graph["edges"]], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def to_vis_data(graph_key: str, _graph: dict) -> dict:
+    """
+    Convert the graph to vis.js nodes and edges (cached by graph hash).
+    """
+    all_labels = set(l for node in _graph["nodes"].values() for l in node["labels"])
     label_colors = get_label_colors(all_labels)
-    for node_id, label in nodes.items():
-        labels = node_labels[node_id]
-        color = label_colors[list(labels)[0]] if labels else "#CCCCCC"
-        props = node_properties.get(node_id, {})
-        # Display key-value pairs as plain text, one per line
-        title_text = "\n".join(f"{k}: {v}" for k, v in props.items())
-        net.add_node(node_id, label=label, color=color, title=title_text)
-    for src, dst, rel in edges:
-        net.add_edge(src, dst, label=rel)
+    nodes = []
+    for node_id, node in _graph["nodes"].items():
+        labels = node["labels"]
+        nodes.append({
+            "id": node_id,
+            "label": str(node["name"]),
+            "color": label_colors[labels[0]] if labels else "#CCCCCC",
+            "shape": "dot",
+            "font": {"color": "white"},
+            # Display key-value pairs as plain text, one per line
+            "title": "\n".join(f"{k}: {v}" for k, v in node["properties"].items()),
+        })
+    edges = [
+        {"id": edge_id, "from": edge["src"], "to": edge["dst"], "label": edge["type"]}
+        for edge_id, edge in _graph["edges"].items()
+    ]
+    return {"nodes": nodes, "edges": edges}
+
+def update_graph_from_neo4j(net, graph: dict):
+    vis_data = to_vis_data(graph_hash(graph), graph)
+    for node in vis_data["nodes"]:
+        net.add_node(node["id"], label=node["label"], color=node["color"], title=node["title"])
+    for edge in vis_data["edges"]:
+        net.add_edge(edge["from"], edge["to"], label=edge["label"])
     return net
 
-# Async helper for Streamlit
-def run_async(coro):
-    try:
-        loop = asyncio.get_running_loop()
-    except RuntimeError:  # No event loop running
-        return asyncio.run(coro)
-    else:
-        return loop.run_until_complete(coro)
+@st.cache_data(max_entries=8, show_spinner=False)
+def render_graph_html(graph_key: str, _graph: dict) -> str:
+    """
+    Render the pyvis page in memory (no temporary file), cached by graph hash.
+    """
+    net = Network(height=f"{GRAPH_HEIGHT}px", width="100%", bgcolor="#222222", font_color="white",
+                  cdn_resources="remote")
+    net = update_graph_from_neo4j(net, _graph)
+    return net.generate_html()
+
+def vis_diff(old: dict, new: dict) -> dict:
+    """
+    vis.js updates turning `old` into `new`: upserts and removals by id.
+    """
+    diff = {}
+    for kind in ("nodes", "edges"):
+        before = {item["id"]: item for item in old[kind]}
+        after = {item["id"]: item for item in new[kind]}
+        diff[f"upsert_{kind}"] = [item for key, item in after.items() if before.get(key) != item]
+        diff[f"remove_{kind}"] = [key for key in before if key not in after]
+    return diff
+
+def show_graph(graph: dict):
+    """
+    Display the graph. With the component renderer, only the node and edge
+    diff since the last render is sent to the browser; the full graph is
+    sent on the first render or when the browser asks for a resync.
+    """
+    graph_key = graph_hash(graph)
+    if GRAPH_RENDERER == "pyvis":
+        components.html(render_graph_html(graph_key, graph), height=GRAPH_HEIGHT + 50, scrolling=True)
+        return
+
+    vis_data = to_vis_data(graph_key, graph)
+    sent = st.session_state.get("graph_sent")
+    request = st.session_state.get("graph_viewer") or {}
+    resync = request.get("nonce") and request.get("nonce") != st.session_state.get("graph_resync_nonce")
+    args = {"hash": graph_key, "height": GRAPH_HEIGHT, "options": {"edges": {"arrows": "to"}}}
+    if sent is None or resync:
+        args["full"] = vis_data
+        st.session_state.graph_resync_nonce = request.get("nonce")
+    elif sent[0] != graph_key:
+        args["base"] = sent[0]
+        args["diff"] = vis_diff(sent[1], vis_data)
+    graph_viewer(**args, key="graph_viewer", default=None)
+    st.session_state.graph_sent = (graph_key, vis_data)
 
 @st.cache_resource(show_spinner=False)
 def get_api_url():
@@ -90,6 +292,104 @@ def get_api_url():
     port = os.environ.get("FASTAPI_PORT", os.environ.get("FASTAPI_PORT"))
     return f"http://{host}:{port}"
 
+@st.cache_resource(show_spinner=False)
+def get_http_client() -> httpx.Client:
+    """
+    Pooled keep-alive HTTP client shared by all sessions.
+    """
+    return httpx.Client(
+        base_url=get_api_url(),
+        timeout=httpx.Timeout(STREAM_READ_TIMEOUT, connect=5.0),
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_graph_loader() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="graph-loader")
+
+def start_graph_load():
+    """
+    Load the visible graph in a background thread while the chat call runs.
+    """
+    ctx = get_script_run_ctx()
+
+    def load():
+        # Give the worker access to this session's state and caches
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return load_visible_graph()
+
+    return get_graph_loader().submit(load)
+
+def iter_sse_events(response: httpx.Response):
+    """
+    Parse a server-sent events stream into the JSON payloads of its `data:` fields.
+    """
+    data = []
+    for line in response.iter_lines():
+        if line.startswith("data:"):
+            data.append(line[5:].lstrip())
+        elif not line and data:
+            yield json.loads("\n".join(data))
+            data = []
+    if data:
+        yield json.loads("\n".join(data))
+
+def stream_agent_response(command: str, model: str, on_idle=None) -> str:
+    """
+    Call /query/stream and render the agent's progress in the current chat
+    message: tool steps and Cypher in a status box, tokens as they arrive.
+    `on_idle` is called after each event (used to draw the graph pane as
+    soon as it is loaded).
+
+    Returns:
+        str: The final answer (or an error message)
+    """
+    steps = st.status("Running the agent...", expanded=False)
+    answer_box = st.empty()
+    text, stage = "", None
+    try:
+        with get_http_client().stream(
+            "GET", "/query/stream", params={"command": command, "model": model}
+        ) as response:
+            if response.status_code != 200:
+                response.read()
+                steps.update(label="Request rejected", state="error")
+                return f"Error: {response.status_code} - {response.text}"
+            for event in iter_sse_events(response):
+                if event["type"] == "token":
+                    # Interpretation tokens replace the agent's draft answer
+                    if event["stage"] != stage:
+                        text, stage = "", event["stage"]
+                    text += event["content"]
+                    answer_box.markdown(text + "▌")
+                elif event["type"] == "route":
+                    steps.write(f"Routed to `{event['model']}` ({event['route']} question)")
+                elif event["type"] == "fallback":
+                    # The fast model's draft is discarded, the strong model starts over
+                    steps.write(f"Retrying with `{event['model']}` ({event['reason']})")
+                    text, stage = "", None
+                    answer_box.empty()
+                elif event["type"] == "tool_start":
+                    steps.update(label=f"Calling {event['tool']}...")
+                    steps.write(f"Tool `{event['tool']}` ({event.get('server') or 'local'})")
+                elif event["type"] == "cypher":
+                    steps.code(event["query"], language="cypher")
+                elif event["type"] == "done":
+                    if response_wrote_graph(event):
+                        st.session_state.graph_version += 1
+                    steps.update(label=f"Done in {event['seconds_to_complete']}s", state="complete")
+                    text = str(event.get("answer", "No response"))
+                elif event["type"] == "error":
+                    steps.update(label="Agent error", state="error")
+                    text = f"Error: {event.get('detail')}"
+                if on_idle is not None:
+                    on_idle()
+    except Exception as e:
+        steps.update(label="Request failed", state="error")
+        text = f"Request failed: {str(e)}"
+    answer_box.markdown(text)
+    return text
+
 
 def main():
     """Main function to run the Streamlit application."""
@@ -102,9 +402,36 @@ def main():
         st.session_state.chat_history = []
     if "last_model" not in st.session_state:
         st.session_state.last_model = MODEL_OPTIONS[0]
+    if "graph_version" not in st.session_state:
+        # Bumped after each agent write; part of the graph cache keys
+        st.session_state.graph_version = 0
+        st.session_state.graph_cursors = [-1]
+        st.session_state.expanded_nodes = []
+        st.session_state.graph = None
+
+    # Graph data is fetched while the chat request runs
+    graph_future = start_graph_load()
+    graph_shown = False
 
     col1, col2 = st.columns([1, 1])
 
+    with col2:
+        st.header("Graph Viewer")
+        graph_pane = st.container()
+
+    def show_graph_pane_when_ready(wait: bool = False):
+        nonlocal graph_shown
+        if graph_shown or not (wait or graph_future.done()):
+            return
+        graph_shown = True
+        with graph_pane:
+            try:
+                graph = graph_future.result()
+            except Exception as e:
+                st.error(f"Could not load the graph: {e}")
+                return
+            render_graph_pane(graph)
+
     with col1:
         # Model selection dropdown
         selected_model = st.selectbox(
@@ -121,41 +448,59 @@ def main():
         # Chat input
         user_input = st.chat_input("Type your message and press Enter...")
 
-        # Process user input
+        # Process user input, streaming the answer above the history
         if user_input:
+            graph_version = st.session_state.graph_version
+            with st.chat_message("assistant"):
+                agent_response = stream_agent_response(user_input, selected_model, show_graph_pane_when_ready)
+            with st.chat_message("user"):
+                st.markdown(user_input)
             st.session_state.chat_history.append(("user", user_input))
-            
-            # Call the FastAPI endpoint
-            try:
-                response = requests.get(
-                    f"{get_api_url()}/query",
-                    params={"command": user_input, "model": selected_model},
-                    timeout=120
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    agent_response = result.get("result", "No response")
-                else:
-                    agent_response = f"Error: {response.status_code} - {response.text}"
-            except Exception as e:
-                agent_response = f"Request failed: {str(e)}"
-            
             st.session_state.chat_history.append(("agent", agent_response))
+            # The agent wrote to the graph: redraw with the refreshed pages
+            if st.session_state.graph_version != graph_version:
+                st.rerun()
 
         # Display chat history using st.chat_message (most recent at top)
-        for role, msg in reversed(st.session_state.chat_history):
+        history = st.session_state.chat_history[:-2] if user_input else st.session_state.chat_history
+        for role, msg in reversed(history):
             with st.chat_message("user" if role == "user" else "assistant"):
                 st.markdown(msg)
 
-    with col2:
-        st.header("Graph Viewer")
-        net = Network(height="500px", width="100%", bgcolor="#222222", font_color="white")
-        net = update_graph_from_neo4j(net)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".html") as tmp_file:
-            net.write_html(tmp_file.name)
-            html_content = open(tmp_file.name, "r").read()
-            st.components.v1.html(html_content, height=550, scrolling=True)
+    show_graph_pane_when_ready(wait=True)
+
+def render_graph_pane(graph: dict):
+    """
+    Draw the graph controls, change summary and viewer.
+    """
+    # After an agent write, report what changed on screen
+    delta = graph_delta(st.session_state.graph, graph)
+    if st.session_state.graph is not None and st.session_state.graph.get("version") != graph["version"] \
+            and any(delta.values()):
+        st.caption(
+            f"Graph updated: +{len(delta['added_nodes'])}/-{len(delta['removed_nodes'])} nodes, "
+            f"+{len(delta['added_edges'])}/-{len(delta['removed_edges'])} relationships"
+        )
+    st.session_state.graph = graph
+
+    controls = st.columns([1, 2])
+    with controls[0]:
+        if st.button("Load more nodes", disabled=graph["next"] is None):
+            st.session_state.graph_cursors.append(graph["next"])
+            st.rerun()
+    with controls[1]:
+        node_ids = list(graph["nodes"])
+        to_expand = st.selectbox(
+            "Expand neighbors of:",
+            [None] + node_ids,
+            format_func=lambda k: "—" if k is None else f"{graph['nodes'][k]['name']} ({', '.join(graph['nodes'][k]['labels'])})"
+        )
+        if to_expand and to_expand not in st.session_state.expanded_nodes:
+            st.session_state.expanded_nodes.append(to_expand)
+            st.rerun()
+    st.caption(f"{len(graph['nodes'])} nodes, {len(graph['edges'])} relationships shown")
+
+    show_graph(graph)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,164 @@
+# ------------------------------------------------------------
+# Serveurs MCP partagés en streamable HTTP
+# ------------------------------------------------------------
+#
+# En transport stdio, chaque MultiToolAgent (donc chaque worker uvicorn et
+# chaque modèle du cache d'agents) lance ses propres sous-processus MCP :
+# CPU et mémoire croissent en workers x modèles x serveurs.
+# Avec MCP_TRANSPORT=http, les serveurs tournent une seule fois :
+#     python mcp_http_servers.py
+# et les agents s'y connectent (http_server_configs), leurs sessions
+# partageant un pool de connexions HTTP keep-alive (voir mcp_pool).
+
+# Mode hors ligne : serveur MCP local à la place de Neo4j
+from offline import OFFLINE_MODE, OFFLINE_MCP_SERVER_CONFIGS
+
+# Librairies standards
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+# Chargement des variables d’environnement (.env)
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# ------------------------------------------------------------
+# Configuration
+# ------------------------------------------------------------
+
+# Transport des serveurs MCP : "stdio" (sous-processus par session) ou "http"
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio").lower()
+
+# Adresse des serveurs HTTP : un port par serveur à partir de MCP_HTTP_BASE_PORT
+MCP_HTTP_HOST = os.getenv("MCP_HTTP_HOST", "127.0.0.1")
+# (plage distincte de FASTAPI_PORT)
+MCP_HTTP_BASE_PORT = int(os.getenv("MCP_HTTP_BASE_PORT", "8101"))
+MCP_HTTP_PATH = "/mcp/"
+
+# Délai maximal (secondes) de démarrage d'un serveur (uvx peut télécharger le paquet)
+MCP_HTTP_START_TIMEOUT = float(os.getenv("MCP_HTTP_START_TIMEOUT", "120"))
+
+# Paquets des serveurs. Le transport HTTP n'existe qu'à partir de ces
+# versions, plus récentes que celles du mode stdio (main_multi) : changer
+# de transport change donc aussi la version des serveurs et, le cas
+# échéant, le schéma de leurs outils (relu à la connexion, cf. mcp_pool).
+HTTP_SERVER_PACKAGES = {
+    "neo4j-cypher": "mcp-neo4j-cypher@0.3.0",
+    "neo4j-data-modeling": "mcp-neo4j-data-modeling@0.2.0",
+    "memory": "mcp-neo4j-memory@0.2.0",
+}
+
+
+def server_names() -> list[str]:
+    return list(OFFLINE_MCP_SERVER_CONFIGS if OFFLINE_MODE else HTTP_SERVER_PACKAGES)
+
+
+def server_port(name: str) -> int:
+    if name not in HTTP_SERVER_PACKAGES:
+        raise ValueError(
+            f"Serveur MCP '{name}' absent de HTTP_SERVER_PACKAGES : "
+            f"aucun port HTTP ({', '.join(HTTP_SERVER_PACKAGES)})"
+        )
+    return MCP_HTTP_BASE_PORT + list(HTTP_SERVER_PACKAGES).index(name)
+
+
+def http_server_configs(configs: dict) -> dict:
+    """
+    Configurations MCP (streamable HTTP) des serveurs partagés. Un serveur
+    sans paquet HTTP connu garde sa configuration stdio.
+    """
+    http_configs = {}
+    for name, config in configs.items():
+        if name not in HTTP_SERVER_PACKAGES:
+            print(f"Serveur MCP '{name}' sans équivalent HTTP : transport stdio conservé")
+            http_configs[name] = config
+            continue
+        http_configs[name] = {
+            "url": f"http://{MCP_HTTP_HOST}:{server_port(name)}{MCP_HTTP_PATH}",
+            "transport": "streamable_http",
+        }
+    return http_configs
+
+
+def server_command(name: str) -> list[str]:
+    port = str(server_port(name))
+    if OFFLINE_MODE:
+        config = OFFLINE_MCP_SERVER_CONFIGS[name]
+        return [config["command"], *config["args"], "--transport", "streamable-http",
+                "--host", MCP_HTTP_HOST, "--port", port, "--path", MCP_HTTP_PATH]
+    return ["uvx", HTTP_SERVER_PACKAGES[name], "--transport", "http",
+            "--server-host", MCP_HTTP_HOST, "--server-port", port, "--server-path", MCP_HTTP_PATH]
+
+
+# ------------------------------------------------------------
+# Lancement des serveurs
+# ------------------------------------------------------------
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float = MCP_HTTP_START_TIMEOUT):
+    """
+    Attend que le serveur accepte les connexions sur `port`.
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Le serveur s'est arrêté au démarrage (code {process.returncode})")
+        try:
+            with socket.create_connection((MCP_HTTP_HOST, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Le port {port} n'est pas ouvert après {timeout:.0f}s")
+
+
+def start_servers(names: list[str] | None = None) -> dict:
+    """
+    Lance les serveurs HTTP et attend qu'ils écoutent.
+    Retourne les processus par nom de serveur.
+    """
+    processes = {}
+    try:
+        for name in names or server_names():
+            processes[name] = subprocess.Popen(server_command(name), env=os.environ)
+        for name, process in processes.items():
+            wait_for_port(server_port(name), process)
+    except BaseException:
+        stop_servers(processes)
+        raise
+    return processes
+
+
+def stop_servers(processes: dict):
+    for process in processes.values():
+        if process.poll() is None:
+            process.terminate()
+    for process in processes.values():
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    processes = start_servers()
+    for name in processes:
+        print(f"Serveur MCP '{name}' : http://{MCP_HTTP_HOST}:{server_port(name)}{MCP_HTTP_PATH}")
+    print("Lancer les agents avec MCP_TRANSPORT=http (Ctrl+C pour arrêter)")
+    # Arrêt propre sur SIGTERM (docker, systemd) comme sur Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        while all(process.poll() is None for process in processes.values()):
+            time.sleep(1)
+        stopped = [name for name, process in processes.items() if process.poll() is not None]
+        print(f"Serveur(s) arrêté(s) : {', '.join(stopped)}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_servers(processes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,600 @@
+# ------------------------------------------------------------
+# Pool de sessions MCP persistantes (une par sous-processus)
+# ------------------------------------------------------------
+
+# Outils LangChain construits à partir des schémas MCP
+# (le SDK MCP et langchain_mcp_adapters ne sont importés qu'au premier
+# lancement d'un serveur : voir PooledSession._run et make_tool)
+from langchain_core.tools import StructuredTool, ToolException
+
+# Métriques Prometheus (durée des appels d'outils)
+from metrics import TOOL_CALL_SECONDS
+
+# Librairies standards
+from contextlib import asynccontextmanager
+import asyncio
+import anyio
+import hashlib
+import httpx
+import json
+import os
+import re
+import time
+
+# Chargement des variables d’environnement (.env)
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# ------------------------------------------------------------
+# Configuration du pool
+# ------------------------------------------------------------
+
+# Nombre de sessions ouvertes par serveur (surcharge possible par serveur)
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "1"))
+
+# Intervalle (secondes) entre deux vérifications de santé des sessions
+MCP_HEALTH_CHECK_INTERVAL = float(os.getenv("MCP_HEALTH_CHECK_INTERVAL", "30"))
+
+# Délai maximal (secondes) pour le démarrage d'une session et pour un ping
+MCP_START_TIMEOUT = float(os.getenv("MCP_START_TIMEOUT", "120"))
+MCP_PING_TIMEOUT = float(os.getenv("MCP_PING_TIMEOUT", "5"))
+
+# Lancement des serveurs au premier appel de l'un de leurs outils
+# (les outils sont alors décrits par le manifeste enregistré sur disque)
+MCP_LAZY_START = os.getenv("MCP_LAZY_START", "true").lower() == "true"
+
+# Répertoire des manifestes d'outils (vide : liste relue à chaque démarrage)
+MCP_TOOL_MANIFEST_DIR = os.getenv("MCP_TOOL_MANIFEST_DIR", ".mcp_manifests")
+
+# Validité (secondes) du manifeste d'un paquet sans version épinglée (0 : illimitée)
+MCP_TOOL_MANIFEST_TTL = float(os.getenv("MCP_TOOL_MANIFEST_TTL", "86400"))
+
+# Variables d'environnement qui changent les noms des outils (jamais les secrets)
+MANIFEST_ENV_VARS = ("NEO4J_NAMESPACE",)
+
+# Pool de connexions keep-alive partagé par les sessions streamable HTTP
+MCP_HTTP_MAX_CONNECTIONS = int(os.getenv("MCP_HTTP_MAX_CONNECTIONS", "100"))
+MCP_HTTP_MAX_KEEPALIVE = int(os.getenv("MCP_HTTP_MAX_KEEPALIVE", "20"))
+MCP_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("MCP_HTTP_KEEPALIVE_EXPIRY", "300"))
+
+# Code d'erreur MCP renvoyé lorsqu'une requête dépasse son délai
+REQUEST_TIMEOUT = 408
+
+
+def is_broken_session_error(error: BaseException) -> bool:
+    """
+    Indique si une erreur signifie que la session (ou le sous-processus)
+    est inutilisable et doit être redémarrée.
+    """
+    from mcp.shared.exceptions import McpError
+    from mcp.types import CONNECTION_CLOSED
+    if isinstance(error, McpError):
+        return error.error.code in (CONNECTION_CLOSED, REQUEST_TIMEOUT)
+    return isinstance(error, (
+        anyio.ClosedResourceError,
+        anyio.BrokenResourceError,
+        anyio.EndOfStream,
+        ConnectionError,
+        asyncio.TimeoutError,
+    ))
+
+
+# ------------------------------------------------------------
+# Connexions HTTP partagées (transport streamable HTTP)
+# ------------------------------------------------------------
+
+class SharedTransport(httpx.AsyncBaseTransport):
+    """
+    Transport httpx délégué au pool de connexions commun : la fermeture
+    d'un client (fin d'une session MCP) ne ferme pas les connexions.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self):
+        pass
+
+
+_http_transport = None
+
+
+def pooled_http_client(headers: dict | None = None, timeout: httpx.Timeout | None = None,
+                       auth: httpx.Auth | None = None) -> httpx.AsyncClient:
+    """
+    Fabrique `httpx_client_factory` des sessions streamable HTTP : un client
+    par session (en-têtes, délais), mais des connexions keep-alive communes
+    à toutes les sessions et à tous les agents du processus.
+    """
+    global _http_transport
+    if _http_transport is None:
+        _http_transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(
+            max_connections=MCP_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=MCP_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=MCP_HTTP_KEEPALIVE_EXPIRY,
+        ))
+    return httpx.AsyncClient(
+        headers=headers,
+        timeout=timeout or httpx.Timeout(30.0),
+        auth=auth,
+        follow_redirects=True,
+        transport=SharedTransport(_http_transport),
+    )
+
+
+async def close_http_connections():
+    """
+    Ferme les connexions HTTP partagées (arrêt du processus).
+    """
+    global _http_transport
+    if _http_transport is not None:
+        await _http_transport.aclose()
+        _http_transport = None
+
+
+# ------------------------------------------------------------
+# Manifeste des outils d'un serveur (cache disque)
+# ------------------------------------------------------------
+
+def is_pinned(connection: dict) -> bool:
+    """
+    Vrai si la version du serveur est figée : paquet épinglé
+    (ex : mcp-neo4j-cypher@0.2.4), script local ou serveur distant.
+    """
+    if connection.get("url"):
+        return True
+    args = connection.get("args") or []
+    return any(re.search(r"@\d", arg) or os.path.isfile(arg) for arg in args)
+
+
+def manifest_path(connection: dict, directory: str = MCP_TOOL_MANIFEST_DIR) -> str | None:
+    """
+    Fichier du manifeste d'un serveur. La clé couvre la commande, les
+    arguments (donc la version épinglée du paquet), l'URL, le transport
+    et la date des scripts locaux passés en argument.
+    """
+    if not directory:
+        return None
+    env = connection.get("env") or {}
+    parts = [connection.get("transport"), connection.get("command"), connection.get("url")]
+    for arg in connection.get("args") or []:
+        parts.append(arg)
+        if os.path.isfile(arg):
+            parts.append(os.stat(arg).st_mtime_ns)
+    parts.extend(env.get(name) for name in MANIFEST_ENV_VARS)
+    key = hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()[:16]
+    return os.path.join(directory, f"{key}.json")
+
+
+def load_manifest(connection: dict, ttl: float = MCP_TOOL_MANIFEST_TTL) -> list[dict] | None:
+    """
+    Schémas d'outils enregistrés pour ce serveur (None : absent ou expiré).
+    """
+    path = manifest_path(connection)
+    if path is None or not os.path.exists(path):
+        return None
+    if ttl > 0 and not is_pinned(connection) and time.time() - os.path.getmtime(path) > ttl:
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["tools"]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Manifeste d'outils illisible ({path}) : {e}")
+        return None
+
+
+def save_manifest(connection: dict, specs: list[dict]):
+    path = manifest_path(connection)
+    if path is None:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Écriture atomique : un autre processus peut lire le manifeste en même temps
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"command": connection.get("command"), "args": connection.get("args"),
+                       "tools": specs}, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Impossible d'écrire le manifeste d'outils ({path}) : {e}")
+
+
+def tool_spec(mcp_tool) -> dict:
+    """
+    Schéma JSON d'un outil MCP (nom, description, paramètres, annotations).
+    """
+    return mcp_tool.model_dump(mode="json", exclude_none=True)
+
+
+def convert_call_tool_result(result) -> tuple[str | list[str], list | None]:
+    """
+    Résultat MCP (CallToolResult) au format LangChain "content_and_artifact" :
+    texte (une chaîne, ou une liste s'il y a plusieurs blocs) et contenus
+    non textuels. Un résultat en erreur (`isError`) lève ToolException.
+    Même conversion que langchain_mcp_adapters, sans dépendre de sa
+    fonction privée.
+    """
+    texts = [content.text for content in result.content if getattr(content, "type", None) == "text"]
+    others = [content for content in result.content if getattr(content, "type", None) != "text"]
+    tool_content = "" if not texts else texts[0] if len(texts) == 1 else texts
+    if result.isError:
+        raise ToolException(tool_content)
+    return tool_content, others or None
+
+
+def make_tool(pool, spec: dict) -> StructuredTool:
+    """
+    Outil LangChain dont les appels passent par le pool (équivalent de
+    `convert_mcp_tool_to_langchain_tool`, sans session ni import MCP).
+    """
+    name = spec["name"]
+
+    async def call_tool(**arguments):
+        return convert_call_tool_result(await pool.call_tool(name, arguments))
+
+    return StructuredTool(
+        name=name,
+        description=spec.get("description") or "",
+        args_schema=spec["inputSchema"],
+        coroutine=call_tool,
+        response_format="content_and_artifact",
+        metadata={**(spec.get("annotations") or {}), "mcp_server": pool.server_name},
+    )
+
+
+# ------------------------------------------------------------
+# Session MCP persistante
+# ------------------------------------------------------------
+
+class PooledSession:
+    """
+    Session MCP maintenue ouverte dans une tâche dédiée.
+
+    Les context managers MCP (stdio_client, ClientSession) doivent être
+    ouverts et fermés dans la même tâche : chaque session vit donc dans
+    sa propre tâche de fond jusqu'à l'appel de `close()`.
+    """
+
+    def __init__(self, server_name: str, connection: dict):
+        self.server_name = server_name
+        if connection.get("transport") == "streamable_http" and not connection.get("httpx_client_factory"):
+            connection = {**connection, "httpx_client_factory": pooled_http_client}
+        self.connection = connection
+        self.session = None
+        self.broken = False
+        self._task = None
+        self._ready = None
+        self._stop = None
+        self._error = None
+
+    @property
+    def alive(self) -> bool:
+        return (
+            self.session is not None
+            and not self.broken
+            and self._task is not None
+            and not self._task.done()
+        )
+
+    async def start(self):
+        """
+        Lance le serveur MCP et attend que la session soit initialisée.
+        """
+        self.broken = False
+        self._error = None
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(
+            self._run(),
+            name=f"mcp-session-{self.server_name}"
+        )
+        try:
+            await asyncio.wait_for(self._ready.wait(), MCP_START_TIMEOUT)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise
+        if self._error is not None:
+            raise self._error
+        return self
+
+    async def _run(self):
+        # Import différé : le SDK MCP n'est chargé qu'au premier lancement d'un serveur
+        from langchain_mcp_adapters.sessions import create_session
+        try:
+            async with create_session(self.connection) as session:
+                await session.initialize()
+                self.session = session
+                self._ready.set()
+                await self._stop.wait()
+        except Exception as e:
+            self._error = e
+        finally:
+            self.session = None
+            self._ready.set()
+
+    async def ping(self) -> bool:
+        """
+        Vérifie que le serveur répond ; marque la session comme cassée sinon.
+        """
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), MCP_PING_TIMEOUT)
+            return True
+        except Exception:
+            self.broken = True
+            return False
+
+    async def restart(self):
+        await self.close()
+        return await self.start()
+
+    async def close(self):
+        if self._task is None:
+            return
+        if self._ready.is_set():
+            self._stop.set()
+        else:
+            # Démarrage en cours (create_session, initialize) : la tâche
+            # n'attend pas encore `_stop`, elle doit être annulée
+            self._task.cancel()
+        # asyncio.wait : ni l'erreur ni l'annulation de la tâche ne remontent
+        await asyncio.wait([self._task])
+        self._task = None
+        self.session = None
+
+
+# ------------------------------------------------------------
+# Pool de sessions pour un serveur
+# ------------------------------------------------------------
+
+class ServerSessionPool:
+    """
+    Ensemble de sessions persistantes vers un même serveur MCP.
+    Expose `call_tool` comme une ClientSession, ce qui permet de l'utiliser
+    directement avec `convert_mcp_tool_to_langchain_tool`.
+
+    Les sessions sont ouvertes par `start()` ou, à défaut, au premier
+    emprunt. Des outils servis depuis le manifeste (`manifest_specs`)
+    sont comparés à la liste réelle dès le lancement du serveur.
+    """
+
+    def __init__(self, server_name: str, connection: dict, size: int = MCP_POOL_SIZE):
+        self.server_name = server_name
+        self.connection = connection
+        self.size = max(1, size)
+        self.sessions = [PooledSession(server_name, connection) for _ in range(self.size)]
+        self._idle = asyncio.Queue()
+        self.restarts = 0
+        self.started = False
+        self.manifest_specs = None
+        self._start_lock = asyncio.Lock()
+        self._check_task = None
+
+    async def start(self):
+        """
+        Lance les sessions (une seule fois, même sous appels concurrents).
+        """
+        async with self._start_lock:
+            if self.started:
+                return self
+            try:
+                await asyncio.gather(*[s.start() for s in self.sessions])
+            except BaseException:
+                await self.close()
+                raise
+            self._idle = asyncio.Queue()
+            for s in self.sessions:
+                self._idle.put_nowait(s)
+            self.started = True
+        if self.manifest_specs is not None:
+            self._check_task = asyncio.create_task(self._check_manifest())
+        return self
+
+    async def _check_manifest(self):
+        """
+        Relit la liste des outils du serveur lancé et met le manifeste à
+        jour (un changement ne sera visible qu'au prochain démarrage).
+        """
+        try:
+            specs = [tool_spec(tool) for tool in await self.list_tools()]
+        except Exception as e:
+            print(f"Vérification du manifeste de '{self.server_name}' impossible : {e}")
+            return
+        if specs != self.manifest_specs:
+            print(f"Les outils du serveur MCP '{self.server_name}' ont changé : manifeste mis à jour")
+        save_manifest(self.connection, specs)
+        self.manifest_specs = None
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        Emprunte une session du pool (redémarrée si le sous-processus est mort).
+        Lance le serveur s'il n'a pas encore démarré.
+        """
+        if not self.started:
+            await self.start()
+        pooled = await self._idle.get()
+        try:
+            if not pooled.alive:
+                await self._restart(pooled)
+            yield pooled.session
+        except BaseException as e:
+            if is_broken_session_error(e):
+                pooled.broken = True
+            raise
+        finally:
+            self._idle.put_nowait(pooled)
+
+    async def _restart(self, pooled: PooledSession):
+        self.restarts += 1
+        print(f"Redémarrage de la session MCP '{self.server_name}'...")
+        await pooled.restart()
+
+    async def call_tool(self, name: str, arguments: dict | None = None, *args, **kwargs):
+        start_time = time.time()
+        status = "error"
+        try:
+            async with self.acquire() as session:
+                result = await session.call_tool(name, arguments, *args, **kwargs)
+            status = "error" if getattr(result, "isError", False) else "success"
+            return result
+        finally:
+            TOOL_CALL_SECONDS.observe(time.time() - start_time, server=self.server_name, tool=name, status=status)
+
+    async def list_tools(self):
+        """
+        Liste tous les outils du serveur (avec pagination).
+        """
+        tools = []
+        cursor = None
+        async with self.acquire() as session:
+            while True:
+                page = await session.list_tools(cursor=cursor)
+                tools.extend(page.tools or [])
+                if not page.nextCursor:
+                    return tools
+                cursor = page.nextCursor
+
+    async def health_check(self):
+        """
+        Ping des sessions inactives et redémarrage de celles qui ne répondent plus.
+        """
+        if not self.started:
+            return
+        for _ in range(self._idle.qsize()):
+            pooled = self._idle.get_nowait()
+            try:
+                if not await pooled.ping():
+                    await self._restart(pooled)
+            except Exception as e:
+                print(f"Échec du redémarrage de '{self.server_name}' : {e}")
+            finally:
+                self._idle.put_nowait(pooled)
+
+    async def close(self):
+        if self._check_task is not None:
+            self._check_task.cancel()
+            self._check_task = None
+        await asyncio.gather(*[s.close() for s in self.sessions])
+        self.started = False
+
+
+# ------------------------------------------------------------
+# Pool multi-serveurs
+# ------------------------------------------------------------
+
+class MCPSessionPool:
+    """
+    Pool de sessions MCP longue durée pour chaque serveur de la configuration.
+    Tous les appels d'outils passent par les sessions du pool.
+
+    En mode `lazy`, les serveurs ne sont lancés qu'au premier appel de
+    l'un de leurs outils ; les outils sont décrits par le manifeste
+    enregistré sur disque lors d'un démarrage précédent.
+    """
+
+    def __init__(self, configs: dict, pool_sizes: dict | None = None,
+                 health_check_interval: float = MCP_HEALTH_CHECK_INTERVAL,
+                 lazy: bool = MCP_LAZY_START):
+        pool_sizes = pool_sizes or {}
+        self.servers = {
+            name: ServerSessionPool(name, cfg, pool_sizes.get(name, MCP_POOL_SIZE))
+            for name, cfg in configs.items()
+        }
+        self.health_check_interval = health_check_interval
+        self.lazy = lazy
+        self.manifest_hits = 0
+        self._health_task = None
+        self.started = False
+
+    async def start(self):
+        """
+        Démarre toutes les sessions en parallèle (sauf en mode `lazy`) et
+        la vérification de santé.
+        """
+        if self.started:
+            return self
+        if not self.lazy:
+            try:
+                await asyncio.gather(*[pool.start() for pool in self.servers.values()])
+            except BaseException:
+                await self.close()
+                raise
+        if self.health_check_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+        self.started = True
+        return self
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await asyncio.gather(
+                *[pool.health_check() for pool in self.servers.values()],
+                return_exceptions=True
+            )
+
+    async def get_tools(self) -> list:
+        """
+        Charge les outils de chaque serveur ; leurs appels passent par le pool.
+        Le nom du serveur est ajouté aux métadonnées de chaque outil.
+        La liste vient du manifeste s'il est valide (sans lancer le serveur
+        en mode `lazy`), sinon du serveur, puis est enregistrée.
+        """
+        await self.start()
+
+        async def server_tools(pool: ServerSessionPool):
+            specs = load_manifest(pool.connection)
+            if specs is not None:
+                self.manifest_hits += 1
+                pool.manifest_specs = specs
+                if pool.started:
+                    pool._check_task = asyncio.create_task(pool._check_manifest())
+            else:
+                specs = [tool_spec(tool) for tool in await pool.list_tools()]
+                save_manifest(pool.connection, specs)
+            return [make_tool(pool, spec) for spec in specs]
+
+        tools_lists = await asyncio.gather(*[
+            server_tools(pool) for pool in self.servers.values()
+        ])
+        return [tool for tools in tools_lists for tool in tools]
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "size": pool.size,
+                "started": pool.started,
+                "idle": pool._idle.qsize(),
+                "alive": sum(s.alive for s in pool.sessions),
+                "restarts": pool.restarts,
+            }
+            for name, pool in self.servers.items()
+        }
+
+    async def close(self):
+        """
+        Arrête la vérification de santé et ferme proprement toutes les sessions.
+        """
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        await asyncio.gather(
+            *[pool.close() for pool in self.servers.values()],
+            return_exceptions=True
+        )
+        self.started = False
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -0,0 +1,228 @@
+# ------------------------------------------------------------
+# Métriques Prometheus (format d'exposition texte 0.0.4)
+# ------------------------------------------------------------
+#
+# Implémentation minimale (compteurs, jauges, histogrammes avec labels),
+# sans dépendance externe. Les métriques sont alimentées par
+# `MultiToolAgent.run_request` / `stream_request` (durées, requêtes en
+# cours, tokens, erreurs) et par le pool MCP (durée des appels d'outils),
+# puis exposées par l'endpoint /metrics de main_fastapi.
+
+# Librairies standards
+import math
+
+
+# Au-delà de ce load_duration, un appel LLM est compté comme chargement à froid
+COLD_LOAD_SECONDS = 0.5
+
+# Bornes par défaut des histogrammes (secondes)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: dict | None = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+    def render(self) -> list[str]:
+        return self.header() + self.samples()
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels):
+        """
+        Recopie un total tenu ailleurs (ex : compteurs du cache d'agents).
+        """
+        self._values[self._key(labels)] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self._values[key] = (counts, total + value)
+
+    def count(self, **labels) -> int:
+        counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+        return counts[-1]
+
+    def samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            for bound, count in zip(self.buckets, counts):
+                le = {"le": _format_value(bound) if bound == math.inf else repr(float(bound))}
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Registre des métriques exposées. Les « collecteurs » sont appelés à
+    chaque lecture pour recopier des statistiques tenues ailleurs
+    (ex : taille du cache d'agents).
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            return self._metrics[metric.name]
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"Échec de la collecte des métriques : {e}")
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# ------------------------------------------------------------
+# Métriques de l'agent
+# ------------------------------------------------------------
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "agent_request_duration_seconds", "Durée des requêtes de l'agent",
+    ("model", "status")
+)
+PATH_SECONDS = REGISTRY.histogram(
+    "agent_path_duration_seconds", "Durée des requêtes par chemin (cache, direct, agent)",
+    ("model", "path")
+)
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "agent_requests_in_flight", "Requêtes de l'agent en cours", ("model",)
+)
+REQUEST_ERRORS = REGISTRY.counter(
+    "agent_errors_total", "Erreurs des requêtes de l'agent par type d'exception",
+    ("model", "exception")
+)
+LLM_TOKENS = REGISTRY.counter(
+    "llm_tokens_total", "Tokens LLM consommés (direction : in / out)", ("model", "direction")
+)
+LLM_CALLS = REGISTRY.counter(
+    "llm_calls_total", "Appels LLM", ("model", "stage")
+)
+LLM_COLD_LOADS = REGISTRY.counter(
+    "llm_cold_loads_total", "Appels LLM ayant dû charger le modèle en mémoire", ("model",)
+)
+TOOL_CALL_SECONDS = REGISTRY.histogram(
+    "mcp_tool_call_duration_seconds", "Durée des appels d'outils MCP",
+    ("server", "tool", "status"),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+
+def record_trace(model: str, trace):
+    """
+    Recopie dans les compteurs les tokens (et chargements à froid) des spans
+    LLM d'une trace, étiquetés par le modèle réellement appelé (`model` si
+    le span ne l'indique pas).
+    """
+    spans = {span.span_id: span for span in trace.spans}
+    for span in trace.spans:
+        if span.name != "llm":
+            continue
+        parent = spans.get(span.parent_id)
+        span_model = span.attributes.get("model") or model
+        LLM_CALLS.inc(model=span_model, stage=parent.name if parent else "")
+        LLM_TOKENS.inc(span.attributes.get("input_tokens", 0), model=span_model, direction="in")
+        LLM_TOKENS.inc(span.attributes.get("output_tokens", 0), model=span_model, direction="out")
+        if span.attributes.get("load_duration", 0) > COLD_LOAD_SECONDS * 1e9:
+            LLM_COLD_LOADS.inc(model=span_model)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,209 @@
+# ------------------------------------------------------------
+# Gestionnaire des modèles Ollama (réutilisation, keep-alive, préchargement)
+# ------------------------------------------------------------
+#
+# Sans keep_alive, Ollama décharge un modèle après 5 minutes d'inactivité et
+# la requête suivante paie plusieurs secondes de chargement (load_duration).
+# Le gestionnaire :
+#   - réutilise une instance ChatOllama par modèle (et par mode streaming),
+#     donc aussi son client HTTP et ses connexions ;
+#   - fixe un keep_alive par modèle (OLLAMA_KEEP_ALIVE, OLLAMA_MODEL_KEEP_ALIVE) ;
+#   - précharge les modèles au démarrage avec un court prompt de chauffe ;
+#   - indique les modèles actuellement chargés en mémoire (`ollama ps`)
+#     et les modèles installés (`ollama list`).
+
+# Substituts hors ligne (modèle factice pour les tests de charge)
+from offline import FakeChatOllama, OFFLINE_MODE
+
+# Librairies standards
+import asyncio
+import os
+import time
+import weakref
+
+# Chargement des variables d’environnement (.env)
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# ------------------------------------------------------------
+# Configuration
+# ------------------------------------------------------------
+
+# Serveur Ollama (par défaut : OLLAMA_HOST ou http://localhost:11434)
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL") or None
+
+# Durée de maintien en mémoire après la dernière requête
+# (format Ollama : "30m", "1h", secondes, -1 = jamais déchargé)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Surcharges par modèle, ex : "llama3.2:-1,mistral:10m"
+OLLAMA_MODEL_KEEP_ALIVE = os.getenv("OLLAMA_MODEL_KEEP_ALIVE", "")
+
+# Prompt de chauffe envoyé au préchargement (un seul token généré)
+WARMUP_PROMPT = os.getenv("OLLAMA_WARMUP_PROMPT", "Hello")
+
+# Durée (secondes) pendant laquelle la liste des modèles installés est réutilisée
+OLLAMA_LIST_TTL = float(os.getenv("OLLAMA_LIST_TTL", "60"))
+
+
+def parse_keep_alive(value) -> int | str:
+    """
+    Convertit un keep_alive d'Ollama en entier s'il est numérique ("-1", "600").
+    """
+    value = str(value).strip()
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def parse_model_keep_alive(value: str) -> dict:
+    """
+    Lit les keep_alive par modèle, ex : "llama3.2:-1,qwen3:8b:10m".
+    """
+    keep_alive = {}
+    for item in value.split(","):
+        if ":" not in item:
+            continue
+        # Le nom du modèle peut contenir ':' (ex : "qwen3:8b"), la durée est la dernière partie
+        model, duration = item.strip().rsplit(":", 1)
+        keep_alive[model] = parse_keep_alive(duration)
+    return keep_alive
+
+
+class ModelManager:
+    """
+    Instances de modèles de chat partagées par modèle.
+
+    Les clients HTTP d'Ollama (httpx) sont liés à la boucle asyncio qui les
+    utilise : les instances sont donc conservées par boucle d'événements
+    (une seule en pratique pour le serveur FastAPI).
+    """
+
+    def __init__(self, base_url: str | None = OLLAMA_BASE_URL,
+                 keep_alive: int | str = OLLAMA_KEEP_ALIVE,
+                 model_keep_alive: dict | None = None,
+                 temperature: float = 0.0):
+        self.base_url = base_url
+        self.keep_alive = parse_keep_alive(keep_alive)
+        self.model_keep_alive = dict(model_keep_alive or {})
+        self.temperature = temperature
+        self._clients = weakref.WeakKeyDictionary()
+        self._sync_clients = {}
+        # Modèles préchargés (hors ligne : tenant lieu de `ollama ps`)
+        self.preloaded = {}
+        # Dernière liste des modèles installés et sa date
+        self._installed = set()
+        self._installed_at = None
+
+    def keep_alive_for(self, model: str) -> int | str:
+        return self.model_keep_alive.get(model, self.keep_alive)
+
+    def _clients_for_loop(self) -> dict:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self._sync_clients
+        return self._clients.setdefault(loop, {})
+
+    def _create(self, model: str, streaming: bool):
+        if OFFLINE_MODE:
+            return FakeChatOllama(model=model, disable_streaming=not streaming)
+        # Import différé : langchain_ollama n'est chargé qu'au premier modèle réel
+        from langchain_ollama import ChatOllama
+        return ChatOllama(
+            model=model,
+            base_url=self.base_url,
+            temperature=self.temperature,   # Température basse pour des réponses déterministes
+            keep_alive=self.keep_alive_for(model),
+            disable_streaming=not streaming
+        )
+
+    def get(self, model: str, streaming: bool = False):
+        """
+        Retourne l'instance partagée du modèle (créée au premier appel).
+        """
+        clients = self._clients_for_loop()
+        key = (model, streaming)
+        if key not in clients:
+            clients[key] = self._create(model, streaming)
+        return clients[key]
+
+    async def preload(self, models: list[str]):
+        """
+        Charge les modèles en mémoire avant la première requête
+        (échecs affichés, pas levés).
+        """
+        async def load(model: str):
+            start = time.time()
+            try:
+                if OFFLINE_MODE:
+                    await self.get(model).ainvoke(WARMUP_PROMPT)
+                else:
+                    from ollama import AsyncClient
+                    await AsyncClient(host=self.base_url).generate(
+                        model=model,
+                        prompt=WARMUP_PROMPT,
+                        keep_alive=self.keep_alive_for(model),
+                        options={"num_predict": 1}
+                    )
+                self.preloaded[model] = time.time()
+                print(f"Modèle {model} chargé en {time.time() - start:.2f}s "
+                      f"(keep_alive={self.keep_alive_for(model)})")
+            except Exception as e:
+                print(f"Échec du préchargement de {model} : {e}")
+
+        await asyncio.gather(*[load(model) for model in models])
+
+    async def resident(self) -> list[dict]:
+        """
+        Modèles actuellement chargés par Ollama (`ollama ps`).
+        """
+        if OFFLINE_MODE:
+            return [{"model": model, "keep_alive": self.keep_alive_for(model), "offline": True}
+                    for model in self.preloaded]
+        from ollama import AsyncClient
+        response = await AsyncClient(host=self.base_url).ps()
+        return [
+            {
+                "model": m.model or m.name,
+                "size": m.size,
+                "size_vram": m.size_vram,
+                "expires_at": m.expires_at.isoformat() if m.expires_at else None,
+                "keep_alive": self.keep_alive_for(m.model or m.name),
+            }
+            for m in response.models
+        ]
+
+    async def installed(self, ttl: float = OLLAMA_LIST_TTL) -> set[str]:
+        """
+        Noms des modèles installés (`ollama list`), avec et sans le tag
+        ":latest". Liste relue au plus toutes les `ttl` secondes ; si le
+        serveur est injoignable, la dernière liste connue est conservée
+        (vide hors ligne).
+        """
+        if OFFLINE_MODE:
+            return set()
+        if self._installed_at is not None and time.time() - self._installed_at < ttl:
+            return self._installed
+        try:
+            from ollama import AsyncClient
+            response = await AsyncClient(host=self.base_url).list()
+            names = {m.model for m in response.models if m.model}
+            self._installed = names | {name.removesuffix(":latest") for name in names}
+        except Exception as e:
+            print(f"Liste des modèles Ollama indisponible : {e}")
+        self._installed_at = time.time()
+        return self._installed
+
+    def stats(self) -> dict:
+        return {
+            "keep_alive": self.keep_alive,
+            "model_keep_alive": self.model_keep_alive,
+            "preloaded": sorted(self.preloaded),
+        }
+
+
+# Instance partagée par les agents du processus
+MODEL_MANAGER = ModelManager(model_keep_alive=parse_model_keep_alive(OLLAMA_MODEL_KEEP_ALIVE))
@@ -0,0 +1,197 @@
+# ------------------------------------------------------------
+# Routage des questions : modèle rapide ou modèle puissant
+# ------------------------------------------------------------
+#
+# La plupart des questions sont de simples comptages ou recherches, qu'un
+# petit modèle traite bien plus vite. Le routeur :
+#   1. classe la question (règles, ou petit modèle local si
+#      ROUTER_CLASSIFIER désigne un modèle Ollama) : "simple" ou "complex" ;
+#   2. envoie les questions simples au modèle rapide, les autres au modèle
+#      puissant ;
+#   3. `needs_fallback` indique quand la réponse du modèle rapide doit être
+#      refaite par le modèle puissant (Cypher invalide, aucune réponse ou
+#      réponse qui ne répond pas) ; /query et /query/stream l'appliquent.
+# Côté API, le routage s'applique au nom de modèle ROUTER_MODEL_NAME ("auto").
+
+# Détection des demandes d'écriture et des réponses de l'agent
+from answer_cache import looks_like_write_request
+from main_simple import get_model, get_messages, get_final_answer, extract_content, answers_question
+
+# Types de messages LangChain (résultats d'outils)
+from langchain_core.messages import HumanMessage, ToolMessage
+
+# Métriques Prometheus (répartition des routes, reprises)
+from metrics import REGISTRY
+
+# Librairies standards
+import os
+import re
+
+# Chargement des variables d’environnement (.env)
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# ------------------------------------------------------------
+# Configuration
+# ------------------------------------------------------------
+
+# Nom de modèle déclenchant le routage (API, Streamlit, test_multi)
+ROUTER_MODEL_NAME = os.getenv("ROUTER_MODEL_NAME", "auto")
+ROUTER_FAST_MODEL = os.getenv("ROUTER_FAST_MODEL", "llama3.2")
+ROUTER_STRONG_MODEL = os.getenv("ROUTER_STRONG_MODEL", "qwen3")
+
+# "rules" (expressions régulières) ou nom d'un petit modèle Ollama (ex : qwen3:0.6b)
+ROUTER_CLASSIFIER = os.getenv("ROUTER_CLASSIFIER", "rules")
+
+# Au-delà de ce nombre de mots, une question est considérée complexe
+ROUTER_MAX_SIMPLE_WORDS = int(os.getenv("ROUTER_MAX_SIMPLE_WORDS", "16"))
+
+ROUTE_SIMPLE = "simple"
+ROUTE_COMPLEX = "complex"
+
+# Comptages et recherches directes
+_SIMPLE_PATTERN = re.compile(
+    r"^\s*(how many|count|number of|list|show|what (is|are)|which|who|give me|get|find)\b",
+    re.IGNORECASE
+)
+
+# Indices de plusieurs sauts, d'agrégations ou de conditions combinées
+_COMPLEX_PATTERN = re.compile(
+    r"\b(and|or|both|also|then|between|paths?|compare|versus|vs|most|least|average|avg|"
+    r"per|each|top \d+|more than|less than|without|not|never|through|via|indirect(ly)?|"
+    r"shortest|why|explain)\b",
+    re.IGNORECASE
+)
+
+# Formes d'erreur Neo4j / MCP signalant une requête Cypher invalide. Le motif
+# est appliqué au contenu des résultats d'outils : il reste sensible à la
+# casse et limité à ces formes pour qu'une ligne de résultat valide
+# ("Role not defined", "error ...") ne déclenche pas de reprise ; les
+# autres échecs sont signalés par ToolMessage.status == "error".
+_CYPHER_ERROR_PATTERN = re.compile(
+    r"Neo\.ClientError|SyntaxError|Invalid input|Unknown function|Error executing"
+)
+
+CLASSIFIER_PROMPT = (
+    "Classify the following question about a graph database.\n"
+    "Answer 'simple' if it is a single count or lookup that one Cypher query answers directly.\n"
+    "Answer 'complex' if it needs several hops, aggregations, comparisons or modifies the graph.\n"
+    "Answer with one word only.\n"
+    "Question: {question}\n"
+    "Answer:"
+)
+
+ROUTES = REGISTRY.counter(
+    "agent_routes_total", "Questions routées par classe et modèle", ("route", "model")
+)
+ROUTE_FALLBACKS = REGISTRY.counter(
+    "agent_route_fallbacks_total", "Reprises par le modèle puissant", ("model", "reason")
+)
+
+
+def classify_question(question: str) -> str:
+    """
+    Classe une question par règles : "simple" (comptage, recherche directe)
+    ou "complex" (plusieurs sauts, agrégations, écritures). Dans le doute,
+    la question est complexe.
+    """
+    if looks_like_write_request(question):
+        return ROUTE_COMPLEX
+    if len(question.split()) > ROUTER_MAX_SIMPLE_WORDS:
+        return ROUTE_COMPLEX
+    if _SIMPLE_PATTERN.search(question) and not _COMPLEX_PATTERN.search(question):
+        return ROUTE_SIMPLE
+    return ROUTE_COMPLEX
+
+
+def needs_fallback(agent_response, request: str = "", follow_up: bool = False,
+                   schema_context: bool = False) -> str | None:
+    """
+    Raison de reprendre la réponse avec le modèle puissant, ou None :
+    - "invalid_cypher" : un outil a renvoyé une erreur (syntaxe, label inconnu) ;
+    - "empty_answer"   : aucune réponse finale ;
+    - "no_tool_call"   : réponse donnée sans interroger le graphe. Elle est
+      admise si le prompt contient le résumé du schéma (`schema_context`,
+      qui invite à répondre sans outil) ou pour une question de suivi
+      (l'historique suffit), à condition de répondre à la question ;
+      sinon la raison devient "non_answer".
+    """
+    messages = get_messages(agent_response)
+    last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+    tool_messages = [m for m in messages[last_human + 1:] if isinstance(m, ToolMessage)]
+    for message in tool_messages:
+        if getattr(message, "status", None) == "error" or _CYPHER_ERROR_PATTERN.search(extract_content(message)):
+            return "invalid_cypher"
+    final_answer = get_final_answer(agent_response)
+    if not final_answer.strip():
+        return "empty_answer"
+    if not tool_messages:
+        if not (follow_up or schema_context):
+            return "no_tool_call"
+        if not answers_question(final_answer, request):
+            return "non_answer"
+    return None
+
+
+class ModelRouter:
+    """
+    Choisit le modèle de chaque question (rapide pour les questions simples,
+    puissant sinon) et compte les décisions.
+    """
+
+    def __init__(self, fast_model: str = ROUTER_FAST_MODEL, strong_model: str = ROUTER_STRONG_MODEL,
+                 classifier: str = ROUTER_CLASSIFIER):
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.classifier = classifier
+        self.routes = {ROUTE_SIMPLE: 0, ROUTE_COMPLEX: 0}
+        self.fallbacks = 0
+
+    @property
+    def models(self) -> list[str]:
+        return list(dict.fromkeys([self.fast_model, self.strong_model]))
+
+    async def classify(self, question: str) -> str:
+        """
+        Classe la question avec le petit modèle configuré (sinon par règles).
+        Les écritures ne sont jamais confiées au classifieur.
+        """
+        if self.classifier == "rules" or looks_like_write_request(question):
+            return classify_question(question)
+        try:
+            response = await get_model(self.classifier).ainvoke(CLASSIFIER_PROMPT.format(question=question))
+        except Exception as e:
+            print(f"Échec du classifieur {self.classifier} : {e}")
+            return classify_question(question)
+        text = extract_content(response).lower()
+        # Modèles à raisonnement (ex : qwen3) : la décision suit le bloc <think>
+        text = text.rsplit("</think>", 1)[-1]
+        if ROUTE_SIMPLE in text and ROUTE_COMPLEX not in text:
+            return ROUTE_SIMPLE
+        if ROUTE_COMPLEX in text:
+            return ROUTE_COMPLEX
+        return classify_question(question)
+
+    async def route(self, question: str) -> tuple[str, str]:
+        """
+        Retourne la classe de la question et le modèle à utiliser.
+        """
+        route = await self.classify(question)
+        model = self.fast_model if route == ROUTE_SIMPLE else self.strong_model
+        self.routes[route] += 1
+        ROUTES.inc(route=route, model=model)
+        return route, model
+
+    def record_fallback(self, model: str, reason: str):
+        self.fallbacks += 1
+        ROUTE_FALLBACKS.inc(model=model, reason=reason)
+
+    def stats(self) -> dict:
+        return {
+            "fast_model": self.fast_model,
+            "strong_model": self.strong_model,
+            "classifier": self.classifier,
+            "routes": dict(self.routes),
+            "fallbacks": self.fallbacks,
+        }
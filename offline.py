@@ -0,0 +1,301 @@
+# ------------------------------------------------------------
+# Mode hors ligne : substituts déterministes d'Ollama et de Neo4j
+# ------------------------------------------------------------
+#
+# Pour les tests de charge et le profilage de notre propre code
+# (pool MCP, caches, ordonnanceur, streaming) sans GPU ni base Neo4j :
+#   - FakeChatOllama : modèle de chat scripté, même interface que
+#     ChatOllama (bind_tools, ainvoke, astream), latence par token réglable ;
+#   - OFFLINE_MCP_SERVER_CONFIGS : serveur MCP stdio local
+#     (offline_mcp_server.py) exposant les outils de mcp-neo4j-cypher
+#     sur un graphe en mémoire.
+# Activation : OFFLINE_MODE=true.
+
+# Modèle de chat LangChain (classe de base) et messages
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import Field
+
+# Librairies standards
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+import uuid
+
+# Chargement des variables d’environnement (.env)
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# ------------------------------------------------------------
+# Configuration
+# ------------------------------------------------------------
+
+OFFLINE_MODE = os.getenv("OFFLINE_MODE", "false").lower() == "true"
+
+# Latences simulées (secondes) : par token généré et par token de prompt
+OFFLINE_LLM_TOKEN_LATENCY = float(os.getenv("OFFLINE_LLM_TOKEN_LATENCY", "0.02"))
+OFFLINE_LLM_PROMPT_LATENCY = float(os.getenv("OFFLINE_LLM_PROMPT_LATENCY", "0"))
+
+# Prompts gardés en cache KV (comme les slots d'Ollama) : un préfixe déjà
+# évalué n'est ni recompté dans prompt_eval_count ni retardé (0 : désactivé)
+OFFLINE_LLM_CACHE_SLOTS = int(os.getenv("OFFLINE_LLM_CACHE_SLOTS", "4"))
+
+# Serveur MCP local remplaçant `uvx mcp-neo4j-cypher` (même nom de serveur,
+# pour que le cache Cypher et le contexte de schéma s'appliquent)
+OFFLINE_MCP_SERVER_CONFIGS = {
+    "neo4j-cypher": {
+        "command": sys.executable,
+        "args": [os.path.join(os.path.dirname(os.path.abspath(__file__)), "offline_mcp_server.py")],
+        "transport": "stdio",
+        "env": os.environ
+    }
+}
+
+
+# ------------------------------------------------------------
+# Scénario par défaut : question -> requête Cypher
+# ------------------------------------------------------------
+
+_CREATE_PATTERN = re.compile(
+    r"label\s+'(\w+)'.*?property\s+'(\w+)'\s+set\s+to\s+'([^']*)'", re.IGNORECASE
+)
+# Prompt du chemin direct texte -> Cypher (direct_cypher.CYPHER_PROMPT)
+_CYPHER_PROMPT_PATTERN = re.compile(r"Question: (.+)\nCypher:\s*$", re.DOTALL)
+
+_RESULT_PATTERN = re.compile(r"The result is: (.+?)(?=\\n|['\"],|['\"]\)|\n|$)")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimation grossière du nombre de tokens (~4 caractères par token).
+    """
+    return max(1, len(text) // 4)
+
+
+def singular_label(word: str) -> str:
+    word = word.strip()
+    if word.lower().endswith("ies"):
+        word = word[:-3] + "y"
+    elif word.lower().endswith("s") and not word.lower().endswith("ss"):
+        word = word[:-1]
+    return word[:1].upper() + word[1:]
+
+
+def question_to_cypher(question: str) -> tuple[str, str]:
+    """
+    Traduit une question simple en (outil, requête Cypher), à la manière
+    d'un petit modèle : comptages, relations « work for », créations.
+    """
+    q = question.strip().rstrip("?. ")
+    create = _CREATE_PATTERN.search(q)
+    if create:
+        label, prop, value = create.groups()
+        return "write_neo4j_cypher", f"CREATE (n:{label} {{{prop}: '{value}'}})"
+    if re.search(r"how many nodes", q, re.IGNORECASE):
+        return "read_neo4j_cypher", "MATCH (n) RETURN count(n) AS count"
+    if re.search(r"how many relationships", q, re.IGNORECASE):
+        return "read_neo4j_cypher", "MATCH ()-[r]->() RETURN count(r) AS count"
+    related = re.search(r"how many (\w+) (\w+) (for|in|at|to|of) (.+)$", q, re.IGNORECASE)
+    if related:
+        label, verb, preposition, name = related.groups()
+        # « work for » -> WORKS_FOR
+        rel_type = f"{verb.rstrip('s')}s_{preposition}".upper()
+        return "read_neo4j_cypher", (
+            f"MATCH (n:{singular_label(label)})-[:{rel_type}]->(m {{name: '{name}'}}) RETURN count(n) AS count"
+        )
+    count = re.search(r"how many (\w+)", q, re.IGNORECASE)
+    if count:
+        return "read_neo4j_cypher", f"MATCH (n:{singular_label(count.group(1))}) RETURN count(n) AS count"
+    return "get_neo4j_schema", ""
+
+
+def _text(message) -> str:
+    return message.content if isinstance(message.content, str) else str(message.content)
+
+
+# ------------------------------------------------------------
+# Modèle de chat factice
+# ------------------------------------------------------------
+
+class FakeChatOllama(BaseChatModel):
+    """
+    Modèle de chat déterministe compatible avec l'usage de ChatOllama dans
+    le projet (agent ReAct, interprétation, streaming).
+
+    Sans `responses`, le scénario par défaut est suivi : un appel d'outil
+    Cypher déduit de la question, puis une réponse reprenant le résultat
+    de l'outil. Avec `responses`, les réponses (texte ou AIMessage) sont
+    rejouées dans l'ordre, en boucle. Les métadonnées de réponse imitent
+    celles d'Ollama (prompt_eval_count, eval_count, durées en ns) ; comme
+    Ollama, le préfixe commun avec un prompt récent (cache KV) n'est pas
+    réévalué.
+    """
+
+    model: str = "offline"
+    temperature: float = 0.0
+    token_latency: float = OFFLINE_LLM_TOKEN_LATENCY
+    prompt_latency: float = OFFLINE_LLM_PROMPT_LATENCY
+    responses: list | None = None
+    calls: int = 0
+    cache_slots: int = OFFLINE_LLM_CACHE_SLOTS
+    prompt_cache: list = Field(default_factory=list)
+
+    @property
+    def _llm_type(self) -> str:
+        return "offline-chat-ollama"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model": self.model, "temperature": self.temperature}
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    # --------------------------------------------------------
+    # Scénario
+    # --------------------------------------------------------
+
+    def _plan(self, messages: list, tools: list | None) -> AIMessage:
+        if self.responses:
+            response = self.responses[self.calls % len(self.responses)]
+            self.calls += 1
+            return response.model_copy() if isinstance(response, AIMessage) else AIMessage(content=str(response))
+        self.calls += 1
+
+        last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+        question = _text(messages[last_human]) if last_human >= 0 else ""
+        tool_results = [m for m in messages[last_human + 1:] if isinstance(m, ToolMessage)]
+
+        # Tour d'agent : appel d'outil, puis réponse à partir du résultat
+        tool_names = {t["function"]["name"] for t in tools or []}
+        if tool_names and not tool_results:
+            tool_name, query = question_to_cypher(question)
+            if tool_name in tool_names:
+                args = {"query": query} if query else {}
+                return AIMessage(content="", tool_calls=[{
+                    "name": tool_name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}", "type": "tool_call"
+                }])
+        if tool_results:
+            return AIMessage(content=f"The result is: {_text(tool_results[-1])}")
+
+        # Chemin direct : requête de lecture déduite de la question
+        cypher_prompt = _CYPHER_PROMPT_PATTERN.search(question)
+        if cypher_prompt:
+            tool_name, query = question_to_cypher(cypher_prompt.group(1))
+            return AIMessage(content=query if tool_name == "read_neo4j_cypher" else "")
+
+        # Passe d'interprétation : reprise du dernier résultat présent dans le prompt
+        found = _RESULT_PATTERN.findall(question)
+        return AIMessage(content=found[-1].replace('\\"', '"') if found else "I don't know.")
+
+    def _prompt_tokens(self, messages: list, tools: list | None) -> int:
+        """
+        Tokens de prompt à évaluer : comme Ollama, les schémas des outils liés
+        en font partie, et le plus long préfixe commun avec un prompt en cache
+        est réutilisé.
+        """
+        # Prompt découpé en segments (outils, puis chaque message) avec leur taille
+        segments = [json.dumps(tools)] if tools else []
+        segments += [f"{m.type}:{_text(m)}:{json.dumps(getattr(m, 'tool_calls', None) or [])}" for m in messages]
+        sizes = [estimate_tokens(segment) for segment in segments]
+        best, cached = None, 0
+        for slot in self.prompt_cache:
+            common = 0
+            while common < min(len(slot), len(segments)) and slot[common] == segments[common]:
+                common += 1
+            if common and sum(sizes[:common]) > cached:
+                best, cached = slot, sum(sizes[:common])
+        if self.cache_slots > 0:
+            # Le slot réutilisé (ou le plus ancien) reçoit ce prompt
+            if best is not None:
+                self.prompt_cache.remove(best)
+            self.prompt_cache.append(segments)
+            del self.prompt_cache[:-self.cache_slots]
+        return max(1, sum(sizes) - cached)
+
+    def _metadata(self, message: AIMessage, started_at: float, input_tokens: int) -> AIMessage:
+        output_tokens = estimate_tokens(message.content or json.dumps(message.tool_calls))
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        message.response_metadata = {
+            "model": self.model,
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": input_tokens,
+            "eval_count": output_tokens,
+            "load_duration": 0,
+            "total_duration": int((time.time() - started_at) * 1e9),
+        }
+        return message
+
+    def _delays(self, message: AIMessage, input_tokens: int) -> tuple[float, list[str]]:
+        prompt_delay = self.prompt_latency * input_tokens
+        pieces = re.findall(r"\S+\s*", message.content or "") or [""]
+        return prompt_delay, pieces
+
+    # --------------------------------------------------------
+    # Interface BaseChatModel
+    # --------------------------------------------------------
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        started_at = time.time()
+        message = self._plan(messages, kwargs.get("tools"))
+        input_tokens = self._prompt_tokens(messages, kwargs.get("tools"))
+        prompt_delay, pieces = self._delays(message, input_tokens)
+        time.sleep(prompt_delay + self.token_latency * len(pieces))
+        return ChatResult(generations=[ChatGeneration(message=self._metadata(message, started_at, input_tokens))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        started_at = time.time()
+        message = self._plan(messages, kwargs.get("tools"))
+        input_tokens = self._prompt_tokens(messages, kwargs.get("tools"))
+        prompt_delay, pieces = self._delays(message, input_tokens)
+        await asyncio.sleep(prompt_delay + self.token_latency * len(pieces))
+        return ChatResult(generations=[ChatGeneration(message=self._metadata(message, started_at, input_tokens))])
+
+    def _chunks(self, message: AIMessage, pieces: list[str], started_at: float, input_tokens: int):
+        for piece in pieces[:-1]:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        final = self._metadata(message, started_at, input_tokens)
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content=pieces[-1],
+            tool_call_chunks=[
+                {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                for i, c in enumerate(message.tool_calls)
+            ],
+            usage_metadata=final.usage_metadata,
+            response_metadata=final.response_metadata
+        ))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        started_at = time.time()
+        message = self._plan(messages, kwargs.get("tools"))
+        input_tokens = self._prompt_tokens(messages, kwargs.get("tools"))
+        prompt_delay, pieces = self._delays(message, input_tokens)
+        time.sleep(prompt_delay)
+        for chunk in self._chunks(message, pieces, started_at, input_tokens):
+            time.sleep(self.token_latency)
+            if run_manager and chunk.message.content:
+                run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        started_at = time.time()
+        message = self._plan(messages, kwargs.get("tools"))
+        input_tokens = self._prompt_tokens(messages, kwargs.get("tools"))
+        prompt_delay, pieces = self._delays(message, input_tokens)
+        await asyncio.sleep(prompt_delay)
+        for chunk in self._chunks(message, pieces, started_at, input_tokens):
+            await asyncio.sleep(self.token_latency)
+            if run_manager and chunk.message.content:
+                await run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
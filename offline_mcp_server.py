@@ -0,0 +1,253 @@
+# ------------------------------------------------------------
+# Serveur MCP hors ligne (stdio ou streamable HTTP) : graphe en mémoire
+# ------------------------------------------------------------
+#
+# Remplace `uvx mcp-neo4j-cypher` pour les tests de charge : mêmes noms
+# d'outils (get_neo4j_schema, read_neo4j_cypher, write_neo4j_cypher),
+# données déterministes, aucune base Neo4j nécessaire.
+#
+# Seul un sous-ensemble de Cypher est compris :
+#   MATCH (a:Label {prop: 'valeur'})[-[r:TYPE]->(b:Label {...})]
+#     RETURN count(x) | x | x.prop [LIMIT n]
+#   CREATE (n:Label {prop: 'valeur', ...})
+#   MATCH (n:Label {...}) [DETACH] DELETE n
+
+from mcp.server.fastmcp import FastMCP
+
+# Librairies standards
+import argparse
+import json
+import os
+import re
+import time
+
+# Latence simulée de la base (secondes par requête)
+OFFLINE_MCP_LATENCY = float(os.getenv("OFFLINE_MCP_LATENCY", "0"))
+
+
+# ------------------------------------------------------------
+# Graphe de démonstration (28 nœuds)
+# ------------------------------------------------------------
+
+def build_sample_graph() -> tuple[dict, list]:
+    """
+    Construit le graphe de démonstration utilisé par test_multi :
+    28 nœuds, 7 produits, 12 employés travaillant pour Acme Inc.
+    """
+    nodes = {}
+    rels = []
+
+    def add(label, **props):
+        node_id = len(nodes)
+        nodes[node_id] = {"labels": [label], "props": props}
+        return node_id
+
+    acme = add("Company", name="Acme Inc")
+    globex = add("Company", name="Globex")
+    departments = [add("Department", name=n) for n in ("Finance", "Engineering", "Sales", "Support")]
+    locations = [add("Location", name=n) for n in ("Oslo", "Paris", "Berlin")]
+    products = [add("Product", name=f"Product {i + 1}", price=10 * (i + 1)) for i in range(7)]
+    employees = [add("Employee", name=n) for n in (
+        "Alice Brown", "Bob Smith", "Carol White", "Dan Green", "Eve Black", "Frank Blue",
+        "Grace Gray", "Heidi Stone", "Ivan Wood", "Judy Hill", "Mallory Fox", "Oscar Lake"
+    )]
+
+    for i, employee in enumerate(employees):
+        rels.append((employee, "WORKS_FOR", acme, {}))
+        rels.append((employee, "WORKS_IN", departments[i % len(departments)], {}))
+    for i, product in enumerate(products):
+        rels.append(((acme, globex)[i % 2], "PRODUCES", product, {}))
+    rels.append((acme, "LOCATED_IN", locations[0], {}))
+    rels.append((globex, "LOCATED_IN", locations[1], {}))
+    return nodes, rels
+
+
+NODES, RELS = build_sample_graph()
+
+
+# ------------------------------------------------------------
+# Mini-interpréteur Cypher
+# ------------------------------------------------------------
+
+_NODE = r"\((\w*)\s*(?::\s*`?(\w+)`?)?\s*(\{[^}]*\})?\s*\)"
+_REL = r"-\[\s*(\w*)\s*(?::\s*`?(\w+)`?)?\s*\]->"
+_MATCH = re.compile(
+    rf"^\s*MATCH\s+{_NODE}(?:\s*{_REL}\s*{_NODE})?\s*(.*)$",
+    re.IGNORECASE | re.DOTALL
+)
+_CREATE = re.compile(rf"^\s*CREATE\s+{_NODE}\s*(?:RETURN\s+(\w+))?\s*;?\s*$", re.IGNORECASE | re.DOTALL)
+_RETURN = re.compile(
+    r"^RETURN\s+(count\(\s*(\w*|\*)\s*\)|[\w.]+)(?:\s+AS\s+(\w+))?\s*(?:LIMIT\s+(\d+))?\s*;?\s*$",
+    re.IGNORECASE
+)
+_DELETE = re.compile(r"^(DETACH\s+)?DELETE\s+(\w+)\s*;?\s*$", re.IGNORECASE)
+_PROP = re.compile(r"(\w+)\s*:\s*('([^']*)'|\"([^\"]*)\"|\$(\w+)|-?\d+(?:\.\d+)?)")
+
+
+def parse_props(text: str | None, params: dict) -> dict:
+    props = {}
+    for key, raw, single, double, param in _PROP.findall(text or ""):
+        if param:
+            props[key] = params.get(param)
+        elif raw.startswith(("'", '"')):
+            props[key] = single or double
+        else:
+            props[key] = float(raw) if "." in raw else int(raw)
+    return props
+
+
+def node_matches(node_id: int, label: str | None, props: dict) -> bool:
+    node = NODES[node_id]
+    if label and label not in node["labels"]:
+        return False
+    return all(node["props"].get(k) == v for k, v in props.items())
+
+
+def serialize_node(node_id: int) -> dict:
+    return dict(NODES[node_id]["props"])
+
+
+def match_rows(m, params: dict) -> list[dict]:
+    """
+    Retourne les liaisons {variable: id} correspondant au motif MATCH.
+    """
+    a_var, a_label, a_props, r_var, r_type, b_var, b_label, b_props = m.groups()[:8]
+    has_relationship = r_var is not None
+    a_props, b_props = parse_props(a_props, params), parse_props(b_props, params)
+    starts = [n for n in NODES if node_matches(n, a_label, a_props)]
+    if not has_relationship:
+        return [{a_var or "_a": n} for n in starts]
+    rows = []
+    start_set = set(starts)
+    for index, (src, rel_type, dst, _) in enumerate(RELS):
+        if src in start_set and (not r_type or rel_type == r_type) and node_matches(dst, b_label, b_props):
+            rows.append({a_var or "_a": src, r_var or "_r": ("rel", index), b_var or "_b": dst})
+    return rows
+
+
+def run_cypher(query: str, params: dict | None = None, write: bool = False) -> list[dict]:
+    """
+    Exécute une requête Cypher (sous-ensemble) sur le graphe en mémoire.
+    """
+    params = params or {}
+
+    create = _CREATE.match(query)
+    if create:
+        if not write:
+            raise ValueError("Write queries are not allowed with read_neo4j_cypher")
+        var, label, props, returned = create.groups()
+        node_id = max(NODES, default=-1) + 1
+        NODES[node_id] = {"labels": [label] if label else [], "props": parse_props(props, params)}
+        return [{returned: serialize_node(node_id)}] if returned else []
+
+    m = _MATCH.match(query)
+    if not m:
+        raise ValueError(f"Unsupported Cypher for the offline server: {query}")
+    tail = m.group(9).strip()
+    rows = match_rows(m, params)
+
+    delete = _DELETE.match(tail)
+    if delete:
+        if not write:
+            raise ValueError("Write queries are not allowed with read_neo4j_cypher")
+        doomed = {row[delete.group(2)] for row in rows if delete.group(2) in row}
+        for node_id in doomed:
+            NODES.pop(node_id, None)
+        RELS[:] = [r for r in RELS if r[0] not in doomed and r[2] not in doomed]
+        return []
+
+    ret = _RETURN.match(tail)
+    if not ret:
+        raise ValueError(f"Unsupported RETURN clause for the offline server: {tail}")
+    expression, count_var, alias, limit = ret.groups()
+    column = alias or expression
+    if count_var is not None:
+        if count_var in ("", "*"):
+            return [{column: len(rows)}]
+        return [{column: len({row[count_var] for row in rows if count_var in row})}]
+
+    var, _, prop = expression.partition(".")
+    values = []
+    for row in rows:
+        value = row.get(var)
+        if isinstance(value, tuple):
+            value = RELS[value[1]][1]
+        elif value is not None:
+            value = NODES[value]["props"].get(prop) if prop else serialize_node(value)
+        values.append({column: value})
+    return values[:int(limit)] if limit else values
+
+
+def graph_schema() -> dict:
+    """
+    Schéma au format proche de `apoc.meta.schema` (labels, relations, propriétés).
+    """
+    schema = {}
+    for node in NODES.values():
+        for label in node["labels"]:
+            entry = schema.setdefault(label, {"type": "node", "count": 0, "properties": {}, "relationships": {}})
+            entry["count"] += 1
+            for key, value in node["props"].items():
+                entry["properties"][key] = {"type": type(value).__name__.upper()}
+    for src, rel_type, dst, _ in RELS:
+        for label in NODES[src]["labels"]:
+            schema[label]["relationships"][rel_type] = {
+                "direction": "out",
+                "labels": NODES[dst]["labels"]
+            }
+        entry = schema.setdefault(rel_type, {"type": "relationship", "count": 0, "properties": {}})
+        entry["count"] += 1
+    return schema
+
+
+# ------------------------------------------------------------
+# Outils MCP (mêmes noms que mcp-neo4j-cypher)
+# ------------------------------------------------------------
+
+mcp = FastMCP("offline-neo4j-cypher", log_level="WARNING")
+
+
+def _simulate_latency():
+    if OFFLINE_MCP_LATENCY > 0:
+        time.sleep(OFFLINE_MCP_LATENCY)
+
+
+@mcp.tool()
+def get_neo4j_schema() -> str:
+    """List all node labels, their attributes and their relationships to other node labels in the neo4j database."""
+    _simulate_latency()
+    return json.dumps(graph_schema())
+
+
+@mcp.tool()
+def read_neo4j_cypher(query: str, params: dict | None = None) -> str:
+    """Execute a read Cypher query on the neo4j database."""
+    _simulate_latency()
+    return json.dumps(run_cypher(query, params, write=False), default=str)
+
+
+@mcp.tool()
+def write_neo4j_cypher(query: str, params: dict | None = None) -> str:
+    """Execute a write Cypher query on the neo4j database."""
+    _simulate_latency()
+    before = (len(NODES), len(RELS))
+    run_cypher(query, params, write=True)
+    return json.dumps({
+        "nodes_created": max(0, len(NODES) - before[0]),
+        "nodes_deleted": max(0, before[0] - len(NODES)),
+        "relationships_deleted": max(0, before[1] - len(RELS)),
+    })
+
+
+if __name__ == "__main__":
+    # stdio par défaut ; streamable HTTP pour un serveur partagé (mcp_http_servers.py)
+    parser = argparse.ArgumentParser(description="Serveur MCP hors ligne (graphe en mémoire)")
+    parser.add_argument("--transport", choices=["stdio", "streamable-http"], default="stdio")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--path", default="/mcp/")
+    args = parser.parse_args()
+    mcp.settings.host = args.host
+    mcp.settings.port = args.port
+    mcp.settings.streamable_http_path = args.path
+    mcp.run(transport=args.transport)
@@ -0,0 +1,174 @@
+from collections import deque
+from contextlib import asynccontextmanager
+import asyncio
+import math
+import time
+
+
+class SchedulerSaturated(Exception):
+    """Raised when a request cannot be admitted (queue full or wait too long)."""
+
+    def __init__(self, model: str, reason: str, retry_after: int):
+        super().__init__(f"Model '{model}' is saturated ({reason}), retry after {retry_after}s")
+        self.model = model
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Lane:
+    """Concurrency slots, wait queue and timings for a single model."""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.semaphore = asyncio.Semaphore(self.limit)
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds = deque(maxlen=1000)
+        self.service_seconds = deque(maxlen=100)
+
+
+class Ticket:
+    """An admitted request; `release()` frees its slot (safe to call twice)."""
+
+    def __init__(self, lane: _Lane):
+        self._lane = lane
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._lane.in_flight -= 1
+        self._lane.service_seconds.append(time.monotonic() - self._started)
+        self._lane.semaphore.release()
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class AdmissionScheduler:
+    """
+    Admission control in front of the agents.
+
+    Each model gets a concurrency limit. Requests beyond it wait in a
+    bounded FIFO queue for at most `max_queue_seconds`. When the queue is
+    full or the wait times out, `SchedulerSaturated` is raised with a
+    Retry-After estimate so the API can answer 429 instead of piling work
+    onto Ollama and the MCP servers.
+    """
+
+    def __init__(self, default_limit: int = 2, model_limits: dict | None = None,
+                 max_queue_size: int = 32, max_queue_seconds: float = 30.0):
+        """
+        Args:
+            default_limit: Concurrent requests allowed per model
+            model_limits: Per-model overrides of the concurrency limit
+            max_queue_size: Requests allowed to wait per model
+            max_queue_seconds: Maximum time a request may wait for a slot
+        """
+        self.default_limit = default_limit
+        self.model_limits = model_limits or {}
+        self.max_queue_size = max_queue_size
+        self.max_queue_seconds = max_queue_seconds
+        self._lanes: dict[str, _Lane] = {}
+
+    def _lane(self, model: str) -> _Lane:
+        if model not in self._lanes:
+            self._lanes[model] = _Lane(self.model_limits.get(model, self.default_limit))
+        return self._lanes[model]
+
+    def _retry_after(self, lane: _Lane) -> int:
+        if not lane.service_seconds:
+            return max(1, math.ceil(self.max_queue_seconds))
+        avg = sum(lane.service_seconds) / len(lane.service_seconds)
+        return max(1, math.ceil(avg * (lane.waiting + 1) / lane.limit))
+
+    def _reject(self, model: str, lane: _Lane, reason: str):
+        lane.rejected += 1
+        raise SchedulerSaturated(model, reason, self._retry_after(lane))
+
+    async def acquire(self, model: str) -> Ticket:
+        """
+        Wait for a concurrency slot for the model.
+
+        Args:
+            model: The model the request will run on
+
+        Returns:
+            Ticket: Release it when the request completes
+
+        Raises:
+            SchedulerSaturated: If the queue is full or the wait exceeds the limit
+        """
+        lane = self._lane(model)
+        if lane.semaphore.locked() and lane.waiting >= self.max_queue_size:
+            self._reject(model, lane, "queue full")
+
+        lane.waiting += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(lane.semaphore.acquire(), self.max_queue_seconds)
+        except asyncio.TimeoutError:
+            lane.timed_out += 1
+            self._reject(model, lane, "queue timeout")
+        finally:
+            lane.waiting -= 1
+
+        lane.wait_seconds.append(time.monotonic() - start)
+        lane.admitted += 1
+        lane.in_flight += 1
+        return Ticket(lane)
+
+    @asynccontextmanager
+    async def admit(self, model: str):
+        """Hold a concurrency slot for the model for the duration of the block."""
+        ticket = await self.acquire(model)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def stats(self) -> dict:
+        """Queue depth, in-flight count and wait-time percentiles per model."""
+        return {
+            model: {
+                "limit": lane.limit,
+                "in_flight": lane.in_flight,
+                "queue_depth": lane.waiting,
+                "admitted": lane.admitted,
+                "rejected": lane.rejected,
+                "timed_out": lane.timed_out,
+                "wait_seconds_p50": round(_percentile(lane.wait_seconds, 0.5), 3),
+                "wait_seconds_p95": round(_percentile(lane.wait_seconds, 0.95), 3),
+                "wait_seconds_max": round(max(lane.wait_seconds, default=0.0), 3),
+            }
+            for model, lane in self._lanes.items()
+        }
+
+
+def parse_model_limits(value: str) -> dict:
+    """
+    Parse per-model limits from an env var, e.g. "llama3.2:4,mistral:1".
+
+    Args:
+        value: Comma-separated `model:limit` pairs
+
+    Returns:
+        dict: Model name to limit
+    """
+    limits = {}
+    for item in value.split(","):
+        if ":" not in item:
+            continue
+        # Model names may contain ':' (e.g. "qwen3:8b"), the limit is the last part
+        model, limit = item.strip().rsplit(":", 1)
+        limits[model] = int(limit)
+    return limits
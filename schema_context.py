@@ -0,0 +1,343 @@
+# ------------------------------------------------------------
+# Contexte de schéma précalculé, injecté dans le prompt système
+# ------------------------------------------------------------
+
+# Messages LangChain (prompt système, détection des écritures)
+from langchain_core.messages import AIMessage, SystemMessage, ToolMessage
+
+# Détection des appels d'outils en écriture
+from answer_cache import is_write_tool_call
+
+# Mode hors ligne (pas de base Neo4j)
+from offline import OFFLINE_MODE
+
+# Librairies standards
+import asyncio
+import json
+import os
+import time
+
+# Chargement des variables d’environnement (.env)
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# ------------------------------------------------------------
+# Configuration
+# ------------------------------------------------------------
+
+SCHEMA_CONTEXT_ENABLED = os.getenv("SCHEMA_CONTEXT_ENABLED", "true").lower() == "true"
+
+# Rafraîchissement périodique (secondes) en plus du rafraîchissement après écriture
+SCHEMA_REFRESH_SECONDS = float(os.getenv("SCHEMA_REFRESH_SECONDS", "300"))
+
+# Taille maximale du résumé injecté dans le prompt
+SCHEMA_MAX_CHARS = int(os.getenv("SCHEMA_MAX_CHARS", "4000"))
+
+# Outil MCP de repli lorsque le driver n'est pas configuré
+SCHEMA_TOOL_NAME = "get_neo4j_schema"
+
+
+# Effectifs en une requête, lus dans le count store (APOC, déjà requis par
+# l'outil get_neo4j_schema de mcp-neo4j-cypher)
+COUNTS_QUERY = (
+    "CALL apoc.meta.stats() YIELD labels, relTypesCount, nodeCount, relCount "
+    "RETURN labels, relTypesCount AS types, nodeCount AS nodes, relCount AS rels"
+)
+
+# Repli sans APOC : une requête, mais un parcours des nœuds et des relations
+COUNTS_SCAN_QUERY = (
+    "CALL { MATCH (n) RETURN count(n) AS nodes } "
+    "CALL { MATCH ()-[r]->() RETURN count(r) AS rels } "
+    "CALL { MATCH (n) UNWIND labels(n) AS label WITH label, count(*) AS c "
+    "RETURN collect([label, c]) AS labels } "
+    "CALL { MATCH ()-[r]->() WITH type(r) AS type, count(*) AS c "
+    "RETURN collect([type, c]) AS types } "
+    "RETURN labels, types, nodes, rels"
+)
+
+
+class SchemaContext:
+    """
+    Résumé compact du schéma du graphe (labels, types de relations,
+    propriétés, effectifs) placé dans le prompt système de l'agent.
+
+    Les questions sur le schéma lui-même peuvent ainsi être résolues en un
+    seul tour LLM ; les effectifs, relus après chaque écriture de l'agent
+    ou sur le minuteur, sont présentés comme approximatifs (datés). Les
+    propriétés et motifs ne sont relus que si les labels ou types ont
+    changé, ou sur le minuteur périodique.
+    """
+
+    def __init__(self, uri: str | None = None, user: str | None = None,
+                 password: str | None = None, database: str | None = None,
+                 refresh_seconds: float = SCHEMA_REFRESH_SECONDS,
+                 max_chars: int = SCHEMA_MAX_CHARS):
+        # En mode hors ligne, le schéma est lu via l'outil MCP du serveur local
+        self.uri = uri or (None if OFFLINE_MODE else os.getenv("NEO4J_URI"))
+        self.user = user or os.getenv("NEO4J_USERNAME")
+        self.password = password or os.getenv("NEO4J_PASSWORD")
+        self.database = database or os.getenv("NEO4J_DATABASE", "neo4j")
+        self.refresh_seconds = refresh_seconds
+        self.max_chars = max_chars
+        self.driver = None
+        self.schema_tool = None
+
+        # Schéma courant
+        self.label_counts = {}
+        self.rel_counts = {}
+        self.node_properties = {}
+        self.rel_properties = {}
+        self.patterns = []
+        self.total_nodes = 0
+        self.total_rels = 0
+        self.raw_schema = None
+        self.summary = ""
+
+        self.refreshed_at = 0.0
+        # Date de lecture du résumé courant (les effectifs datent de là)
+        self.summary_read_at = 0.0
+        self.refreshes = 0
+        # apoc.meta.stats disponible (None : pas encore essayé)
+        self._apoc_stats = None
+        self._dirty = True
+        self._lock = asyncio.Lock()
+        self._background = None
+        self._seen_write_calls = set()
+
+    # --------------------------------------------------------
+    # Cycle de vie
+    # --------------------------------------------------------
+
+    async def start(self, tools: list | None = None, refresh: bool = True):
+        """
+        Ouvre le driver (ou repère l'outil MCP de schéma) et calcule le
+        résumé ; sans `refresh`, le calcul attend le premier prompt.
+        """
+        if self.uri and self.driver is None:
+            # Import différé : le driver Neo4j (et pandas) n'est chargé qu'ici
+            from neo4j import AsyncGraphDatabase
+            self.driver = AsyncGraphDatabase.driver(self.uri, auth=(self.user, self.password))
+        if tools:
+            self.schema_tool = next((t for t in tools if t.name == SCHEMA_TOOL_NAME), None)
+        if refresh:
+            await self.ensure_loaded()
+        return self
+
+    async def ensure_loaded(self):
+        """
+        Lit le schéma s'il ne l'a pas encore été (démarrage différé).
+        """
+        if self._dirty:
+            await self.refresh(full=True)
+
+    async def close(self):
+        if self._background is not None:
+            self._background.cancel()
+            self._background = None
+        if self.driver is not None:
+            await self.driver.close()
+            self.driver = None
+
+    def detach(self, tools: list | None):
+        """
+        Oublie l'outil MCP de schéma s'il appartient à un agent qui se ferme
+        (cas d'un contexte partagé entre plusieurs agents).
+        """
+        if tools and self.schema_tool in tools:
+            self.schema_tool = None
+
+    # --------------------------------------------------------
+    # Lecture du schéma
+    # --------------------------------------------------------
+
+    async def _query(self, session, cypher: str) -> list:
+        result = await session.run(cypher)
+        return [record async for record in result]
+
+    async def _read_counts(self, session):
+        """
+        Effectifs par label et par type de relation, et totaux, en une
+        seule requête par rafraîchissement.
+        """
+        from neo4j.exceptions import ClientError
+        row = None
+        if self._apoc_stats is not False:
+            try:
+                row = (await self._query(session, COUNTS_QUERY))[0]
+                self._apoc_stats = True
+            except ClientError as e:
+                print(f"apoc.meta.stats indisponible, effectifs par parcours du graphe : {e}")
+                self._apoc_stats = False
+        if row is None:
+            row = (await self._query(session, COUNTS_SCAN_QUERY))[0]
+        # Map (APOC) ou liste de paires (repli)
+        return dict(row["labels"]), dict(row["types"]), row["nodes"], row["rels"]
+
+    async def _read_structure(self, session):
+        node_properties = {}
+        for r in await self._query(
+            session, "CALL db.schema.nodeTypeProperties() YIELD nodeLabels, propertyName "
+                     "RETURN nodeLabels, propertyName"
+        ):
+            if r["propertyName"]:
+                for label in r["nodeLabels"]:
+                    node_properties.setdefault(label, set()).add(r["propertyName"])
+        rel_properties = {}
+        for r in await self._query(
+            session, "CALL db.schema.relTypeProperties() YIELD relType, propertyName "
+                     "RETURN relType, propertyName"
+        ):
+            if r["propertyName"]:
+                rel_type = r["relType"].lstrip(":").strip("`")
+                rel_properties.setdefault(rel_type, set()).add(r["propertyName"])
+        patterns = set()
+        for r in await self._query(session, "CALL db.schema.visualization() YIELD relationships RETURN relationships"):
+            for rel in r["relationships"]:
+                start = next(iter(rel.start_node.labels), "?")
+                end = next(iter(rel.end_node.labels), "?")
+                patterns.add(f"(:{start})-[:{rel.type}]->(:{end})")
+        return node_properties, rel_properties, sorted(patterns)
+
+    async def refresh(self, full: bool = False):
+        """
+        Relit le schéma. Sans `full`, seuls les effectifs sont relus, sauf
+        si l'ensemble des labels ou des types de relations a changé.
+        """
+        requested_at = time.time()
+        async with self._lock:
+            # Un autre appel a déjà rafraîchi le schéma pendant l'attente
+            if not full and self.refreshed_at >= requested_at:
+                return
+            try:
+                if self.driver is not None:
+                    async with self.driver.session(database=self.database) as session:
+                        label_counts, rel_counts, total_nodes, total_rels = await self._read_counts(session)
+                        changed = (set(label_counts) != set(self.label_counts)
+                                   or set(rel_counts) != set(self.rel_counts))
+                        if full or changed or not self.refreshes:
+                            self.node_properties, self.rel_properties, self.patterns = \
+                                await self._read_structure(session)
+                    self.label_counts, self.rel_counts = label_counts, rel_counts
+                    self.total_nodes, self.total_rels = total_nodes, total_rels
+                elif self.schema_tool is not None:
+                    self.raw_schema = str(await self.schema_tool.ainvoke({}))
+                else:
+                    return
+                self.summary = self._build_summary()
+                self.summary_read_at = time.time()
+                self.refreshes += 1
+                self._dirty = False
+            except Exception as e:
+                # Pas de nouvel essai à chaque tour LLM : le minuteur prendra le relais
+                print(f"Échec du rafraîchissement du schéma : {e}")
+                self._dirty = False
+            finally:
+                self.refreshed_at = time.time()
+
+    def _build_summary(self) -> str:
+        if self.driver is None:
+            summary = f"Graph schema:\n{self.raw_schema}"
+        else:
+            lines = [f"Total nodes: {self.total_nodes}, total relationships: {self.total_rels}", "Node labels (count) and properties:"]
+            for label, count in sorted(self.label_counts.items()):
+                props = ", ".join(sorted(self.node_properties.get(label, ())))
+                lines.append(f"- {label} ({count})" + (f": {props}" if props else ""))
+            lines.append("Relationship types (count) and properties:")
+            for rel_type, count in sorted(self.rel_counts.items()):
+                props = ", ".join(sorted(self.rel_properties.get(rel_type, ())))
+                lines.append(f"- {rel_type} ({count})" + (f": {props}" if props else ""))
+            if self.patterns:
+                lines.append("Patterns: " + ", ".join(self.patterns))
+            summary = "\n".join(lines)
+        if len(summary) > self.max_chars:
+            summary = summary[:self.max_chars] + "\n...[truncated]"
+        return summary
+
+    def known_names(self) -> set[str] | None:
+        """
+        Labels et types de relations connus (None si le schéma brut de
+        l'outil MCP n'est pas lisible).
+        """
+        if self.label_counts or self.rel_counts:
+            return set(self.label_counts) | set(self.rel_counts)
+        try:
+            schema = json.loads(self.raw_schema or "")
+        except ValueError:
+            return None
+        # Format apoc.meta.schema : {nom: {"type": "node"|"relationship", "relationships": {...}}}
+        if isinstance(schema, dict):
+            entries = schema.items()
+        elif isinstance(schema, list):
+            entries = [(entry.get("label"), entry) for entry in schema if isinstance(entry, dict)]
+        else:
+            return None
+        names = set()
+        for name, entry in entries:
+            if name:
+                names.add(name)
+            if isinstance(entry, dict) and isinstance(entry.get("relationships"), dict):
+                names.update(entry["relationships"])
+        return names or None
+
+    # --------------------------------------------------------
+    # Prompt système
+    # --------------------------------------------------------
+
+    def system_prompt(self) -> str:
+        # Les effectifs ne sont relus qu'après une écriture de cet agent ou sur
+        # le minuteur : une écriture d'un autre client n'y apparaît pas encore
+        read_at = time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime(self.summary_read_at))
+        return (
+            "You are an assistant answering questions about a Neo4j graph database "
+            "using the available tools.\n"
+            f"Graph schema summary (counts are approximate, as of {read_at}):\n"
+            f"{self.summary}\n"
+            "If the question is about the schema itself (labels, relationship types, "
+            "properties, patterns), answer directly from this summary without calling "
+            "any tool. For counts and data, query the graph with Cypher, using these "
+            "labels, relationship types and properties; the summary counts may only be "
+            "quoted as approximate."
+        )
+
+    def _new_write_in_state(self, messages: list) -> bool:
+        """
+        Vrai si le dernier tour d'outils contient une écriture pas encore prise en compte.
+        """
+        if not messages or not isinstance(messages[-1], ToolMessage):
+            return False
+        for message in reversed(messages):
+            if isinstance(message, AIMessage) and message.tool_calls:
+                writes = {
+                    call["id"] for call in message.tool_calls
+                    if is_write_tool_call(call["name"], call.get("args"))
+                } - self._seen_write_calls
+                if len(self._seen_write_calls) > 10000:
+                    self._seen_write_calls.clear()
+                self._seen_write_calls |= writes
+                return bool(writes)
+        return False
+
+    async def prompt(self, state) -> list:
+        """
+        Prompt LangGraph : message système avec le schéma, puis l'historique.
+        Relit le schéma après une écriture et le rafraîchit en tâche de fond
+        lorsqu'il a dépassé son intervalle de validité.
+        """
+        messages = list(state["messages"] if isinstance(state, dict) else state.messages)
+        if self._dirty or self._new_write_in_state(messages):
+            await self.refresh()
+        elif (self.refresh_seconds > 0 and time.time() - self.refreshed_at > self.refresh_seconds
+              and (self._background is None or self._background.done())):
+            self._background = asyncio.create_task(self.refresh(full=True))
+        if not self.summary:
+            return messages
+        return [SystemMessage(content=self.system_prompt())] + messages
+
+
+def schema_context_from_env() -> SchemaContext | None:
+    """
+    Construit le contexte de schéma selon les variables d'environnement
+    (None si SCHEMA_CONTEXT_ENABLED=false).
+    """
+    return SchemaContext() if SCHEMA_CONTEXT_ENABLED else None
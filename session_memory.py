@@ -0,0 +1,354 @@
+# ------------------------------------------------------------
+# Mémoire de conversation par session (checkpointer LangGraph)
+# ------------------------------------------------------------
+#
+# Sans session, chaque message est traité isolément : une question de
+# suivi (« et combien travaillent chez Acme ? ») relance tout depuis zéro.
+# Les agents "de session" sont compilés avec un checkpointer LangGraph et
+# l'historique de chaque conversation est rangé sous son thread_id
+# (l'identifiant de session) :
+#   1. budget de tokens par session (SESSION_TOKEN_BUDGET) ;
+#   2. au-delà du budget, les anciens tours sont compactés : résumés par le
+#      LLM (SESSION_COMPACTION=summary) ou réduits aux questions et réponses
+#      finales (trim) ; les SESSION_KEEP_TURNS derniers tours restent intacts ;
+#   3. préfixe de prompt stable : l'historique n'est réécrit qu'à la
+#      compaction, les tours suivants ne font qu'ajouter des messages, et le
+#      modèle et les outils liés restent ceux de la session. Ollama réutilise
+#      ainsi son cache KV pour tout le début du prompt.
+# Après chaque tour, le thread est réécrit en un seul checkpoint (état
+# validé) : la mémoire reste bornée et un tour en échec est annulé.
+
+# Checkpointer et graphe d'écriture LangGraph
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import StateGraph, MessagesState, START
+
+# Messages LangChain
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+# Modèle LLM partagé et extraction des réponses
+from main_simple import get_model, get_messages, get_final_answer, extract_content, truncate_to_tokens
+
+# Métriques Prometheus (tours, compactions)
+from metrics import REGISTRY
+
+# Librairies standards
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import asyncio
+import os
+import time
+
+# Chargement des variables d’environnement (.env)
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# ------------------------------------------------------------
+# Configuration
+# ------------------------------------------------------------
+
+# Budget (en tokens) de l'historique conservé par session
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "4000"))
+
+# Derniers tours conservés tels quels lors d'une compaction
+SESSION_KEEP_TURNS = int(os.getenv("SESSION_KEEP_TURNS", "2"))
+
+# "summary" (résumé LLM) ou "trim" (questions et réponses finales uniquement)
+SESSION_COMPACTION = os.getenv("SESSION_COMPACTION", "summary")
+
+# Modèle du résumé (vide : modèle de la session)
+SESSION_SUMMARY_MODEL = os.getenv("SESSION_SUMMARY_MODEL", "")
+
+# Durée de vie d'une session inactive (secondes) et nombre maximal de sessions
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+SUMMARY_PROMPT = (
+    "Summarize the following conversation between a user and an assistant querying "
+    "a Neo4j graph database.\n"
+    "Keep every fact, number, name, label and Cypher query that a follow-up question "
+    "could refer to. Be concise.\n"
+    "{conversation}\n"
+    "Summary:"
+)
+
+SESSION_TURNS = REGISTRY.counter(
+    "session_turns_total", "Tours de conversation (premier tour ou suivi)", ("kind",)
+)
+SESSION_COMPACTIONS = REGISTRY.counter(
+    "session_compactions_total", "Compactions de l'historique des sessions", ("mode",)
+)
+
+
+def message_tokens(messages: list) -> int:
+    """
+    Estimation du nombre de tokens d'une liste de messages (~4 caractères
+    par token), appels d'outils compris.
+    """
+    chars = 0
+    for message in messages:
+        chars += len(extract_content(message))
+        if isinstance(message, AIMessage) and message.tool_calls:
+            chars += len(str(message.tool_calls))
+    return chars // 4
+
+
+def split_turns(messages: list) -> tuple[list, list[list]]:
+    """
+    Sépare l'historique en messages de tête (résumé) et en tours, chacun
+    commençant par une question de l'utilisateur.
+    """
+    leading, turns = [], []
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            turns.append([message])
+        elif turns:
+            turns[-1].append(message)
+        else:
+            leading.append(message)
+    return leading, turns
+
+
+def current_turn(state) -> dict:
+    """
+    État LangGraph réduit au dernier tour (interprétation, statistiques).
+    """
+    messages = get_messages(state)
+    last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=0)
+    return {"messages": messages[last_human:]}
+
+
+def turn_text(turn: list, max_tokens: int = 300) -> str:
+    """
+    Tour réduit à la question, aux sorties d'outils (tronquées) et à la réponse.
+    """
+    lines = [f"User: {extract_content(turn[0])}"]
+    for message in turn[1:]:
+        if isinstance(message, ToolMessage):
+            lines.append(f"Tool output: {truncate_to_tokens(extract_content(message), max_tokens)}")
+    lines.append(f"Assistant: {get_final_answer({'messages': turn})}")
+    return "\n".join(lines)
+
+
+class Session:
+    """
+    Conversation en cours : historique validé, modèle et outils épinglés
+    (pour garder le même préfixe de prompt d'un tour à l'autre).
+    """
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.messages = []
+        self.model = None
+        self.tool_names = None
+        self.turns = 0
+        self.compactions = 0
+        self.last_used = time.time()
+        self.lock = asyncio.Lock()
+        # Compaction en cours, attendue par le tour suivant
+        self.pending = None
+
+    @property
+    def config(self) -> dict:
+        return {"configurable": {"thread_id": self.id}}
+
+    @property
+    def follow_up(self) -> bool:
+        return bool(self.messages)
+
+    def pin_tools(self, tool_names: tuple | None) -> tuple | None:
+        """
+        Outils liés pour ce tour : ceux de la session, étendus si la
+        sélection en retient de nouveaux (le préfixe ne change qu'alors).
+        """
+        if tool_names is None:
+            return None
+        if self.tool_names is None or not set(tool_names) <= set(self.tool_names):
+            self.tool_names = tuple(sorted(set(tool_names) | set(self.tool_names or ())))
+        return self.tool_names
+
+    def info(self) -> dict:
+        return {
+            "session_id": self.id,
+            "turn": self.turns,
+            "history_tokens": message_tokens(self.messages),
+            "compactions": self.compactions,
+        }
+
+
+class SessionMemory:
+    """
+    Sessions de conversation (LRU + expiration) et leur historique dans un
+    checkpointer LangGraph partagé par les agents de session.
+
+        async with memory.open(session_id) as session:
+            state = await agent.ainvoke({"messages": request}, session.config)
+            await memory.commit(session, state, model)
+    """
+
+    def __init__(self, token_budget: int = SESSION_TOKEN_BUDGET, keep_turns: int = SESSION_KEEP_TURNS,
+                 compaction: str = SESSION_COMPACTION, summary_model: str = SESSION_SUMMARY_MODEL,
+                 ttl: float = SESSION_TTL, max_sessions: int = SESSION_MAX_SESSIONS):
+        self.token_budget = token_budget
+        self.keep_turns = max(1, keep_turns)
+        self.compaction = compaction
+        self.summary_model = summary_model
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.checkpointer = InMemorySaver()
+        self.sessions = OrderedDict()
+        # Graphe minimal écrivant l'état validé d'une session dans le checkpointer
+        graph = StateGraph(MessagesState)
+        graph.add_node("write", lambda state: {})
+        graph.add_edge(START, "write")
+        self._writer = graph.compile(checkpointer=self.checkpointer)
+        self._tasks = set()
+        self.evictions = 0
+
+    # --------------------------------------------------------
+    # Sessions
+    # --------------------------------------------------------
+
+    @asynccontextmanager
+    async def open(self, session_id: str):
+        """
+        Ouvre (ou crée) une session. Les tours d'une même session sont
+        exécutés l'un après l'autre.
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = Session(session_id)
+        self.sessions.move_to_end(session_id)
+        try:
+            async with session.lock:
+                session.last_used = time.time()
+                if session.pending is not None:
+                    await session.pending
+                    session.pending = None
+                yield session
+        finally:
+            await self.evict()
+
+    async def evict(self):
+        """
+        Supprime les sessions expirées, puis les moins récentes au-delà de
+        `max_sessions` (jamais une session en cours de tour).
+        """
+        now = time.time()
+        for session_id, session in list(self.sessions.items()):
+            expired = self.ttl > 0 and now - session.last_used > self.ttl
+            if (expired or len(self.sessions) > self.max_sessions) and not session.lock.locked():
+                await self.delete(session_id)
+                self.evictions += 1
+
+    async def delete(self, session_id: str) -> bool:
+        session = self.sessions.pop(session_id, None)
+        await self.checkpointer.adelete_thread(session_id)
+        return session is not None
+
+    # --------------------------------------------------------
+    # Historique
+    # --------------------------------------------------------
+
+    async def _write(self, session: Session, messages: list):
+        """
+        Réécrit le thread de la session en un seul checkpoint.
+        """
+        await self.checkpointer.adelete_thread(session.id)
+        if messages:
+            await self._writer.aupdate_state(session.config, {"messages": messages}, as_node="write")
+        session.messages = messages
+
+    async def rollback(self, session: Session):
+        """
+        Annule un tour inachevé (échec, reprise par un autre modèle).
+        """
+        await self._write(session, session.messages)
+
+    async def commit(self, session: Session, state, model: str):
+        """
+        Valide le tour (état final de l'agent) ; au-delà du budget, les
+        anciens tours sont compactés en tâche de fond, avant le tour suivant.
+        """
+        SESSION_TURNS.inc(kind="follow_up" if session.follow_up else "first")
+        session.turns += 1
+        await self._write(session, get_messages(state))
+        if message_tokens(session.messages) > self.token_budget:
+            session.pending = asyncio.create_task(self._compact(session, model))
+            self._tasks.add(session.pending)
+            session.pending.add_done_callback(self._tasks.discard)
+
+    async def record(self, session: Session, request: str, answer: str, model: str):
+        """
+        Ajoute à l'historique un tour répondu hors de l'agent (cache, chemin direct).
+        """
+        await self.commit(session, {"messages": session.messages + [HumanMessage(request), AIMessage(answer)]}, model)
+
+    # --------------------------------------------------------
+    # Compaction
+    # --------------------------------------------------------
+
+    async def _compact(self, session: Session, model: str):
+        # Aucun tour ne démarre dans la session avant la fin de cette tâche
+        messages, mode = await self.compact(session.messages, self.summary_model or session.model or model)
+        if messages is not session.messages and self.sessions.get(session.id) is session:
+            await self._write(session, messages)
+            session.compactions += 1
+            SESSION_COMPACTIONS.inc(mode=mode)
+
+    async def compact(self, messages: list, model: str) -> tuple[list, str]:
+        """
+        Remplace les anciens tours par un résumé (ou par leurs seules
+        questions / réponses) et garde les derniers tours tels quels.
+        Retourne les messages et le mode appliqué.
+        """
+        leading, turns = split_turns(messages)
+        old, kept = turns[:-self.keep_turns], turns[-self.keep_turns:]
+        # Les tours conservés doivent eux-mêmes tenir dans la moitié du budget
+        while len(kept) > 1 and message_tokens([m for turn in kept for m in turn]) > self.token_budget // 2:
+            old.append(kept.pop(0))
+        if not old:
+            return messages, "none"
+        recent = [m for turn in kept for m in turn]
+
+        if self.compaction == "summary":
+            previous = "\n".join(extract_content(m) for m in leading)
+            conversation = "\n\n".join(filter(None, [previous] + [turn_text(turn) for turn in old]))
+            try:
+                response = await get_model(model).ainvoke(
+                    SUMMARY_PROMPT.format(conversation=truncate_to_tokens(conversation, self.token_budget))
+                )
+                summary = extract_content(response).rsplit("</think>", 1)[-1].strip()
+                if summary:
+                    return [SystemMessage(content=SUMMARY_PREFIX + summary)] + recent, "summary"
+            except Exception as e:
+                print(f"Échec du résumé de la session : {e}")
+
+        # Questions et réponses finales uniquement, les plus anciennes retirées
+        # au besoin (moitié du budget : marge pour les tours suivants)
+        pairs = [[turn[0], AIMessage(content=get_final_answer({"messages": turn}))] for turn in old]
+        while pairs and message_tokens(leading + [m for pair in pairs for m in pair] + recent) > self.token_budget // 2:
+            pairs.pop(0)
+        return leading + [m for pair in pairs for m in pair] + recent, "trim"
+
+    # --------------------------------------------------------
+    # Statistiques et arrêt
+    # --------------------------------------------------------
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self.sessions),
+            "token_budget": self.token_budget,
+            "compaction": self.compaction,
+            "turns": sum(s.turns for s in self.sessions.values()),
+            "compactions": sum(s.compactions for s in self.sessions.values()),
+            "evictions": self.evictions,
+        }
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        for session_id in list(self.sessions):
+            await self.delete(session_id)
@@ -1,5 +1,13 @@
 from main_multi import MultiToolAgent, MCP_SERVER_CONFIGS
+from model_router import ModelRouter, ROUTER_MODEL_NAME
+from tool_selector import TOOL_SELECTION_ENABLED
+from langchain_core.messages import AIMessage
+import argparse
 import asyncio
+import json
+import os
+import sys
+import time
 
 EVALUATIONS = [
     {
@@ -21,119 +29,429 @@ EVALUATIONS = [
 ]
 
 TEST_CONFIG = {
-    "models": ["llama3.2", "mistral", "qwen3"],
-    "iterations": 3
+    # ROUTER_MODEL_NAME ("auto") routes each question to the fast or strong model,
+    # to compare its accuracy and latency with the single models
+    "models": ["llama3.2", "mistral", "qwen3", ROUTER_MODEL_NAME],
+    "iterations": 3,
+    # Number of question/iteration runs executed at the same time per model
+    "concurrency": 1,
+    # JSONL file receiving one record per run (used to resume interrupted runs)
+    "output": "results.jsonl",
+    "resume": True,
+    # Bind only the top-k relevant tools per request (compare runs with it on and off)
+    "tool_selection": TOOL_SELECTION_ENABLED,
+    # Ask each iteration's questions as one conversation (first turn vs follow-ups)
+    "session": False
 }
 
+# Metrics compared by `compare_results` (higher is worse)
+LATENCY_METRICS = ["seconds_to_complete", "agent_seconds", "interpretation_seconds"]
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Nearest-rank percentile of a list of values.
+
+    Args:
+        values: The values to summarize
+        q: The percentile, between 0 and 100
+
+    Returns:
+        float: The percentile value (0.0 for an empty list)
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def run_stats(raw) -> dict:
+    """
+    Count tool calls and LLM tokens in the agent's LangGraph state.
+
+    Args:
+        raw: The raw agent response (LangGraph state)
+
+    Returns:
+        dict: tool_calls, input_tokens and output_tokens for the agent loop
+    """
+    messages = raw.get("messages", []) if isinstance(raw, dict) else []
+    ai_messages = [m for m in messages if isinstance(m, AIMessage)]
+    usage = [m.usage_metadata or {} for m in ai_messages]
+    return {
+        "tool_calls": sum(len(m.tool_calls) for m in ai_messages),
+        "input_tokens": sum(u.get("input_tokens", 0) for u in usage),
+        "output_tokens": sum(u.get("output_tokens", 0) for u in usage),
+    }
+
+
+def load_records(path: str) -> list[dict]:
+    """
+    Read the run records of a JSONL results file (ignoring truncated lines).
+    """
+    if not path or not os.path.exists(path):
+        return []
+    records = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+async def run_evaluation(agent: MultiToolAgent, evaluation: dict, iteration: int,
+                         session_id: str | None = None) -> dict:
+    """
+    Run one question once and build its result record.
+    With `session_id`, the question continues that conversation.
+    """
+    question = evaluation["question"]
+    expected_answer = evaluation["expected_answer"]
+    record = {
+        "model": agent.model,
+        "question": question,
+        "iteration": iteration,
+        "expected_answer": expected_answer,
+        "started_at": time.time(),
+    }
+    try:
+        result = await agent.run_request(question, with_logging=False, session_id=session_id)
+        answer = str(result.get("answer", "")).strip()
+        stats = run_stats(result.get("raw"))
+        agent_seconds = result.get("agent_seconds", 0.0)
+        record.update({
+            "answer": answer,
+            # Check if the answer is correct (case-insensitive partial match)
+            "correct": expected_answer.lower() in answer.lower(),
+            "seconds_to_complete": result.get("seconds_to_complete", 0.0),
+            "agent_seconds": agent_seconds,
+            "interpretation_seconds": result.get("interpretation_seconds", 0.0),
+            "interpretation_mode": result.get("interpretation_mode"),
+            "cache": result.get("cache"),
+            "path": result.get("path"),
+            "direct_fallback": result.get("direct_fallback"),
+            "tools_bound": result.get("tools_bound"),
+            "route": result.get("route"),
+            "routed_model": result.get("routed_model"),
+            "fallback": result.get("fallback"),
+            "turn_kind": ("first" if result["session"]["turn"] == 1 else "follow_up") if result.get("session") else None,
+            **stats,
+            "tokens_per_second": round(stats["output_tokens"] / agent_seconds, 2) if agent_seconds else 0.0,
+            "error": None,
+        })
+    except Exception as e:
+        record.update({"correct": False, "error": str(e)})
+    return record
+
+
+def summarize(records: list[dict], evaluations: list[dict] | None = None) -> list[dict]:
+    """
+    Aggregate run records into per-model metrics.
+
+    Args:
+        records: Run records (as written to the JSONL file)
+        evaluations: Optional list restricting which questions are included
+
+    Returns:
+        list: One summary dict per model
+    """
+    questions = {e["question"] for e in evaluations} if evaluations else None
+    by_model = {}
+    for record in records:
+        if questions is None or record["question"] in questions:
+            by_model.setdefault(record["model"], []).append(record)
+
+    results = []
+    for model, model_records in by_model.items():
+        ok = [r for r in model_records if not r.get("error")]
+
+        success_rates = {}
+        for question in dict.fromkeys(r["question"] for r in model_records):
+            attempts = [r for r in ok if r["question"] == question]
+            correct = sum(r["correct"] for r in attempts)
+            success_rates[question] = round(correct / len(attempts) * 100, 2) if attempts else 0
+
+        overall_success_rate = sum(success_rates.values()) / len(success_rates) if success_rates else 0
+        summary = {
+            "model": model,
+            "iterations_ran": len(ok),
+            "errors": len(model_records) - len(ok),
+            "avg_seconds_to_complete": round(sum(r["seconds_to_complete"] for r in ok) / len(ok), 2) if ok else 0,
+            "overall_success_rate": round(overall_success_rate, 2),
+            "success_rates": success_rates,
+            "avg_tool_calls": round(sum(r["tool_calls"] for r in ok) / len(ok), 2) if ok else 0,
+            # Prompt size: input tokens of the agent loop and tools bound to it
+            "avg_input_tokens": round(sum(r["input_tokens"] for r in ok) / len(ok), 2) if ok else 0,
+            "avg_tools_bound": round(sum(r.get("tools_bound") or 0 for r in ok) / len(ok), 2) if ok else 0,
+            "avg_tokens_per_second": round(sum(r["tokens_per_second"] for r in ok) / len(ok), 2) if ok else 0,
+        }
+        for metric in LATENCY_METRICS:
+            values = [r[metric] for r in ok]
+            for q in (50, 90, 99):
+                summary[f"{metric}_p{q}"] = round(percentile(values, q), 2)
+        if any(r.get("path") for r in ok):
+            summary["paths"] = group_stats([r for r in ok if r.get("path")], "path")
+        if any(r.get("turn_kind") for r in ok):
+            summary["turns"] = group_stats([r for r in ok if r.get("turn_kind")], "turn_kind")
+        routed = [r for r in ok if r.get("route")]
+        if routed:
+            summary["routing"] = summarize_routing(routed)
+        results.append(summary)
+    return results
+
+
+def group_stats(records: list[dict], key: str) -> dict:
+    """
+    Share, latency and accuracy of runs grouped by a record field.
+
+    Args:
+        records: Successful run records
+        key: The field to group by (e.g. "path" or "route")
+
+    Returns:
+        dict: Stats per value of the field
+    """
+    groups = {}
+    for value in sorted({r[key] for r in records}):
+        group = [r for r in records if r[key] == value]
+        groups[value] = {
+            "share": round(len(group) / len(records) * 100, 2),
+            "seconds_to_complete_p50": round(percentile([r["seconds_to_complete"] for r in group], 50), 2),
+            "avg_input_tokens": round(sum(r["input_tokens"] for r in group) / len(group), 2),
+            "success_rate": round(sum(r["correct"] for r in group) / len(group) * 100, 2),
+        }
+    return groups
+
+
+def summarize_routing(records: list[dict]) -> dict:
+    """
+    Share, latency and accuracy of each route for routed runs.
+
+    Args:
+        records: Successful run records of the routed model
+
+    Returns:
+        dict: Per-route stats, models used and the fallback rate
+    """
+    routes = group_stats(records, "route")
+    models = {}
+    for record in records:
+        models[record["routed_model"]] = models.get(record["routed_model"], 0) + 1
+    return {
+        "routes": routes,
+        "models": models,
+        "fallback_rate": round(sum(1 for r in records if r.get("fallback")) / len(records) * 100, 2),
+    }
+
+
 async def calculate_averages(config: dict, evaluations: list[dict]) -> dict:
     """
     Calculate performance metrics for model evaluations.
-    
+
+    Runs every question `iterations` times per model, `concurrency` runs at a
+    time. Each run is appended to the `output` JSONL file as soon as it
+    completes; with `resume`, runs already recorded without error are skipped.
+
     Args:
-        config: Configuration containing 'models' and 'iterations'
+        config: Configuration containing 'models' and 'iterations', and optionally
+            'concurrency', 'output' and 'resume'
         evaluations: List of evaluation dictionaries with 'question' and 'expected_answer'
-        
+
     Returns:
         dict: Results with metrics for each model
     """
-    
+
     print("\nRunning evaluations...")
-    
-    results = []
-    
+
+    output = config.get("output")
+    concurrency = max(1, config.get("concurrency", 1))
+    previous = load_records(output) if config.get("resume") else []
+    if output and not config.get("resume") and os.path.exists(output):
+        os.remove(output)
+    done = {(r["model"], r["question"], r["iteration"]) for r in previous if not r.get("error")}
+    records = [r for r in previous if not r.get("error")]
+
     for model in config["models"]:
 
-        print(f"\nTesting model: {model}...")
+        pending = [
+            (evaluation, i)
+            for evaluation in evaluations
+            for i in range(config["iterations"])
+            if (model, evaluation["question"], i) not in done
+        ]
+        print(f"\nTesting model: {model} ({len(pending)} runs, concurrency {concurrency})...")
+        if not pending:
+            continue
 
         # Initialize the agent
-        agent = MultiToolAgent(model, MCP_SERVER_CONFIGS)
+        agent = MultiToolAgent(
+            model, MCP_SERVER_CONFIGS,
+            router=ModelRouter() if model == ROUTER_MODEL_NAME else None,
+            tool_selection=config.get("tool_selection", TOOL_SELECTION_ENABLED)
+        )
         await agent.initialize()
 
-        model_results = {
-            "model": model,
-            "iterations_ran": 0,
-            "total_seconds": 0.0,
-            "success_rates": {
-                # question: success_rate
-            },
-            "total_runs": 0
-        }
-        
-        for evaluation in evaluations:
-            question = evaluation["question"]
-            expected_answer = evaluation["expected_answer"]
-            correct_answers = 0
-            total_attempts = 0
-            
-            print(f"\nRunning evaluation for {model} on question: {question}")
-            print(f"Expected answer: {expected_answer}")
-            
-            # Run the evaluation for the specified number of iterations
-            for i in range(config["iterations"]):
-                try:
-                    # Run the agent
-                    result = await agent.run_request(question, with_logging=False)
-                    
-                    # Get the agent's answer and time taken
-                    answer = str(result.get("answer", "")).strip()
-                    time_taken = result.get("seconds_to_complete", 0)
-                    
-                    # Update metrics
-                    model_results["iterations_ran"] += 1
-                    model_results["total_seconds"] += time_taken
-                    total_attempts += 1
-                    
-                    # Check if the answer is correct (case-insensitive partial match)
-                    is_correct = expected_answer.lower() in answer.lower()
-                    if is_correct:
-                        correct_answers += 1
-                    
-                    print(f"  Attempt {i+1}: {answer} (Time: {time_taken:.2f}s) - " + 
-                         ("✓" if is_correct else "✗"))
-                    
-                except Exception as e:
-                    print(f"  Error in attempt {i+1}: {str(e)}")
-            
-            # Calculate success rate for this question
-            question_success_rate = (correct_answers / total_attempts * 100) if total_attempts > 0 else 0
-            model_results["success_rates"][question] = round(question_success_rate, 2)
-            
-            print(f"  Success rate for this question: {question_success_rate:.1f}%")
-        
-        # Calculate average time per question
-        avg_seconds = (model_results["total_seconds"] / model_results["iterations_ran"]) if model_results["iterations_ran"] > 0 else 0
-        
-        # Calculate overall success rate
-        if model_results["success_rates"]:
-            overall_success_rate = sum(model_results["success_rates"].values()) / len(model_results["success_rates"])
-        else:
-            overall_success_rate = 0
-        
-        results.append({
-            "model": model,
-            "iterations_ran": model_results["iterations_ran"],
-            "avg_seconds_to_complete": round(avg_seconds, 2),
-            "overall_success_rate": round(overall_success_rate, 2),
-            "success_rates": model_results["success_rates"]
-        })
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(evaluation: dict, i: int, session_id: str | None = None):
+            async with semaphore:
+                record = await run_evaluation(agent, evaluation, i, session_id)
+            records.append(record)
+            if output:
+                with open(output, "a") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+            if record.get("error"):
+                print(f"  Error in attempt {i+1} of '{record['question']}': {record['error']}")
+            else:
+                routed = f", {record['route']} -> {record['routed_model']}" if record.get("route") else ""
+                print(f"  {record['question']} #{i+1}: {record['answer']} "
+                      f"(Time: {record['seconds_to_complete']:.2f}s, tools: {record['tool_calls']}{routed}) - " +
+                      ("✓" if record["correct"] else "✗"))
+
+        async def run_conversation(i: int):
+            # Questions of one iteration in order, as follow-ups of the first one
+            for evaluation, iteration in pending:
+                if iteration == i:
+                    await run_one(evaluation, i, session_id=f"{model}-{i}")
+
+        try:
+            if config.get("session"):
+                await asyncio.gather(*[run_conversation(i) for i in sorted({i for _, i in pending})])
+            else:
+                await asyncio.gather(*[run_one(evaluation, i) for evaluation, i in pending])
+        finally:
+            # Shut down the model's MCP sessions before moving on
+            await agent.close()
 
         print(f"\nFinished processing Model: {model}")
-    
-    return results
- 
-async def main():
-    print("\nRunning simple evaluations...")
-    results = await calculate_averages(TEST_CONFIG, EVALUATIONS)
+
+    return summarize(
+        [r for r in records if r["model"] in config["models"]],
+        evaluations
+    )
+
+
+def compare_results(baseline_path: str, candidate_path: str, threshold: float = 0.10) -> dict:
+    """
+    Compare two results files and flag regressions.
+
+    Args:
+        baseline_path: JSONL results of the reference run
+        candidate_path: JSONL results of the run to check
+        threshold: Allowed relative latency increase (0.10 = +10%)
+
+    Returns:
+        dict: Per-model deltas and the list of regressions
+    """
+    baseline = {s["model"]: s for s in summarize(load_records(baseline_path))}
+    candidate = {s["model"]: s for s in summarize(load_records(candidate_path))}
+    report = {"models": {}, "regressions": []}
+    for model in sorted(baseline.keys() & candidate.keys()):
+        base, cand = baseline[model], candidate[model]
+        deltas = {}
+        for key in [f"{m}_p{q}" for m in LATENCY_METRICS for q in (50, 90, 99)]:
+            change = (cand[key] - base[key]) / base[key] if base[key] else 0.0
+            deltas[key] = {"baseline": base[key], "candidate": cand[key], "change": round(change, 3)}
+            if change > threshold and key.startswith("seconds_to_complete"):
+                report["regressions"].append(f"{model}: {key} {base[key]}s -> {cand[key]}s (+{change:.0%})")
+        deltas["avg_input_tokens"] = {
+            "baseline": base["avg_input_tokens"],
+            "candidate": cand["avg_input_tokens"],
+            "change": round((cand["avg_input_tokens"] - base["avg_input_tokens"]) / base["avg_input_tokens"], 3)
+            if base["avg_input_tokens"] else 0.0
+        }
+        success_change = cand["overall_success_rate"] - base["overall_success_rate"]
+        deltas["overall_success_rate"] = {
+            "baseline": base["overall_success_rate"],
+            "candidate": cand["overall_success_rate"],
+            "change": round(success_change, 2)
+        }
+        if success_change < 0:
+            report["regressions"].append(
+                f"{model}: success rate {base['overall_success_rate']}% -> {cand['overall_success_rate']}%"
+            )
+        report["models"][model] = deltas
+    return report
+
+
+def print_results(results: list[dict]):
     print("\nEvaluation Results:")
     for result in results:
         print(f"Model: {result['model']}")
-        print(f"Iterations Ran: {result['iterations_ran']}")
+        print(f"Iterations Ran: {result['iterations_ran']} (errors: {result['errors']})")
         print(f"Average Seconds to Complete: {result['avg_seconds_to_complete']}")
+        for metric in LATENCY_METRICS:
+            print(f"{metric} p50/p90/p99: {result[f'{metric}_p50']} / "
+                  f"{result[f'{metric}_p90']} / {result[f'{metric}_p99']}")
+        print(f"Average Tool Calls: {result['avg_tool_calls']}")
+        print(f"Average Input Tokens: {result['avg_input_tokens']} (tools bound: {result['avg_tools_bound']})")
+        print(f"Average Tokens per Second: {result['avg_tokens_per_second']}")
         print(f"Overall Success Rate: {result['overall_success_rate']}%")
+        for path, stats in result.get("paths", {}).items():
+            print(f"Path {path}: {stats['share']}% of runs, p50 {stats['seconds_to_complete_p50']}s, "
+                  f"success {stats['success_rate']}%")
+        for kind, stats in result.get("turns", {}).items():
+            print(f"Turn {kind}: {stats['share']}% of runs, p50 {stats['seconds_to_complete_p50']}s, "
+                  f"input tokens {stats['avg_input_tokens']}, success {stats['success_rate']}%")
+        if result.get("routing"):
+            routing = result["routing"]
+            for route, stats in routing["routes"].items():
+                print(f"Route {route}: {stats['share']}% of runs, p50 {stats['seconds_to_complete_p50']}s, "
+                      f"success {stats['success_rate']}%")
+            print(f"Routed Models: {routing['models']} (fallback rate: {routing['fallback_rate']}%)")
         print("Success Rates:")
         for question, success_rate in result['success_rates'].items():
             print(f"  {question}: {success_rate}%")
         print("-" * 50)
 
+
+async def main(args):
+    config = {
+        **TEST_CONFIG,
+        "concurrency": args.concurrency or TEST_CONFIG["concurrency"],
+        "output": args.output or TEST_CONFIG["output"],
+        "resume": not args.fresh,
+    }
+    if args.tool_selection:
+        config["tool_selection"] = args.tool_selection == "on"
+    if args.session:
+        config["session"] = args.session == "on"
+    if args.models:
+        config["models"] = args.models.split(",")
+    print("\nRunning simple evaluations...")
+    results = await calculate_averages(config, EVALUATIONS)
+    print_results(results)
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Benchmark models on the evaluation questions")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="Run the evaluations (default)")
+    compare_parser = subparsers.add_parser("compare", help="Compare two results files")
+    compare_parser.add_argument("baseline", help="JSONL results of the reference run")
+    compare_parser.add_argument("candidate", help="JSONL results of the run to check")
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="Allowed relative latency increase (default: 0.10)")
+
+    for p in (parser, run_parser):
+        p.add_argument("--models", help="Comma-separated models (default: TEST_CONFIG)")
+        p.add_argument("--concurrency", type=int, help="Concurrent runs per model")
+        p.add_argument("--output", help="JSONL results file")
+        p.add_argument("--fresh", action="store_true", help="Ignore and overwrite previous results")
+        p.add_argument("--tool-selection", choices=["on", "off"],
+                       help="Bind only the top-k relevant tools per request (default: TOOL_SELECTION_ENABLED)")
+        p.add_argument("--session", choices=["on", "off"],
+                       help="Ask each iteration's questions as one conversation (default: off)")
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        report = compare_results(args.baseline, args.candidate, args.threshold)
+        print(json.dumps(report, indent=2))
+        # Non-zero exit code so deploys can be gated on regressions
+        sys.exit(1 if report["regressions"] else 0)
+    else:
+        asyncio.run(main(args))
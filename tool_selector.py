@@ -0,0 +1,167 @@
+# ------------------------------------------------------------
+# Sélection des outils par requête (réduction du prompt ReAct)
+# ------------------------------------------------------------
+#
+# Chaque outil lié à l'agent ajoute son schéma JSON et sa description au
+# prompt de chaque tour LLM : avec les trois serveurs MCP, cela ralentit
+# l'évaluation du prompt sur Ollama et perd les petits modèles.
+# Le sélecteur retient, pour chaque requête, les k outils les plus
+# pertinents :
+#   - par mots-clés (recouvrement pondéré par IDF entre la question et le
+#     nom / la description de l'outil), par défaut ;
+#   - ou par similarité d'embeddings Ollama locaux, calculés une seule fois
+#     par outil (TOOL_SELECTION_EMBEDDING_MODEL).
+# Les outils de TOOL_SELECTION_ALWAYS sont toujours ajoutés. L'agent
+# ReAct est ensuite construit (et mis en cache) par sous-ensemble d'outils.
+
+# Détection des demandes et des outils d'écriture
+from answer_cache import looks_like_write_request, is_write_tool_call, cosine_similarity
+
+# Librairies standards
+import math
+import os
+import re
+
+# Chargement des variables d’environnement (.env)
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# ------------------------------------------------------------
+# Configuration
+# ------------------------------------------------------------
+
+TOOL_SELECTION_ENABLED = os.getenv("TOOL_SELECTION_ENABLED", "false").lower() == "true"
+
+# Nombre d'outils retenus par requête (hors outils toujours présents)
+TOOL_SELECTION_TOP_K = int(os.getenv("TOOL_SELECTION_TOP_K", "3"))
+
+# Outils toujours liés à l'agent
+TOOL_SELECTION_ALWAYS = [t.strip() for t in os.getenv("TOOL_SELECTION_ALWAYS", "read_neo4j_cypher").split(",") if t.strip()]
+
+# Modèle d'embeddings Ollama (vide : sélection par mots-clés)
+TOOL_SELECTION_EMBEDDING_MODEL = os.getenv("TOOL_SELECTION_EMBEDDING_MODEL", "")
+
+# Mots ignorés dans le calcul du recouvrement
+_STOP_WORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "of", "in", "on", "at", "to", "for",
+    "from", "by", "with", "and", "or", "what", "which", "who", "how", "many", "much", "do",
+    "does", "did", "there", "this", "that", "these", "those", "it", "its", "me", "my", "i",
+    "you", "your", "all", "any", "can", "please", "give", "show", "list", "tell", "about",
+}
+
+
+def tokenize(text: str) -> set[str]:
+    """
+    Mots significatifs d'un texte (noms d'outils en snake_case découpés,
+    pluriels simples ramenés au singulier).
+    """
+    words = re.findall(r"[a-z0-9]+", text.lower().replace("_", " "))
+    return {w[:-1] if len(w) > 3 and w.endswith("s") else w for w in words if w not in _STOP_WORDS}
+
+
+def tool_text(tool) -> str:
+    return f"{tool.name} {tool.description or ''}"
+
+
+class ToolSelector:
+    """
+    Choisit les outils les plus pertinents pour une requête.
+    `select` retourne un tuple de noms d'outils, dans l'ordre d'origine,
+    utilisable comme clé de cache des agents.
+    """
+
+    def __init__(self, tools: list, top_k: int = TOOL_SELECTION_TOP_K,
+                 always: list[str] | None = None, embeddings=None):
+        self.tools = list(tools)
+        self.top_k = max(1, top_k)
+        names = {tool.name for tool in self.tools}
+        self.always = [name for name in (TOOL_SELECTION_ALWAYS if always is None else always) if name in names]
+        self.embeddings = embeddings
+        self._tool_embeddings = None
+        # Vocabulaire des outils, pondéré par IDF (les mots rares discriminent)
+        self._name_tokens = {tool.name: tokenize(tool.name) for tool in self.tools}
+        self._tokens = {tool.name: tokenize(tool_text(tool)) for tool in self.tools}
+        document_frequency = {}
+        for tokens in self._tokens.values():
+            for token in tokens:
+                document_frequency[token] = document_frequency.get(token, 0) + 1
+        self._idf = {
+            token: math.log(1 + len(self.tools) / count)
+            for token, count in document_frequency.items()
+        }
+        self.selections = 0
+        self.tools_selected = 0
+
+    def keyword_scores(self, request: str) -> dict:
+        """
+        Score de chaque outil : somme des IDF des mots communs (double poids
+        pour les mots du nom), bonus aux outils d'écriture pour les demandes
+        de modification.
+        """
+        words = tokenize(request)
+        wants_write = looks_like_write_request(request)
+        scores = {}
+        for tool in self.tools:
+            common = words & self._tokens[tool.name]
+            score = sum(self._idf[w] * (2 if w in self._name_tokens[tool.name] else 1) for w in common)
+            if wants_write and is_write_tool_call(tool.name):
+                # Les outils d'écriture génériques (write_neo4j_cypher) couvrent toute modification
+                score += 2.0 if tool.name.startswith("write_") else 1.0
+            scores[tool.name] = score
+        return scores
+
+    async def embedding_scores(self, request: str) -> dict | None:
+        """
+        Similarité cosinus entre la question et chaque description d'outil
+        (embeddings des outils calculés une seule fois). None si indisponible.
+        """
+        if self.embeddings is None:
+            return None
+        try:
+            if self._tool_embeddings is None:
+                vectors = await self.embeddings.aembed_documents([tool_text(t) for t in self.tools])
+                self._tool_embeddings = dict(zip((t.name for t in self.tools), vectors))
+            query = await self.embeddings.aembed_query(request)
+        except Exception as e:
+            print(f"Embeddings indisponibles pour la sélection d'outils : {e}")
+            return None
+        return {name: cosine_similarity(query, vector) for name, vector in self._tool_embeddings.items()}
+
+    async def select(self, request: str) -> tuple[str, ...]:
+        """
+        Noms des outils retenus pour la requête (tous si top_k couvre l'ensemble).
+        """
+        if self.top_k + len(self.always) >= len(self.tools):
+            return tuple(tool.name for tool in self.tools)
+        scores = await self.embedding_scores(request) or self.keyword_scores(request)
+        ranked = sorted(
+            (name for name in scores if name not in self.always),
+            key=lambda name: scores[name],
+            reverse=True
+        )
+        selected = set(self.always) | set(ranked[:self.top_k])
+        self.selections += 1
+        self.tools_selected += len(selected)
+        return tuple(tool.name for tool in self.tools if tool.name in selected)
+
+    def subset(self, names: tuple[str, ...]) -> list:
+        return [tool for tool in self.tools if tool.name in names]
+
+    def stats(self) -> dict:
+        return {
+            "tools": len(self.tools),
+            "top_k": self.top_k,
+            "selections": self.selections,
+            "avg_tools_selected": round(self.tools_selected / self.selections, 2) if self.selections else len(self.tools),
+        }
+
+
+def tool_selector_embeddings():
+    """
+    Embeddings Ollama pour la sélection d'outils (None : mots-clés).
+    """
+    if not TOOL_SELECTION_EMBEDDING_MODEL:
+        return None
+    from langchain_ollama import OllamaEmbeddings
+    return OllamaEmbeddings(model=TOOL_SELECTION_EMBEDDING_MODEL)
@@ -0,0 +1,304 @@
+# ------------------------------------------------------------
+# Traces par requête (spans façon OpenTelemetry)
+# ------------------------------------------------------------
+#
+# Une trace par requête, découpée en spans :
+#   request
+#   ├── tool_loading / schema_context   (si l'agent est initialisé à froid)
+#   ├── agent
+#   │   ├── llm        (prompt_eval_count, eval_count, load_duration...)
+#   │   ├── tool       (nom de l'outil, serveur MCP)
+#   │   └── llm
+#   └── interpretation
+#       └── llm
+# Les spans sont renvoyés dans le résultat de `run_request` et
+# exportables au format OTLP/JSON (fichier ou collecteur HTTP).
+
+# Callbacks LangChain (début/fin des appels LLM et outils)
+from langchain_core.callbacks import AsyncCallbackHandler
+
+# Librairies standards
+from contextlib import contextmanager
+import asyncio
+import json
+import os
+import secrets
+import time
+
+# Chargement des variables d’environnement (.env)
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# ------------------------------------------------------------
+# Configuration
+# ------------------------------------------------------------
+
+# Export OTLP/JSON : fichier JSONL (une trace par ligne) et/ou collecteur
+# OpenTelemetry (ex : http://localhost:4318/v1/traces)
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "mcp-neo4j-agent")
+
+# Métadonnées Ollama recopiées sur les spans LLM (durées en nanosecondes)
+OLLAMA_METADATA_KEYS = (
+    "prompt_eval_count", "eval_count", "load_duration",
+    "prompt_eval_duration", "eval_duration", "total_duration"
+)
+
+# Taille maximale des entrées/sorties recopiées en attributs
+MAX_ATTRIBUTE_CHARS = 500
+
+
+def _truncate(value) -> str:
+    text = value if isinstance(value, str) else str(value)
+    return text if len(text) <= MAX_ATTRIBUTE_CHARS else text[:MAX_ATTRIBUTE_CHARS] + "..."
+
+
+class Span:
+    """
+    Étape chronométrée d'une requête.
+    """
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None = None,
+                 kind: str = "internal", attributes: dict | None = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.end = None
+        self.error = None
+
+    @property
+    def seconds(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def finish(self, error: BaseException | str | None = None):
+        if self.end is None:
+            self.end = time.time()
+        if error is not None:
+            self.error = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "kind": self.kind,
+            "start": self.start,
+            "seconds": round(self.seconds, 4),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": _truncate(value)}
+
+
+class Trace:
+    """
+    Ensemble des spans d'une requête. `span()` ouvre un span manuel
+    (parent des appels LLM/outils enregistrés pendant qu'il est actif).
+    """
+
+    def __init__(self, name: str = "request", attributes: dict | None = None):
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+        self._active = []
+        self.root = self.start_span(name, attributes=attributes, kind="server")
+        self._active.append(self.root)
+
+    @property
+    def current(self) -> Span | None:
+        return self._active[-1] if self._active else None
+
+    def start_span(self, name: str, parent: Span | None = None, kind: str = "internal",
+                   attributes: dict | None = None) -> Span:
+        parent = parent or self.current
+        span = Span(name, self.trace_id, parent.span_id if parent else None, kind, attributes)
+        self.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        span = self.start_span(name, attributes=attributes)
+        self._active.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.finish(e)
+            raise
+        finally:
+            self._active.remove(span)
+            span.finish()
+
+    def finish(self, error: BaseException | None = None):
+        self.root.finish(error)
+
+    def to_dicts(self) -> list[dict]:
+        return [span.to_dict() for span in self.spans]
+
+    def breakdown(self) -> dict:
+        """
+        Durée cumulée (secondes) par nom de span.
+        """
+        totals = {}
+        for span in self.spans:
+            totals[span.name] = round(totals.get(span.name, 0.0) + span.seconds, 4)
+        return totals
+
+    def format(self) -> str:
+        """
+        Arbre des spans lisible (remplace l'ancien logging console).
+        """
+        children = {}
+        for span in self.spans:
+            children.setdefault(span.parent_id, []).append(span)
+        lines = []
+
+        def walk(span, depth):
+            detail = ", ".join(f"{k}={_truncate(v)}" for k, v in span.attributes.items() if k != "input")
+            status = f" ERROR {span.error}" if span.error else ""
+            lines.append(f"{'  ' * depth}{span.name} {span.seconds:.3f}s" + (f" [{detail}]" if detail else "") + status)
+            for child in children.get(span.span_id, []):
+                walk(child, depth + 1)
+
+        walk(self.root, 0)
+        return "\n".join(lines)
+
+    def to_otlp(self, service_name: str = TRACE_SERVICE_NAME) -> dict:
+        """
+        Trace au format OTLP/JSON (ExportTraceServiceRequest).
+        """
+        kinds = {"internal": 1, "server": 2, "client": 3}
+        spans = []
+        for span in self.spans:
+            otlp_span = {
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": kinds.get(span.kind, 1),
+                "startTimeUnixNano": str(int(span.start * 1e9)),
+                "endTimeUnixNano": str(int((span.end or time.time()) * 1e9)),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent_id:
+                otlp_span["parentSpanId"] = span.parent_id
+            spans.append(otlp_span)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+                "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+            }]
+        }
+
+
+# ------------------------------------------------------------
+# Callback LangChain : spans LLM et outils
+# ------------------------------------------------------------
+
+class TracingCallbackHandler(AsyncCallbackHandler):
+    """
+    Enregistre un span par appel LLM et par appel d'outil MCP dans la trace.
+    Les runs LangChain intermédiaires (chaînes, nœuds du graphe) ne sont pas
+    tracés : leurs enfants sont rattachés au span manuel actif.
+    """
+
+    def __init__(self, trace: Trace):
+        self.trace = trace
+        self._runs = {}
+
+    def _start(self, run_id, parent_run_id, name: str, kind: str, attributes: dict):
+        parent = self._runs.get(parent_run_id) if parent_run_id else None
+        self._runs[run_id] = self.trace.start_span(name, parent=parent, kind=kind, attributes=attributes)
+
+    def _finish(self, run_id, error=None) -> Span | None:
+        span = self._runs.pop(run_id, None)
+        if span is not None:
+            span.finish(error)
+        return span
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None,
+                                  metadata=None, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        self._start(run_id, parent_run_id, "llm", "client", {
+            "model": params.get("model") or (metadata or {}).get("ls_model_name", ""),
+            "messages": sum(len(batch) for batch in messages),
+        })
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self._finish(run_id)
+        if span is None:
+            return
+        generations = [g for batch in response.generations for g in batch]
+        message = getattr(generations[0], "message", None) if generations else None
+        if message is None:
+            return
+        metadata = message.response_metadata or {}
+        for key in OLLAMA_METADATA_KEYS:
+            if metadata.get(key) is not None:
+                span.attributes[key] = metadata[key]
+        usage = getattr(message, "usage_metadata", None) or {}
+        span.attributes["input_tokens"] = usage.get("input_tokens", metadata.get("prompt_eval_count", 0))
+        span.attributes["output_tokens"] = usage.get("output_tokens", metadata.get("eval_count", 0))
+        span.attributes["tool_calls"] = len(getattr(message, "tool_calls", None) or [])
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, error)
+
+    async def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None,
+                            metadata=None, inputs=None, **kwargs):
+        self._start(run_id, parent_run_id, "tool", "client", {
+            "tool": (serialized or {}).get("name") or kwargs.get("name", ""),
+            "mcp_server": (metadata or {}).get("mcp_server") or "",
+            "input": _truncate(inputs if inputs is not None else input_str),
+        })
+
+    async def on_tool_end(self, output, *, run_id, **kwargs):
+        span = self._finish(run_id)
+        if span is not None:
+            span.attributes["output_chars"] = len(str(getattr(output, "content", output)))
+
+    async def on_tool_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, error)
+
+
+# ------------------------------------------------------------
+# Export OTLP/JSON
+# ------------------------------------------------------------
+
+def _post_otlp(payload: dict):
+    import httpx
+    try:
+        httpx.post(TRACE_OTLP_ENDPOINT, json=payload, timeout=5.0).raise_for_status()
+    except Exception as e:
+        print(f"Échec de l'export de la trace : {e}")
+
+
+def export_trace(trace: Trace):
+    """
+    Exporte la trace selon TRACE_EXPORT_PATH / TRACE_OTLP_ENDPOINT (sinon rien).
+    """
+    if not TRACE_EXPORT_PATH and not TRACE_OTLP_ENDPOINT:
+        return
+    payload = trace.to_otlp()
+    if TRACE_EXPORT_PATH:
+        with open(TRACE_EXPORT_PATH, "a") as f:
+            f.write(json.dumps(payload) + "\n")
+    if TRACE_OTLP_ENDPOINT:
+        # Envoi dans un thread, sans attente : le collecteur ne ralentit pas la requête
+        try:
+            asyncio.get_running_loop().run_in_executor(None, _post_otlp, payload)
+        except RuntimeError:
+            _post_otlp(payload)